@@ -1,5 +1,5 @@
 __version__ = '3.2.0'
 
 from .rest import REST, TimeFrame, TimeFrameUnit  # noqa
-from .rest_async import AsyncRest  # noqa
+from .rest_async import AsyncRest, AsyncTradingRest  # noqa
 from .stream import Stream  # noqa
@@ -12,14 +12,79 @@ def run(args):
         code.interact(local=locals())
 
 
+def export(rest_args, args):
+    from .export import DataExporter
+    exporter = DataExporter(REST(**rest_args), args.out, fmt=args.format,
+                            row_group_size=args.row_group_size,
+                            compression=args.compression)
+    written = exporter.export(args.kind, args.symbols, args.start, args.end,
+                              timeframe=args.timeframe,
+                              adjustment=args.adjustment, feed=args.feed)
+    for symbol, rows in written.items():
+        print('{} {}: {} rows'.format(args.kind, symbol, rows))
+
+
+def standin(args):
+    import logging
+    from .standin import StandInServer
+    logging.basicConfig(level=logging.INFO)
+    kwargs = {k: getattr(args, k) for k in ('host', 'port', 'items',
+                                            'message_rate', 'batch_size',
+                                            'max_messages',
+                                            'trade_update_rate', 'latency')}
+    if args.symbols:
+        kwargs['symbols'] = args.symbols
+    StandInServer(**kwargs).run()
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--key-id', help='APCA_API_KEY_ID')
     parser.add_argument('--secret-key', help='APCA_API_SECRET_KEY')
     parser.add_argument('--base-url')
+    commands = parser.add_subparsers(dest='command')
+    exporting = commands.add_parser(
+        'export', help='stream historical data to parquet or arrow files '
+                       'partitioned by symbol and date')
+    exporting.add_argument('kind', choices=['trades', 'quotes', 'bars'])
+    exporting.add_argument('symbols', nargs='+')
+    exporting.add_argument('--start', required=True)
+    exporting.add_argument('--end', required=True)
+    exporting.add_argument('--out', required=True, help='output directory')
+    exporting.add_argument('--timeframe', help='bars only, e.g. 1Min')
+    exporting.add_argument('--adjustment', default='raw')
+    exporting.add_argument('--feed')
+    exporting.add_argument('--format', choices=['parquet', 'arrow'],
+                           default='parquet')
+    exporting.add_argument('--row-group-size', type=int, default=50000)
+    exporting.add_argument('--compression', default='snappy')
+    serving = commands.add_parser(
+        'standin', help='serve synthetic data and streams locally, for '
+                        'benchmarks')
+    serving.add_argument('--host', default='127.0.0.1')
+    serving.add_argument('--port', type=int, default=8765)
+    serving.add_argument('--symbols', nargs='+')
+    serving.add_argument('--items', type=int, default=100000,
+                         help='max items per symbol and request')
+    serving.add_argument('--message-rate', type=float, default=0,
+                         help='data stream messages per second, 0 for '
+                              'unpaced')
+    serving.add_argument('--batch-size', type=int, default=100)
+    serving.add_argument('--max-messages', type=int)
+    serving.add_argument('--trade-update-rate', type=float, default=0)
+    serving.add_argument('--latency', type=float, default=0.0,
+                         help='seconds added to every rest response')
     args = parser.parse_args()
 
-    run({k: v for k, v in vars(args).items() if v is not None})
+    rest_args = {k: getattr(args, k) for k in ('key_id', 'secret_key',
+                                               'base_url')
+                 if getattr(args, k) is not None}
+    if args.command == 'export':
+        export(rest_args, args)
+    elif args.command == 'standin':
+        standin(args)
+    else:
+        run(rest_args)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,301 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .columnar import timestamps_to_ns
+from .entity import NY
+
+Range = Tuple[int, int]  # inclusive [start, end] in epoch nanoseconds
+Fetcher = Callable[[str, str, str], List[dict]]
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    kind TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    adjustment TEXT NOT NULL,
+    feed TEXT NOT NULL,
+    t INTEGER NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_key
+    ON items (kind, symbol, timeframe, adjustment, feed, t);
+CREATE TABLE IF NOT EXISTS ranges (
+    kind TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    adjustment TEXT NOT NULL,
+    feed TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ranges_key
+    ON ranges (kind, symbol, timeframe, adjustment, feed);
+'''
+
+
+# seconds a response stays fresh, by path prefix of the trading api. the
+# clock only changes state twice a day but its timestamp ticks, so it is
+# kept briefly; the others change on a scale of hours or on user action.
+DEFAULT_TTLS = {
+    '/assets': 3600.0,
+    '/calendar': 3600.0,
+    '/clock': 15.0,
+    '/account/configurations': 300.0,
+    '/watchlists': 300.0,
+}
+DEFAULT_MAXSIZE = 256
+
+
+def get_cache_path() -> str:
+    base = os.environ.get('APCA_CACHE_DIR') or os.path.join(
+        os.path.expanduser('~'), '.cache', 'alpaca_trade_api')
+    return os.path.join(base, 'history.sqlite')
+
+
+class HistoricalCache(object):
+    """
+    SQLite backed store of historical bars, trades and quotes.
+
+    items are keyed by kind (bars/trades/quotes), symbol, timeframe,
+    adjustment and feed. the cache also remembers which time ranges were
+    fetched, so a request only goes to the server for the parts of its
+    range that were never fetched before. data of the current session
+    (since midnight New York time) is still forming: it is always fetched
+    and never stored.
+    """
+
+    def __init__(self, path: str = None):
+        """
+        :param path: sqlite file. defaults to history.sqlite in
+               APCA_CACHE_DIR or ~/.cache/alpaca_trade_api
+        """
+        self.path = path or get_cache_path()
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                        exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def fetch(self,
+              kind: str,
+              symbol: str,
+              start: str,
+              end: Optional[str],
+              fetcher: Fetcher,
+              timeframe: str = '',
+              adjustment: str = '',
+              feed: str = '',
+              descending: bool = False) -> List[dict]:
+        """
+        items of symbol between start and end (inclusive), in time order.
+        missing ranges are requested with fetcher(symbol, start, end) which
+        must return the raw items of that inclusive range.
+        """
+        key = (kind, symbol, timeframe, adjustment or '', feed or '')
+        start_ns = _to_ns(start)
+        end_ns = _to_ns(end) if end else pd.Timestamp.now(tz='UTC').value
+        cutoff = _session_start_ns()
+        stored_end = min(end_ns, cutoff - 1)
+
+        if start_ns <= stored_end:
+            for lo, hi in self.missing(key, start_ns, stored_end):
+                items = fetcher(symbol, _to_iso(lo), _to_iso(hi))
+                self._store(key, lo, hi, items)
+            result = self._load(key, start_ns, stored_end)
+        else:
+            result = []
+        if end_ns >= cutoff:
+            live_start = start if start_ns >= cutoff else _to_iso(cutoff)
+            result.extend(fetcher(symbol, live_start, end))
+        if descending:
+            result.reverse()
+        return result
+
+    def missing(self, key: tuple, start_ns: int, end_ns: int) -> List[Range]:
+        """parts of [start_ns, end_ns] not covered by a fetched range"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT start, end FROM ranges WHERE kind=? AND symbol=? '
+                'AND timeframe=? AND adjustment=? AND feed=? '
+                'AND end >= ? AND start <= ? ORDER BY start',
+                key + (start_ns, end_ns)).fetchall()
+        gaps = []
+        lower = start_ns
+        for lo, hi in rows:
+            if lo > lower:
+                gaps.append((lower, lo - 1))
+            lower = max(lower, hi + 1)
+            if lower > end_ns:
+                break
+        if lower <= end_ns:
+            gaps.append((lower, end_ns))
+        return gaps
+
+    def invalidate(self, kind: str = None, symbol: str = None):
+        """drop cached items, optionally only those of a kind or symbol"""
+        where, params = [], []
+        if kind is not None:
+            where.append('kind=?')
+            params.append(kind)
+        if symbol is not None:
+            where.append('symbol=?')
+            params.append(symbol)
+        clause = (' WHERE ' + ' AND '.join(where)) if where else ''
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM items' + clause, params)
+            self._conn.execute('DELETE FROM ranges' + clause, params)
+
+    def _store(self, key: tuple, start_ns: int, end_ns: int,
+               items: List[dict]):
+        stamps = timestamps_to_ns([item['t'] for item in items])
+        rows = []
+        for item, t in zip(items, stamps):
+            payload = {k: v for k, v in item.items() if k != 'S'}
+            rows.append(key + (int(t), json.dumps(payload)))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self._merge_range(key, start_ns, end_ns)
+
+    def _merge_range(self, key: tuple, start_ns: int, end_ns: int):
+        where = ('kind=? AND symbol=? AND timeframe=? AND adjustment=? '
+                 'AND feed=? AND end >= ? AND start <= ?')
+        params = key + (start_ns - 1, end_ns + 1)
+        for lo, hi in self._conn.execute(
+                'SELECT start, end FROM ranges WHERE ' + where, params):
+            start_ns = min(start_ns, lo)
+            end_ns = max(end_ns, hi)
+        self._conn.execute('DELETE FROM ranges WHERE ' + where, params)
+        self._conn.execute('INSERT INTO ranges VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           key + (start_ns, end_ns))
+
+    def _load(self, key: tuple, start_ns: int, end_ns: int) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT payload FROM items WHERE kind=? AND symbol=? '
+                'AND timeframe=? AND adjustment=? AND feed=? '
+                'AND t >= ? AND t <= ? ORDER BY t, rowid',
+                key + (start_ns, end_ns)).fetchall()
+        return [json.loads(payload) for payload, in rows]
+
+
+def _to_ns(value) -> int:
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return ts.value
+
+
+def _to_iso(ns: int) -> str:
+    return pd.Timestamp(ns, tz='UTC').isoformat()
+
+
+def _session_start_ns() -> int:
+    return pd.Timestamp.now(tz=NY).normalize().value
+
+
+class ResponseCache(object):
+    """
+    in-memory cache of GET responses of slowly changing endpoints.
+
+    an entry is fresh for the ttl of the longest path prefix it matches,
+    paths without a ttl are never cached. the least recently used entries
+    are evicted past maxsize. any POST/PATCH/PUT/DELETE drops the cached
+    responses of the resource it touches: a change to /watchlists/{id}
+    invalidates every /watchlists entry.
+
+    cached responses are shared between callers and must be treated as
+    read only.
+    """
+
+    def __init__(self,
+                 ttls: Dict[str, float] = None,
+                 maxsize: int = DEFAULT_MAXSIZE):
+        """
+        :param ttls: seconds per path prefix, merged over DEFAULT_TTLS. a
+               ttl of 0 disables caching of that prefix.
+        :param maxsize: max number of cached responses
+        """
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires, resource, value)
+        self._lock = threading.Lock()
+
+    def ttl(self, path: str) -> float:
+        best, ttl = -1, 0.0
+        for prefix, seconds in self.ttls.items():
+            if (path == prefix or path.startswith(prefix + '/') or
+                    path.startswith(prefix + ':')) and len(prefix) > best:
+                best, ttl = len(prefix), seconds
+        return ttl
+
+    def key(self, base_url: str, path: str, params: dict = None) -> tuple:
+        items = tuple(sorted((k, str(v)) for k, v in (params or {}).items()
+                             if v is not None))
+        return base_url, path, items
+
+    def get(self, key: tuple) -> Tuple[bool, Any]:
+        """(True, value) for a fresh entry, (False, None) otherwise"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[2]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: tuple, value: Any, ttl: float):
+        path = key[1]
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, _resource(path),
+                                  value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, path: str = None):
+        """drop the entries of the resource of path, or all of them"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+            resource = _resource(path)
+            for key in [k for k, entry in self._entries.items()
+                        if entry[1] == resource]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _resource(path: str) -> str:
+    """first segment of an api path: /watchlists:by_name -> watchlists"""
+    return re.split('[/:]', path.lstrip('/'), maxsplit=1)[0]
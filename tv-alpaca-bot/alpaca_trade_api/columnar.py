@@ -0,0 +1,195 @@
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+_INITIAL_CAPACITY = 1024
+
+
+class ColumnBuffer(object):
+    """
+    growable numpy array. values are appended a page at a time and the
+    capacity doubles when full, so appends are amortized O(1) and no
+    python object is kept per row for numeric columns.
+    """
+
+    def __init__(self):
+        self._data = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, values: list):
+        arr = _as_array(values)
+        if self._data is None:
+            self._data = np.empty(max(_INITIAL_CAPACITY, len(arr)),
+                                  dtype=arr.dtype)
+        elif self._data.dtype != arr.dtype:
+            dtype = np.result_type(self._data.dtype, arr.dtype)
+            if dtype.kind not in 'biuf':
+                dtype = np.dtype(object)
+            self._data = self._data.astype(dtype)
+            arr = arr.astype(dtype)
+        needed = self._size + len(arr)
+        if needed > len(self._data):
+            capacity = max(needed, 2 * len(self._data))
+            grown = np.empty(capacity, dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size:needed] = arr
+        self._size = needed
+
+    def values(self) -> np.ndarray:
+        if self._data is None:
+            return np.empty(0, dtype=object)
+        return self._data[:self._size]
+
+
+class ColumnarFrameBuilder(object):
+    """
+    builds a DataFrame from pages of raw api items (bars, trades or
+    quotes) without creating an entity per row. every page is split into
+    its fields which are appended to per column buffers; the DataFrame is
+    created once at the end, with the same columns and timestamp index as
+    EntityList.df.
+    """
+
+    def __init__(self, mapping: Dict[str, str]):
+        self._mapping = mapping
+        self._columns = {}  # raw field -> ColumnBuffer, in first seen order
+        self._timestamps = ColumnBuffer()
+        self._rows = 0
+
+    def add_page(self, page: List[dict]):
+        if not page:
+            return
+        # optional fields may appear in any item of the page
+        missing = set().union(*page).difference(self._columns)
+        for item in page:
+            if not missing:
+                break
+            for k in item:
+                if k in missing:
+                    missing.discard(k)
+                    self._columns[k] = ColumnBuffer()
+                    if self._rows:
+                        self._columns[k].append([None] * self._rows)
+        for k, column in self._columns.items():
+            values = [item.get(k) for item in page]
+            if k == 't':
+                self._timestamps.append(timestamps_to_ns(values))
+            else:
+                column.append(values)
+        self._rows += len(page)
+
+    def add_pages(self, pages: Iterable[List[dict]]):
+        for page in pages:
+            self.add_page(page)
+        return self
+
+    def to_df(self) -> pd.DataFrame:
+        data = {}
+        for k, column in self._columns.items():
+            if k != 't':
+                data[self._mapping.get(k, k)] = column.values()
+        if not self._rows:
+            return pd.DataFrame(data)
+        index = pd.DatetimeIndex(
+            self._timestamps.values().view('datetime64[ns]'),
+            name='timestamp').tz_localize('UTC')
+        return pd.DataFrame(data, index=index, copy=False)
+
+
+def timestamps_to_ns(values: List[str]) -> np.ndarray:
+    """RFC3339 timestamp strings to an int64 array of epoch nanoseconds"""
+    if not values:
+        return np.empty(0, dtype='int64')
+    try:
+        index = pd.to_datetime(values, utc=True, format='ISO8601')
+    except (TypeError, ValueError):
+        # pandas < 2 has no ISO8601 format and infers it instead
+        index = pd.to_datetime(values, utc=True)
+    # newer pandas may infer a coarser resolution than nanoseconds
+    return np.asarray(index.tz_convert(None), dtype='datetime64[ns]').view(
+        'int64')
+
+
+# columns compact_frame converts, by their names in EntityList.df
+CATEGORY_COLUMNS = ('symbol', 'exchange', 'ask_exchange', 'bid_exchange',
+                    'tape', 'takerside')
+PRICE_COLUMNS = ('price', 'ask_price', 'bid_price', 'open', 'high', 'low',
+                 'close', 'vwap')
+SIZE_COLUMNS = ('size', 'ask_size', 'bid_size', 'volume', 'trade_count')
+# a float32 price must read back within half the smallest tick
+PRICE_TOLERANCE = 0.00005
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    a copy of a bars, trades or quotes frame with smaller dtypes:
+    categorical symbols and exchanges, float32 prices when every value
+    survives the round trip, int32 sizes when they fit, and conditions as
+    a categorical of comma joined codes ('@,T,I').
+    """
+    result = {}
+    for name, column in df.items():
+        if name in CATEGORY_COLUMNS:
+            column = column.astype('category')
+        elif name == 'conditions':
+            column = column.map(_join_conditions).astype('category')
+        elif name in PRICE_COLUMNS and column.dtype == np.float64:
+            narrow = column.to_numpy().astype(np.float32)
+            error = np.abs(narrow.astype(np.float64) - column.to_numpy())
+            if not len(error) or np.nanmax(error) <= PRICE_TOLERANCE:
+                column = pd.Series(narrow, index=column.index, name=name)
+        elif name in SIZE_COLUMNS and column.dtype.kind in 'iu':
+            info = np.iinfo(np.int32)
+            if not len(column) or (column.min() >= info.min and
+                                   column.max() <= info.max):
+                column = column.astype(np.int32)
+        result[name] = column
+    return pd.DataFrame(result, index=df.index, copy=False)
+
+
+def memory_report(df: pd.DataFrame, compacted: pd.DataFrame) -> pd.DataFrame:
+    """bytes per column (strings and lists included) before and after
+    compact_frame, with a total row"""
+    before = df.memory_usage(deep=True)
+    after = compacted.memory_usage(deep=True)
+    report = pd.DataFrame({'before': before, 'after': after})
+    report.loc['total'] = report.sum()
+    report['ratio'] = report['before'] / report['after']
+    return report
+
+
+def _join_conditions(value):
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return ','.join(value)
+    return value
+
+
+def _as_array(values: list) -> np.ndarray:
+    if isinstance(values, np.ndarray):
+        return values
+    first = values[0] if values else None
+    if isinstance(first, (int, float)) and not isinstance(first, bool):
+        try:
+            arr = np.asarray(values)
+            if arr.dtype.kind in 'iuf':
+                return arr
+        except (TypeError, ValueError):
+            pass
+    # strings, lists (trade conditions) and missing values stay objects
+    if not isinstance(first, (list, tuple)):
+        try:
+            arr = np.array(values, dtype=object)
+            if arr.ndim == 1:
+                return arr
+        except ValueError:
+            pass
+    # lists must be assigned one by one, numpy would make them a 2d array
+    arr = np.empty(len(values), dtype=object)
+    for i, v in enumerate(values):
+        arr[i] = v
+    return arr
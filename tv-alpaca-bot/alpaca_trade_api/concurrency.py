@@ -0,0 +1,152 @@
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Hashable, Iterable, Iterator
+
+DEFAULT_RATE_LIMIT = 200  # requests per minute, the api default
+# seconds a closed prefetch() waits for the request in flight, the default
+# read timeout
+PREFETCH_JOIN_TIMEOUT = 30.0
+
+
+class RateLimiter(object):
+    """
+    token bucket shared between threads. acquire() blocks until a request
+    may be sent without exceeding `rate` requests per `per` seconds.
+    a rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, per: float = 60.0, burst: int = None):
+        self.rate = rate
+        self.per = per
+        self.burst = burst if burst is not None else max(int(rate), 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'RateLimiter':
+        return cls(float(os.environ.get('APCA_RATE_LIMIT',
+                                        DEFAULT_RATE_LIMIT)))
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.burst,
+                           self._tokens + elapsed * self.rate / self.per)
+
+    def acquire(self, tokens: int = 1):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) * self.per / self.rate
+            time.sleep(wait)
+
+
+class _Flight(object):
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    coalesces concurrent calls with the same key: the first caller runs
+    fn, callers arriving while it runs wait for it and receive the same
+    result, or the same exception. nothing is remembered once the call
+    returned, so later calls run fn again.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.calls = 0   # calls that ran fn
+        self.shared = 0  # calls that received the result of another one
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+
+_DONE = object()
+
+
+def prefetch(iterable: Iterable, depth: int = 1,
+             join_timeout: float = PREFETCH_JOIN_TIMEOUT) -> Iterator:
+    """
+    iterate `iterable` in a background thread, keeping up to `depth` items
+    ready ahead of the consumer. exceptions raised by the producer are
+    re-raised in the consumer, and closing the returned generator stops
+    the producer after its current item, waiting up to join_timeout
+    seconds for it.
+    """
+    buffer = queue.Queue(maxsize=max(depth, 1))
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if not _put(buffer, (item, None), stop):
+                    return
+            _put(buffer, (_DONE, None), stop)
+        except BaseException as e:
+            _put(buffer, (_DONE, e), stop)
+
+    producer = threading.Thread(target=produce, daemon=True,
+                                name='alpaca-prefetch')
+    producer.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stop.set()
+        # unblock a producer waiting on a full buffer
+        while not buffer.empty():
+            buffer.get_nowait()
+        # no request of this iterator may outlive it
+        producer.join(join_timeout)
+
+
+def _put(buffer: queue.Queue, value, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            buffer.put(value, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
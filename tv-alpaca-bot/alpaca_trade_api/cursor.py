@@ -0,0 +1,49 @@
+import json
+import os
+import threading
+from typing import Any, Optional
+
+
+class SyncCursor(object):
+    """
+    named high-watermarks kept in a small json file, so an incremental
+    sync (list_orders_iter, get_activities_iter) resumes where the last
+    run stopped. the file is replaced atomically on every update.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: json file, created on the first update
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self._state = json.load(f)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            return self._state.get(key)
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._state[key] = value
+            self._save()
+
+    def reset(self, key: str = None):
+        """forget one watermark, or all of them"""
+        with self._lock:
+            if key is None:
+                self._state.clear()
+            else:
+                self._state.pop(key, None)
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._state, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,70 @@
+import json
+import os
+from typing import Any, Callable
+
+Decoder = Callable[[bytes], Any]
+
+# tried in this order when APCA_JSON_DECODER is auto (the default)
+AUTO_ORDER = ('orjson', 'msgspec', 'ujson')
+
+
+def _load(name: str) -> Decoder:
+    if name == 'json':
+        return json.loads
+    if name == 'orjson':
+        import orjson
+        return orjson.loads
+    if name == 'msgspec':
+        import msgspec
+        return msgspec.json.Decoder().decode
+    if name == 'ujson':
+        import ujson
+        return ujson.loads
+    raise ValueError('unknown json decoder: {}'.format(name))
+
+
+class JSONDecoder(object):
+    """
+    decodes a response body from its raw bytes, in a single pass.
+
+    a fast third party parser is used when installed. bodies it refuses
+    but the standard library accepts (e.g. NaN literals) are decoded again
+    with the standard library, so switching parsers never turns a valid
+    response into an error.
+    """
+
+    def __init__(self, name: str = 'auto'):
+        """
+        :param name: auto, json, orjson, msgspec or ujson. auto picks the
+               first importable of orjson, msgspec and ujson, falling back
+               to the standard library.
+        """
+        self.name = name
+        self._loads = None
+        if name == 'auto':
+            for candidate in AUTO_ORDER:
+                try:
+                    self._loads = _load(candidate)
+                    self.name = candidate
+                    break
+                except ImportError:
+                    continue
+            else:
+                self.name = 'json'
+        if self._loads is None:
+            self._loads = _load(self.name)
+
+    @classmethod
+    def from_env(cls) -> 'JSONDecoder':
+        return cls(os.environ.get('APCA_JSON_DECODER', 'auto'))
+
+    def __call__(self, body: bytes) -> Any:
+        try:
+            return self._loads(body)
+        except Exception:
+            if self._loads is json.loads:
+                raise
+            return json.loads(body)
+
+    def __repr__(self):
+        return 'JSONDecoder({!r})'.format(self.name)
@@ -1,9 +1,54 @@
+import datetime
+from collections.abc import MutableSequence
 import pandas as pd
 import pprint
 import re
+from typing import Optional
 
 ISO8601YMD = re.compile(r'\d{4}-\d{2}-\d{2}T')
 NY = 'America/New_York'
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def rfc3339_to_ns(value: str) -> Optional[int]:
+    """
+    epoch nanoseconds of a timestamp in the fixed utc format the api uses,
+    YYYY-MM-DDTHH:MM:SS[.fraction]Z, parsed without pandas. anything else
+    (e.g. a numeric offset) returns None so the caller can fall back.
+    """
+    if len(value) < 20 or value[-1] != 'Z' or value[10] != 'T':
+        return None
+    sep = value[19]
+    fraction = value[20:-1]
+    if sep == '.' and fraction.isdigit():
+        nanos = int(fraction[:9].ljust(9, '0'))
+    elif sep == 'Z' and not fraction:
+        nanos = 0
+    else:
+        return None
+    try:
+        delta = datetime.datetime.fromisoformat(value[:19]) - _EPOCH
+    except ValueError:
+        return None
+    return (delta.days * 86400 + delta.seconds) * 1000000000 + nanos
+
+
+def parse_timestamp(value: str, tz=None) -> pd.Timestamp:
+    """
+    pd.Timestamp(value), converted to tz if given. pandas parses a string
+    about as fast as it builds a Timestamp from an integer, but converting
+    to another timezone is several times slower than building the
+    Timestamp in that zone from epoch nanoseconds, which is done here.
+    """
+    if tz is None:
+        return pd.Timestamp(value)
+    ns = rfc3339_to_ns(value)
+    if ns is not None:
+        return pd.Timestamp(ns, tz=tz)
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        return ts.tz_localize(tz)
+    return ts.tz_convert(tz)
 
 
 class Entity(object):
@@ -12,22 +57,40 @@ class Entity(object):
     field.
     '''
 
+    # key -> (raw value, parsed value) of timestamps already converted,
+    # created on the first one so that large lists do not pay for it
+    _parsed = None
+
     def __init__(self, raw):
         self._raw = raw
 
     def __getattr__(self, key):
         if key in self._raw:
             val = self._raw[key]
+            if self._parsed is not None:
+                parsed = self._parsed.get(key)
+                if parsed is not None and parsed[0] is val:
+                    return parsed[1]
             if (isinstance(val, str) and
                     (key.endswith('_at') or
                      key.endswith('_timestamp') or
                      key.endswith('_time')) and
                     ISO8601YMD.match(val)):
-                return pd.Timestamp(val)
+                return self._parse(key, val, parse_timestamp)
             else:
                 return val
         return super().__getattribute__(key)
 
+    def _parse(self, key, val, convert):
+        """convert(val), computed once per key while the raw value is the
+        same object"""
+        if self._parsed is None:
+            self._parsed = {}
+        parsed = self._parsed.get(key)
+        if parsed is None or parsed[0] is not val:
+            parsed = self._parsed[key] = (val, convert(val))
+        return parsed[1]
+
     def __repr__(self):
         return '{name}({raw})'.format(
             name=self.__class__.__name__,
@@ -104,10 +167,127 @@ class Bar(Entity):
         return super().__getattr__(key)
 
 
-class Bars(list):
-    def __init__(self, raw):
-        super().__init__([Bar(o) for o in raw])
-        self._raw = raw
+class LazyEntityList(MutableSequence):
+    '''A list of raw api items which are wrapped with the entity class only
+    when an element is accessed. Building the list, len() and .df never
+    create entity objects. An entity is created once per item and kept, so
+    repeated reads return the same object (and the timestamps it already
+    parsed); slices, copies and concatenations are lazy lists sharing them.
+    '''
+    _entity = Entity
+
+    def __init__(self, raw=()):
+        self._raw = list(raw)
+        # entity of each raw item, None until it is first accessed
+        self._entities = [None] * len(self._raw)
+
+    def _lazy_copy(self, raw):
+        return type(self)(raw)
+
+    def _share(self, raw: list, entities: list):
+        copy = self._lazy_copy(raw)
+        copy._entities = entities
+        return copy
+
+    def _wrap(self, index):
+        entity = self._entities[index]
+        if entity is None:
+            entity = self._entities[index] = self._entity(self._raw[index])
+        return entity
+
+    def _unwrap(self, value):
+        """the raw item of a stored value, an entity or a raw item"""
+        return value._raw if isinstance(value, self._entity) else value
+
+    def _cached(self, value):
+        return value if isinstance(value, self._entity) else None
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._share(self._raw[index], self._entities[index])
+        return self._wrap(index)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            self._raw[index] = [self._unwrap(v) for v in value]
+            self._entities[index] = [self._cached(v) for v in value]
+        else:
+            self._raw[index] = self._unwrap(value)
+            self._entities[index] = self._cached(value)
+
+    def __delitem__(self, index):
+        del self._raw[index]
+        del self._entities[index]
+
+    def insert(self, index, value):
+        self._raw.insert(index, self._unwrap(value))
+        self._entities.insert(index, self._cached(value))
+
+    def clear(self):
+        del self[:]
+
+    def copy(self):
+        return self[:]
+
+    def sort(self, key=None, reverse=False):
+        if key is None:
+            sort_key = self._wrap
+        else:
+            def sort_key(i):
+                return key(self._wrap(i))
+        order = sorted(range(len(self)), key=sort_key, reverse=reverse)
+        self._raw[:] = [self._raw[i] for i in order]
+        self._entities[:] = [self._entities[i] for i in order]
+
+    def __iter__(self):
+        for i in range(len(self._raw)):
+            yield self._wrap(i)
+
+    def __reversed__(self):
+        for i in range(len(self._raw) - 1, -1, -1):
+            yield self._wrap(i)
+
+    def __add__(self, other):
+        if isinstance(other, LazyEntityList):
+            return self._share(self._raw + other._raw,
+                               self._entities + other._entities)
+        if isinstance(other, list):
+            copy = self[:]
+            copy.extend(other)
+            return copy
+        return NotImplemented
+
+    def __radd__(self, other):
+        if isinstance(other, list):
+            head = self._lazy_copy([])
+            head.extend(other)
+            return head + self
+        return NotImplemented
+
+    def __mul__(self, n):
+        return self._share(self._raw * n, self._entities * n)
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        if isinstance(other, LazyEntityList):
+            return self._raw == other._raw
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class Bars(LazyEntityList):
+    _entity = Bar
 
     @property
     def df(self):
@@ -144,10 +324,15 @@ class _Timestamped(object):
         if key in self._raw:
             val = self._raw[key]
             if key in self._tskeys:
-                return pd.Timestamp(val, tz=NY, unit=self._unit)
+                return self._parse(key, val, self._to_timestamp)
             return val
         return getattr(super(), key)
 
+    def _to_timestamp(self, val):
+        if isinstance(val, str):
+            return parse_timestamp(val, tz=NY)
+        return pd.Timestamp(val, tz=NY, unit=self._unit)
+
 
 class _NanoTimestamped(_Timestamped):
     _unit = 'ns'
@@ -176,7 +361,7 @@ class Clock(Entity):
         if key in self._raw:
             val = self._raw[key]
             if key in ('timestamp', 'next_open', 'next_close'):
-                return pd.Timestamp(val)
+                return self._parse(key, val, parse_timestamp)
             else:
                 return val
         return super().__getattr__(key)
@@ -220,7 +405,7 @@ class PortfolioHistory(Entity):
     """
 
     def __init__(self, raw):
-        self._raw = raw
+        super().__init__(raw)
 
     @property
     def df(self):
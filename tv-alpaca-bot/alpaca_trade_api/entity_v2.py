@@ -1,6 +1,12 @@
 from enum import Enum
+from functools import partial
+from operator import attrgetter
 import pandas as pd
-from .entity import Bar, Entity, Trade, Quote, _NanoTimestamped
+from .columnar import compact_frame
+from .entity import (
+    Bar, Entity, LazyEntityList, Trade, Quote, _NanoTimestamped,
+    rfc3339_to_ns,
+)
 from typing import Dict
 
 trade_mapping_v2 = {
@@ -102,13 +108,23 @@ class EntityListType(Enum):
     Bar = Bar, bar_mapping_v2
 
 
-class EntityList(list):
-    def __init__(self, entity_type: EntityListType, raw):
-        entity = entity_type.value[0]
-        super().__init__([entity(o) for o in raw])
-        self._raw = raw
+class EntityList(LazyEntityList):
+    def __init__(self, entity_type: EntityListType, raw,
+                 compact: bool = False):
+        super().__init__(raw)
+        self._entity_type = entity_type
+        self._compact = compact
+        if compact:
+            self._entity = compact_types[entity_type.value[0]]
+        else:
+            self._entity = entity_type.value[0]
         self.mapping = entity_type.value[1]
 
+    def _lazy_copy(self, raw):
+        copy = type(self).__new__(type(self))
+        EntityList.__init__(copy, self._entity_type, raw, self._compact)
+        return copy
+
     @property
     def df(self):
         if not hasattr(self, '_df'):
@@ -123,6 +139,10 @@ class EntityList(list):
             self._df = df
         return self._df
 
+    def compact_df(self) -> pd.DataFrame:
+        """.df with compact dtypes, see columnar.compact_frame"""
+        return compact_frame(self.df)
+
 
 class Remapped:
     def __init__(self, mapping: Dict[str, str], *args, **kwargs):
@@ -137,18 +157,18 @@ class Remapped:
 
 
 class BarsV2(EntityList):
-    def __init__(self, raw):
-        super().__init__(EntityListType.Bar, raw)
+    def __init__(self, raw, compact: bool = False):
+        super().__init__(EntityListType.Bar, raw, compact)
 
 
 class TradesV2(EntityList):
-    def __init__(self, raw):
-        super().__init__(EntityListType.Trade, raw)
+    def __init__(self, raw, compact: bool = False):
+        super().__init__(EntityListType.Trade, raw, compact)
 
 
 class QuotesV2(EntityList):
-    def __init__(self, raw):
-        super().__init__(EntityListType.Quote, raw)
+    def __init__(self, raw, compact: bool = False):
+        super().__init__(EntityListType.Quote, raw, compact)
 
 
 class TradeV2(Remapped, _NanoTimestamped, Entity):
@@ -200,37 +220,106 @@ class CorrectionV2(Remapped, _NanoTimestamped, Entity):
         super().__init__(correction_mapping_v2, raw)
 
 
-class SnapshotV2:
+class CompactRecord(object):
+    """
+    memory lean alternative to the Remapped entities. the readable field
+    names are __slots__, so a record holds no dict and reading a field is
+    a plain slot load. the raw api keys ('p', 'ap', ...) stay readable as
+    class level aliases. the timestamp is kept as epoch nanoseconds.
+    """
+    __slots__ = ()
+    _mapping = {}
+    _fields = ()  # (raw key, slot name) pairs, set per subclass
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = tuple(cls._mapping.items())
+        for key, name in cls._fields:
+            if key != name:
+                setattr(cls, key, property(attrgetter(name)))
+
     def __init__(self, raw):
-        self.latest_trade = _convert_or_none(TradeV2, raw.get('latestTrade'))
-        self.latest_quote = _convert_or_none(QuoteV2, raw.get('latestQuote'))
-        self.minute_bar = _convert_or_none(BarV2, raw.get('minuteBar'))
-        self.daily_bar = _convert_or_none(BarV2, raw.get('dailyBar'))
-        self.prev_daily_bar = _convert_or_none(BarV2, raw.get('prevDailyBar'))
+        for key, name in self._fields:
+            setattr(self, name, raw.get(key))
+        t = self.timestamp
+        if isinstance(t, str):
+            ns = rfc3339_to_ns(t)
+            self.timestamp = ns if ns is not None else pd.Timestamp(t).value
+        elif t is not None and not isinstance(t, int):
+            self.timestamp = pd.Timestamp(t).value
+
+    @property
+    def _raw(self):
+        raw = {}
+        for key, name in self._fields:
+            value = getattr(self, name)
+            if value is not None:
+                raw[key] = value
+        return raw
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name)
+                   for _, name in self._fields)
+
+    def __repr__(self):
+        return '{name}({raw})'.format(name=self.__class__.__name__,
+                                      raw=self._raw)
+
+
+class CompactTradeV2(CompactRecord):
+    __slots__ = tuple(trade_mapping_v2.values())
+    _mapping = trade_mapping_v2
+
+
+class CompactQuoteV2(CompactRecord):
+    __slots__ = tuple(quote_mapping_v2.values())
+    _mapping = quote_mapping_v2
+
+
+class CompactBarV2(CompactRecord):
+    __slots__ = tuple(bar_mapping_v2.values())
+    _mapping = bar_mapping_v2
+
+
+class SnapshotV2:
+    def __init__(self, raw, compact: bool = False):
+        trade, quote, bar = ((CompactTradeV2, CompactQuoteV2, CompactBarV2)
+                             if compact else (TradeV2, QuoteV2, BarV2))
+        self.latest_trade = _convert_or_none(trade, raw.get('latestTrade'))
+        self.latest_quote = _convert_or_none(quote, raw.get('latestQuote'))
+        self.minute_bar = _convert_or_none(bar, raw.get('minuteBar'))
+        self.daily_bar = _convert_or_none(bar, raw.get('dailyBar'))
+        self.prev_daily_bar = _convert_or_none(bar, raw.get('prevDailyBar'))
 
 
 class SnapshotsV2(dict):
-    def __init__(self, raw):
+    def __init__(self, raw, compact: bool = False):
         for k, v in raw.items():
-            self[k] = _convert_or_none(SnapshotV2, v)
+            self[k] = _convert_or_none(partial(SnapshotV2, compact=compact),
+                                       v)
 
 
 class LatestBarsV2(dict):
-    def __init__(self, raw):
+    def __init__(self, raw, compact: bool = False):
+        entity = CompactBarV2 if compact else BarV2
         for k, v in raw.items():
-            self[k] = _convert_or_none(BarV2, v)
+            self[k] = _convert_or_none(entity, v)
 
 
 class LatestTradesV2(dict):
-    def __init__(self, raw):
+    def __init__(self, raw, compact: bool = False):
+        entity = CompactTradeV2 if compact else TradeV2
         for k, v in raw.items():
-            self[k] = _convert_or_none(TradeV2, v)
+            self[k] = _convert_or_none(entity, v)
 
 
 class LatestQuotesV2(dict):
-    def __init__(self, raw):
+    def __init__(self, raw, compact: bool = False):
+        entity = CompactQuoteV2 if compact else QuoteV2
         for k, v in raw.items():
-            self[k] = _convert_or_none(QuoteV2, v)
+            self[k] = _convert_or_none(entity, v)
 
 
 class BidOrAsk(Entity):
@@ -271,6 +360,22 @@ class NewsListV2(list):
         super().__init__([NewsV2(o) for o in raw])
 
 
+# the compact counterpart of every type able to produce compact records
+compact_types = {
+    Trade: CompactTradeV2,
+    Quote: CompactQuoteV2,
+    Bar: CompactBarV2,
+    TradeV2: CompactTradeV2,
+    QuoteV2: CompactQuoteV2,
+    BarV2: CompactBarV2,
+    SnapshotV2: partial(SnapshotV2, compact=True),
+    SnapshotsV2: partial(SnapshotsV2, compact=True),
+    LatestBarsV2: partial(LatestBarsV2, compact=True),
+    LatestTradesV2: partial(LatestTradesV2, compact=True),
+    LatestQuotesV2: partial(LatestQuotesV2, compact=True),
+}
+
+
 def _convert_or_none(entityType, value):
     if value:
         return entityType(value)
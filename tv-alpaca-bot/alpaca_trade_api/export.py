@@ -0,0 +1,253 @@
+import os
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .columnar import timestamps_to_ns
+from .cursor import SyncCursor
+from .entity_v2 import bar_mapping_v2, quote_mapping_v2, trade_mapping_v2
+
+DEFAULT_ROW_GROUP_SIZE = 50000
+FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}  # format -> extension
+CHECKPOINT_FILE = '_checkpoint.json'
+_NS_PER_DAY = 86400 * 10 ** 9
+
+# raw field -> arrow type name of the stock data endpoints. the timestamp
+# is stored as a UTC timestamp, unknown fields are not exported.
+_FIELDS = {
+    'trades': {'x': 'string', 'p': 'float64', 's': 'int64',
+               'c': 'list<string>', 'i': 'int64', 'z': 'string'},
+    'quotes': {'ax': 'string', 'ap': 'float64', 'as': 'int64',
+               'bx': 'string', 'bp': 'float64', 'bs': 'int64',
+               'c': 'list<string>', 'z': 'string'},
+    'bars': {'o': 'float64', 'h': 'float64', 'l': 'float64',
+             'c': 'float64', 'v': 'int64', 'n': 'int64', 'vw': 'float64'},
+}
+_MAPPINGS = {'trades': trade_mapping_v2, 'quotes': quote_mapping_v2,
+             'bars': bar_mapping_v2}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa
+        import pyarrow.parquet  # noqa
+    except ImportError:
+        raise ImportError(
+            'exporting historical data needs pyarrow, '
+            'install it with: pip install pyarrow') from None
+    return pyarrow
+
+
+class DataExporter(object):
+    """
+    streams historical trades, quotes or bars to Parquet (or Arrow IPC)
+    files partitioned by symbol and UTC date:
+
+        out_dir/trades/symbol=AAPL/date=2021-06-01/data.parquet
+        out_dir/trades/feed=iex/symbol=AAPL/date=2021-06-01/data.parquet
+        out_dir/bars/timeframe=1Min/adjustment=raw/symbol=AAPL/date=...
+
+    every parameter that changes the data is part of the path, so exports
+    of the same symbols with another timeframe, adjustment or feed (the
+    api default when not given) do not mix.
+
+    pages are written in row groups of row_group_size rows as they
+    arrive, so memory use does not grow with the size of the range. a file
+    appears once its date is complete, and the checkpoint then records it:
+    an interrupted export started again with the same arguments resumes at
+    the first incomplete date, and one extending an earlier export rewrites
+    the date that export ended in.
+    """
+
+    def __init__(self,
+                 api,
+                 out_dir: str,
+                 fmt: str = 'parquet',
+                 row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+                 compression: str = 'snappy'):
+        """
+        :param api: the REST instance pages are requested with
+        :param fmt: parquet or arrow
+        :param compression: parquet codec, e.g. snappy, zstd or none
+        """
+        if fmt not in FORMATS:
+            raise ValueError('unknown format: {}'.format(fmt))
+        self._pa = _pyarrow()
+        self._api = api
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.row_group_size = max(int(row_group_size), 1)
+        self.compression = compression
+        self.checkpoint = SyncCursor(os.path.join(out_dir, CHECKPOINT_FILE))
+
+    def export(self,
+               kind: str,
+               symbols: Union[str, List[str]],
+               start: str,
+               end: str,
+               timeframe=None,
+               adjustment: str = 'raw',
+               feed: Optional[str] = None) -> Dict[str, int]:
+        """
+        :param kind: trades, quotes or bars
+        :param timeframe: TimeFrame or its string (e.g. 1Min), bars only
+        :return: rows written per symbol by this call
+        """
+        if kind not in _FIELDS:
+            raise ValueError('unknown data kind: {}'.format(kind))
+        if kind == 'bars' and timeframe is None:
+            raise ValueError('exporting bars needs a timeframe')
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        params = {'feed': feed}
+        dataset = kind
+        if kind == 'bars':
+            params.update(timeframe=str(timeframe), adjustment=adjustment)
+            dataset += '/timeframe={}/adjustment={}'.format(timeframe,
+                                                            adjustment)
+        if feed:
+            dataset += '/feed={}'.format(feed)
+        written = {}
+        for symbol in symbols:
+            written[symbol] = self._export_symbol(
+                kind, dataset, symbol, start, end, params)
+        return written
+
+    def _export_symbol(self, kind: str, dataset: str, symbol: str,
+                       start: str, end: str, params: dict) -> int:
+        key = '{}/symbol={}'.format(dataset, symbol)
+        done = self.checkpoint.get(key)
+        if done is not None:
+            if _utc(done) >= _utc(end):
+                return 0
+            # the partition of a date is rewritten whole: resume at the
+            # start of the date the checkpoint is in, not at the checkpoint
+            start = max(_utc(start), _utc(done).floor('D')).isoformat()
+        pages = self._api._data_get_pages(kind, symbol, start=start, end=end,
+                                          **params)
+        directory = os.path.join(self.out_dir, key)
+        writer = None
+        day = None
+        rows = 0
+        try:
+            for page in pages:
+                if not page:
+                    continue
+                ns = timestamps_to_ns([item['t'] for item in page])
+                days = ns // _NS_PER_DAY
+                # pages are sorted by time, cut them where the date changes
+                cuts = [0] + list(np.flatnonzero(np.diff(days)) + 1) + \
+                    [len(page)]
+                for i, j in zip(cuts[:-1], cuts[1:]):
+                    if days[i] != day:
+                        if writer is not None:
+                            writer.close()
+                            self.checkpoint.set(key, _day_start(days[i]))
+                        day = days[i]
+                        writer = _PartitionWriter(self, kind, os.path.join(
+                            directory, 'date=' + _day_name(day)))
+                    writer.add(page[i:j], ns[i:j])
+                    rows += j - i
+            if writer is not None:
+                writer.close()
+                writer = None
+            self.checkpoint.set(key, _utc(end).isoformat())
+        finally:
+            if writer is not None:
+                writer.abort()
+        return rows
+
+
+class _PartitionWriter(object):
+    """the file of one symbol and date, written under a temporary name
+    and moved in place when complete"""
+
+    def __init__(self, exporter: DataExporter, kind: str, directory: str):
+        self._pa = exporter._pa
+        self._fmt = exporter.fmt
+        self._compression = exporter.compression
+        self._row_group_size = exporter.row_group_size
+        self._fields = _FIELDS[kind]
+        self._mapping = _MAPPINGS[kind]
+        self._schema = _schema(self._pa, kind)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'data.' + FORMATS[self._fmt])
+        self._tmp = self.path + '.tmp'
+        self._writer = None
+        self._items = []
+        self._ns = []
+
+    def add(self, items: List[dict], ns: np.ndarray):
+        self._items.extend(items)
+        self._ns.append(ns)
+        self._flush(self._row_group_size)
+
+    def close(self):
+        self._flush(1)
+        if self._writer is None:
+            self._open()
+        self._writer.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+    def _open(self):
+        pa = self._pa
+        if self._fmt == 'parquet':
+            self._writer = pa.parquet.ParquetWriter(
+                self._tmp, self._schema, compression=self._compression)
+        else:
+            self._writer = pa.ipc.new_file(self._tmp, self._schema)
+
+    def _flush(self, at_least: int):
+        """write row groups while at_least items are buffered"""
+        while len(self._items) >= at_least:
+            items = self._items[:self._row_group_size]
+            del self._items[:self._row_group_size]
+            ns = np.concatenate(self._ns)
+            self._ns = [ns[len(items):]]
+            self._write(items, ns[:len(items)])
+
+    def _write(self, items: List[dict], ns: np.ndarray):
+        pa = self._pa
+        columns = [pa.array(ns, type=self._schema.field(0).type)]
+        for raw in self._fields:
+            field = self._schema.field(self._mapping.get(raw, raw))
+            columns.append(pa.array([item.get(raw) for item in items],
+                                    type=field.type))
+        if self._writer is None:
+            self._open()
+        self._writer.write_table(
+            pa.Table.from_arrays(columns, schema=self._schema))
+
+
+def _schema(pa, kind: str):
+    types = {'string': pa.string(), 'float64': pa.float64(),
+             'int64': pa.int64(), 'list<string>': pa.list_(pa.string())}
+    mapping = _MAPPINGS[kind]
+    fields = [pa.field('timestamp', pa.timestamp('ns', tz='UTC'))]
+    for raw, type_name in _FIELDS[kind].items():
+        fields.append(pa.field(mapping.get(raw, raw), types[type_name]))
+    return pa.schema(fields)
+
+
+def _day_name(day: int) -> str:
+    return str(np.datetime64(int(day), 'D'))
+
+
+def _day_start(day: int) -> str:
+    return pd.Timestamp(int(day) * _NS_PER_DAY, tz='UTC').isoformat()
+
+
+def _utc(value) -> pd.Timestamp:
+    """a timestamp without timezone is taken as UTC, like the api does"""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        return ts.tz_localize('UTC')
+    return ts.tz_convert('UTC')
@@ -0,0 +1,331 @@
+import bisect
+import logging
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# lifecycle events of a REST call
+BEFORE_SEND = 'before_send'        # an attempt is about to be sent
+AFTER_RESPONSE = 'after_response'  # an attempt got an http response
+ON_RETRY = 'on_retry'              # a retry is scheduled after event.wait
+ON_ERROR = 'on_error'              # the call failed for good
+EVENTS = (BEFORE_SEND, AFTER_RESPONSE, ON_RETRY, ON_ERROR)
+
+# seconds, the default buckets of the prometheus client libraries
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5,
+                   5.0, 7.5, 10.0)
+
+_UUID = re.compile(
+    r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.I)
+# the segment following these is an id or a symbol
+_KEYED = {'orders', 'positions', 'assets', 'watchlists', 'stocks',
+          'accounts'}
+_NOT_KEYS = {'trades', 'quotes', 'bars', 'snapshots', 'latest', 'meta',
+             'auctions', 'exchanges', 'conditions', 'activities'}
+
+
+def endpoint(url: str) -> str:
+    """
+    path of url with ids and symbols replaced by placeholders, so the
+    metrics of /v2/orders/<id> are kept once and not once per order.
+    """
+    segments = urlsplit(url).path.split('/')
+    for i, segment in enumerate(segments):
+        if _UUID.match(segment) or segment.isdigit():
+            segments[i] = '{id}'
+        elif i and segments[i - 1] in _KEYED and segment \
+                and segment not in _NOT_KEYS:
+            segments[i] = '{id}' if segments[i - 1] != 'stocks' \
+                else '{symbol}'
+    return '/'.join(segments)
+
+
+class RequestEvent(object):
+    """
+    one attempt of a REST call, handed to every hook. fields not known
+    yet at the time of the event are None.
+    """
+
+    __slots__ = ('method', 'url', 'attempt', 'started', 'elapsed',
+                 'status', 'bytes_sent', 'bytes_received', 'wait', 'error',
+                 '_endpoint')
+
+    def __init__(self, method: str, url: str, attempt: int = 0):
+        self.method = method.upper()
+        self.url = url
+        self.attempt = attempt      # 0 for the first attempt
+        self.started = None         # time.perf_counter() when sent
+        self.elapsed = None         # seconds until the response
+        self.status = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.wait = None            # seconds slept before the retry
+        self.error = None
+        self._endpoint = None
+
+    @property
+    def endpoint(self) -> str:
+        if self._endpoint is None:
+            self._endpoint = endpoint(self.url)
+        return self._endpoint
+
+    def sent(self):
+        self.started = time.perf_counter()
+
+    def received(self, response):
+        self.elapsed = time.perf_counter() - self.started
+        self.status = response.status_code
+        self.bytes_received = len(response.content or b'')
+        body = response.request.body if response.request else None
+        self.bytes_sent = len(body) if body else 0
+
+    def failed(self, error: Exception):
+        self.error = error
+        if self.elapsed is None and self.started is not None:
+            self.elapsed = time.perf_counter() - self.started
+
+    def __repr__(self):
+        return ('RequestEvent(method={!r}, url={!r}, attempt={}, status={}, '
+                'elapsed={}, error={!r})').format(
+            self.method, self.url, self.attempt, self.status, self.elapsed,
+            self.error)
+
+
+Hook = Callable[[RequestEvent], None]
+
+
+class Hooks(object):
+    """
+    callables registered per lifecycle event. a failing hook is logged
+    and never breaks the request.
+    """
+
+    def __init__(self):
+        self._hooks: Dict[str, List[Hook]] = {e: [] for e in EVENTS}
+
+    def add(self, event: str, hook: Hook):
+        if event not in self._hooks:
+            raise ValueError('unknown event: {}'.format(event))
+        self._hooks[event].append(hook)
+
+    def remove(self, event: str, hook: Hook):
+        self._hooks[event].remove(hook)
+
+    def emit(self, event: str, request: RequestEvent):
+        for hook in self._hooks[event]:
+            try:
+                hook(request)
+            except Exception:
+                logger.exception('{} hook failed'.format(event))
+
+
+class _Histogram(object):
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsCollector(object):
+    """
+    per endpoint counters and latency histograms built from the request
+    hooks:
+
+        metrics = MetricsCollector()
+        metrics.register(api.hooks)
+        ...
+        metrics.snapshot()
+        metrics.to_prometheus()
+
+    latency is measured per attempt, from sending to the full response.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+                 prefix: str = 'apca'):
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._requests = {}   # (method, endpoint, status) -> count
+        self._retries = {}    # (method, endpoint) -> count
+        self._errors = {}     # (method, endpoint) -> count
+        self._sent = {}       # (method, endpoint) -> bytes
+        self._received = {}   # (method, endpoint) -> bytes
+        self._latency = {}    # (method, endpoint) -> _Histogram
+
+    def register(self, hooks: Hooks) -> 'MetricsCollector':
+        hooks.add(AFTER_RESPONSE, self.after_response)
+        hooks.add(ON_RETRY, self.on_retry)
+        hooks.add(ON_ERROR, self.on_error)
+        return self
+
+    def after_response(self, event: RequestEvent):
+        key = (event.method, event.endpoint)
+        with self._lock:
+            status = key + (event.status,)
+            self._requests[status] = self._requests.get(status, 0) + 1
+            self._sent[key] = self._sent.get(key, 0) + event.bytes_sent
+            self._received[key] = self._received.get(key, 0) + \
+                event.bytes_received
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = _Histogram(len(self.buckets))
+                self._latency[key] = histogram
+            histogram.counts[bisect.bisect_left(self.buckets,
+                                                event.elapsed)] += 1
+            histogram.sum += event.elapsed
+            histogram.count += 1
+
+    def on_retry(self, event: RequestEvent):
+        key = (event.method, event.endpoint)
+        with self._lock:
+            self._retries[key] = self._retries.get(key, 0) + 1
+
+    def on_error(self, event: RequestEvent):
+        key = (event.method, event.endpoint)
+        with self._lock:
+            self._errors[key] = self._errors.get(key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            for counter in (self._requests, self._retries, self._errors,
+                            self._sent, self._received, self._latency):
+                counter.clear()
+
+    def snapshot(self) -> dict:
+        """
+        {'METHOD /endpoint': {'requests', 'statuses', 'retries', 'errors',
+        'bytes_sent', 'bytes_received', 'latency': {'count', 'sum', 'mean',
+        'buckets'}}}
+        """
+        with self._lock:
+            keys = set(self._latency) | set(self._retries) | \
+                set(self._errors)
+            result = {}
+            for method, path in sorted(keys):
+                key = (method, path)
+                statuses = {s: n for (m, p, s), n in self._requests.items()
+                            if (m, p) == key}
+                histogram = self._latency.get(key) or \
+                    _Histogram(len(self.buckets))
+                cumulative, buckets = 0, {}
+                for le, n in zip(self.buckets + (float('inf'),),
+                                 histogram.counts):
+                    cumulative += n
+                    buckets[le] = cumulative
+                result[method + ' ' + path] = {
+                    'requests': sum(statuses.values()),
+                    'statuses': statuses,
+                    'retries': self._retries.get(key, 0),
+                    'errors': self._errors.get(key, 0),
+                    'bytes_sent': self._sent.get(key, 0),
+                    'bytes_received': self._received.get(key, 0),
+                    'latency': {
+                        'count': histogram.count,
+                        'sum': histogram.sum,
+                        'mean': histogram.sum / histogram.count
+                        if histogram.count else None,
+                        'buckets': buckets,
+                    },
+                }
+            return result
+
+    def to_prometheus(self) -> str:
+        """the metrics in the prometheus text exposition format"""
+        p = self.prefix
+        lines = []
+
+        def family(name, kind, doc):
+            lines.append('# HELP {}_{} {}'.format(p, name, doc))
+            lines.append('# TYPE {}_{} {}'.format(p, name, kind))
+
+        def sample(name, labels, value):
+            text = ','.join('{}="{}"'.format(k, _escape(v))
+                            for k, v in labels)
+            lines.append('{}_{}{{{}}} {}'.format(p, name, text,
+                                                 _number(value)))
+
+        with self._lock:
+            family('requests_total', 'counter',
+                   'http responses by endpoint and status')
+            for (m, e, s), n in sorted(self._requests.items()):
+                sample('requests_total',
+                       (('method', m), ('endpoint', e), ('status', s)), n)
+            for name, counter, doc in (
+                    ('request_retries_total', self._retries,
+                     'retries scheduled'),
+                    ('request_errors_total', self._errors,
+                     'calls that failed after all retries'),
+                    ('request_sent_bytes_total', self._sent,
+                     'request body bytes sent'),
+                    ('response_received_bytes_total', self._received,
+                     'response body bytes received')):
+                family(name, 'counter', doc)
+                for (m, e), n in sorted(counter.items()):
+                    sample(name, (('method', m), ('endpoint', e)), n)
+            family('request_duration_seconds', 'histogram',
+                   'seconds from sending an attempt to its full response')
+            for (m, e), histogram in sorted(self._latency.items()):
+                labels = (('method', m), ('endpoint', e))
+                cumulative = 0
+                for le, n in zip(self.buckets + (float('inf'),),
+                                 histogram.counts):
+                    cumulative += n
+                    sample('request_duration_seconds_bucket',
+                           labels + (('le', _number(le)),), cumulative)
+                sample('request_duration_seconds_sum', labels,
+                       histogram.sum)
+                sample('request_duration_seconds_count', labels,
+                       histogram.count)
+        return '\n'.join(lines) + '\n'
+
+
+def serve_metrics(collector: MetricsCollector,
+                  port: int = 9108,
+                  addr: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """
+    serve collector.to_prometheus() over http from a daemon thread, for a
+    prometheus server to scrape. call shutdown() on the result to stop.
+
+    :param addr: interface to listen on, only the local host by default.
+           the metrics describe the account's activity, '' exposes them
+           on every interface.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = collector.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True,
+                              name='apca-metrics')
+    thread.start()
+    return server
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _number(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
@@ -0,0 +1,388 @@
+"""
+technical indicators in two forms that give the same numbers:
+
+- batch functions over numpy arrays with time on the last axis, e.g. a
+  BarPanel field of shape (symbols, times), for backtests
+- streaming state objects updated one bar at a time in O(1), for live use
+
+both forms do the same floating point operations in the same order, so a
+strategy tested on the batch output behaves the same on the stream.
+
+NaN values (e.g. the gaps of a BarPanel filled with NaN) are skipped: the
+state carries over them and the output at a NaN time repeats the one
+before it, like pandas ewm(ignore_na=True). a series starts at its first
+value.
+"""
+import math
+from collections import deque
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .entity import NY
+
+
+# time steps smoothed per block: the block of every series is transposed
+# into a buffer small enough to stay in cache
+_BLOCK = 256
+# up to this many series, smoothing loops over python floats, cheaper than
+# a numpy call per time step
+_SCALAR_SERIES = 16
+
+
+def _series(values) -> np.ndarray:
+    """values as a C-contiguous (series, times) float64 array"""
+    x = np.asarray(values, dtype=np.float64)
+    return np.ascontiguousarray(x.reshape(-1, x.shape[-1]) if x.ndim
+                                else x.reshape(1, 1))
+
+
+def _shaped(result: np.ndarray, values) -> np.ndarray:
+    return result.reshape(np.shape(values))
+
+
+def _smooth(x: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    exponential smoothing of every row of x, seeded with its first non NaN
+    value: y[t] = y[t-1] * (1 - alpha) + x[t] * alpha, and y[t] = y[t-1]
+    where x[t] is NaN
+    """
+    beta = 1.0 - alpha
+    series, length = x.shape
+    out = np.empty_like(x)
+    if not length:
+        return out
+    if series <= _SCALAR_SERIES:
+        for row, result in zip(x, out):
+            result[:] = _smooth_floats(row.tolist(), alpha, beta)
+        return out
+    # rows taking their first value, and rows with a NaN after it, by time
+    seeds, gaps = {}, {}
+    missing = np.isnan(x)
+    if missing.any():
+        first = np.argmax(~missing, axis=1)
+        empty = missing[np.arange(series), first]
+        late = np.flatnonzero((first > 0) & ~empty)
+        seeds = _rows_by_time(first[late], late)
+        # only rows with more NaNs than their leading ones have gaps
+        counts = missing.sum(axis=1)
+        gappy = np.flatnonzero(~empty & (counts > first))
+        if len(gappy):
+            inner = missing[gappy] & (np.arange(length) >= first[gappy, None])
+            rows, times = np.nonzero(inner)
+            gaps = _rows_by_time(times, gappy[rows])
+    scaled = np.empty((min(_BLOCK, length), series))
+    product = np.empty(series)
+    previous = None
+    for t0 in range(0, length, _BLOCK):
+        t1 = min(t0 + _BLOCK, length)
+        block = scaled[:t1 - t0]
+        np.multiply(x[:, t0:t1].T, alpha, out=block)
+        for t, row in enumerate(block, t0):
+            if previous is None:
+                row[:] = x[:, 0]
+            else:
+                np.multiply(previous, beta, out=product)
+                np.add(product, row, out=row)
+                columns = seeds.get(t)
+                if columns is not None:
+                    row[columns] = x[columns, t]
+                columns = gaps.get(t)
+                if columns is not None:
+                    row[columns] = previous[columns]
+            previous = row
+        out[:, t0:t1] = block.T
+        # the buffer is reused by the next block
+        previous = block[-1].copy()
+    return out
+
+
+def _rows_by_time(times: np.ndarray, rows: np.ndarray) -> dict:
+    """time -> the rows paired with it"""
+    order = np.argsort(times, kind='stable')
+    times, rows = times[order], rows[order]
+    cuts = np.flatnonzero(np.diff(times)) + 1
+    return {int(group[0]): columns for group, columns in zip(
+        np.split(times, cuts), np.split(rows, cuts)) if len(group)}
+
+
+def _smooth_floats(values: List[float], alpha: float,
+                   beta: float) -> List[float]:
+    result = []
+    y = math.nan
+    started = False
+    for x in values:
+        if x != x:
+            pass
+        elif started:
+            y = y * beta + x * alpha
+        else:
+            y = x
+            started = True
+        result.append(y)
+    return result
+
+
+def _wilder(x: np.ndarray, n: int) -> np.ndarray:
+    """Wilder's smoothing (alpha = 1 / n) of every row of x, seeded with the
+    average of its first n non NaN values"""
+    seeded = x.copy()
+    # the seeds are found in the shortest prefix every row has n values in
+    width = min(2 * n, x.shape[1])
+    while True:
+        prefix = x[:, :width]
+        valid = ~np.isnan(prefix)
+        count = np.cumsum(valid, axis=1)
+        if width == x.shape[1] or (count[:, -1] >= n).all():
+            break
+        width = min(2 * width, x.shape[1])
+    seed = valid & (count == n)
+    head = seeded[:, :width]
+    head[count < n] = np.nan
+    head[seed] = np.cumsum(np.where(valid, prefix, 0.0), axis=1)[seed] / n
+    return _smooth(seeded, 1.0 / n)
+
+
+def _last_valid(x: np.ndarray) -> np.ndarray:
+    """x with every NaN replaced by the value before it"""
+    index = np.where(np.isnan(x), 0, np.arange(x.shape[1]))
+    np.maximum.accumulate(index, axis=1, out=index)
+    return np.take_along_axis(x, index, axis=1)
+
+
+def _previous(x: np.ndarray) -> np.ndarray:
+    """the last non NaN value before every time, NaN before the first"""
+    previous = np.full_like(x, np.nan)
+    if np.isnan(x).any():
+        x = _last_valid(x)
+    previous[:, 1:] = x[:, :-1]
+    return previous
+
+
+def ema(values, n: int) -> np.ndarray:
+    """exponential moving average with alpha = 2 / (n + 1)"""
+    return _shaped(_smooth(_series(values), 2.0 / (n + 1)), values)
+
+
+def sma(values, n: int) -> np.ndarray:
+    """simple moving average of the last n non NaN values, NaN until n
+    values of the series were seen"""
+    x = _series(values)
+    valid = ~np.isnan(x)
+    out = np.full_like(x, np.nan)
+    if valid.all():
+        total = np.cumsum(x, axis=1)
+        if x.shape[1] >= n:
+            out[:, n - 1] = total[:, n - 1] / n
+            out[:, n:] = (total[:, n:] - total[:, :-n]) / n
+        return _shaped(out, values)
+    total = np.cumsum(np.where(valid, x, 0.0), axis=1)
+    count = np.cumsum(valid, axis=1)
+    ready = count >= n
+    if ready.any():
+        rows = np.nonzero(ready)[0]
+        # the total up to the value n values back: the flat position of
+        # the k-th (1 based) value of row r is at[starts[r] + k - 1]
+        back = count[ready] - n
+        at = np.flatnonzero(valid)
+        starts = np.cumsum(valid.sum(axis=1)) - valid.sum(axis=1)
+        before = total.ravel()[at[starts[rows] + np.maximum(back, 1) - 1]]
+        out[ready] = (total[ready] - np.where(back > 0, before, 0.0)) / n
+    return _shaped(out, values)
+
+
+def rsi(values, n: int = 14) -> np.ndarray:
+    """relative strength index with Wilder's smoothing (alpha = 1 / n) of
+    the gains and losses, seeded with the average of the first n"""
+    x = _series(values)
+    change = x - _previous(x)
+    gain = _wilder(np.maximum(change, 0.0), n)
+    loss = _wilder(np.maximum(-change, 0.0), n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = gain + loss
+        out = np.where(total == 0, 50.0, 100.0 * gain / total)
+    return _shaped(out, values)
+
+
+def atr(high, low, close, n: int = 14) -> np.ndarray:
+    """average true range with Wilder's smoothing (alpha = 1 / n), seeded
+    with the average of the first n true ranges. the first bar has no
+    previous close and no true range."""
+    h, l, c = _series(high), _series(low), _series(close)
+    previous = _previous(c)
+    true_range = np.maximum(np.maximum(h - l, np.abs(h - previous)),
+                            np.abs(l - previous))
+    return _shaped(_wilder(true_range, n), close)
+
+
+def vwap(high, low, close, volume, sessions=None) -> np.ndarray:
+    """
+    volume weighted average of the typical price (h + l + c) / 3, from the
+    start of each session
+
+    :param sessions: session id of every time, e.g. session_ids(index).
+           None accumulates over all the times.
+    """
+    h, l, c = _series(high), _series(low), _series(close)
+    v = _series(volume)
+    weighted = (h + l + c) / 3.0 * v
+    valid = ~np.isnan(weighted)
+    weighted = np.where(valid, weighted, 0.0)
+    v = np.where(valid, v, 0.0)
+    out = np.empty_like(weighted)
+    bounds = [0, out.shape[1]]
+    if sessions is not None:
+        sessions = np.asarray(sessions)
+        bounds[1:1] = (np.flatnonzero(sessions[1:] != sessions[:-1]) +
+                       1).tolist()
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[:, start:end] = np.cumsum(weighted[:, start:end], axis=1) / \
+                np.cumsum(v[:, start:end], axis=1)
+    return _shaped(out, close)
+
+
+def session_ids(index: pd.DatetimeIndex) -> np.ndarray:
+    """the New York trading date of every time, as days since epoch"""
+    if index.tz is None:
+        index = index.tz_localize('UTC')
+    local = index.tz_convert(NY).tz_localize(None).normalize()
+    return np.asarray(local, dtype='datetime64[D]').view('int64')
+
+
+class EMA(object):
+    """streaming ema(), one value per update"""
+
+    def __init__(self, n: int):
+        self.alpha = 2.0 / (n + 1)
+        self.beta = 1.0 - self.alpha
+        self.value = None
+
+    def update(self, x: float) -> float:
+        if math.isnan(x):
+            return math.nan if self.value is None else self.value
+        if self.value is None:
+            self.value = x
+        else:
+            self.value = self.value * self.beta + x * self.alpha
+        return self.value
+
+
+class _Wilder(EMA):
+    def __init__(self, n: int):
+        super().__init__(n)
+        self.n = n
+        self.alpha = 1.0 / n
+        self.beta = 1.0 - self.alpha
+        self._count = 0
+        self._total = 0.0
+
+    def update(self, x: float) -> float:
+        if self._count >= self.n:
+            return super().update(x)
+        if math.isnan(x):
+            return math.nan
+        self._count += 1
+        self._total = self._total + x
+        if self._count < self.n:
+            return math.nan
+        self.value = self._total / self.n
+        return self.value
+
+
+class SMA(object):
+    """streaming sma()"""
+
+    def __init__(self, n: int):
+        self.n = n
+        self._total = 0.0
+        self._totals = deque(maxlen=n + 1)
+        self.value = math.nan
+
+    def update(self, x: float) -> float:
+        if math.isnan(x):
+            return self.value
+        self._total = self._total + x
+        self._totals.append(self._total)
+        if len(self._totals) == self.n:
+            self.value = self._total / self.n
+        elif len(self._totals) > self.n:
+            self.value = (self._total - self._totals[0]) / self.n
+        return self.value
+
+
+class RSI(object):
+    """streaming rsi()"""
+
+    def __init__(self, n: int = 14):
+        self._gain = _Wilder(n)
+        self._loss = _Wilder(n)
+        self._previous = None
+        self.value = math.nan
+
+    def update(self, x: float) -> float:
+        if math.isnan(x):
+            return self.value
+        previous, self._previous = self._previous, x
+        if previous is None:
+            return self.value
+        change = x - previous
+        gain = self._gain.update(_maximum(change, 0.0))
+        loss = self._loss.update(_maximum(-change, 0.0))
+        total = gain + loss
+        self.value = 50.0 if total == 0 else 100.0 * gain / total
+        return self.value
+
+
+class ATR(object):
+    """streaming atr()"""
+
+    def __init__(self, n: int = 14):
+        self._average = _Wilder(n)
+        self._close = None
+        self.value = math.nan
+
+    def update(self, high: float, low: float, close: float) -> float:
+        if self._close is None:
+            # no previous close, no true range
+            true_range = math.nan
+        else:
+            true_range = _maximum(
+                _maximum(high - low, abs(high - self._close)),
+                abs(low - self._close))
+        if not math.isnan(close):
+            self._close = close
+        self.value = self._average.update(true_range)
+        return self.value
+
+
+class VWAP(object):
+    """streaming vwap(), restarted when the session id changes"""
+
+    def __init__(self):
+        self._session = None
+        self._weighted = 0.0
+        self._volume = 0.0
+        self.value = math.nan
+
+    def update(self, high: float, low: float, close: float, volume: float,
+               session: Optional[int] = None) -> float:
+        if session != self._session:
+            self._session = session
+            self._weighted = 0.0
+            self._volume = 0.0
+        weighted = (high + low + close) / 3.0 * volume
+        if not math.isnan(weighted):
+            self._weighted = self._weighted + weighted
+            self._volume = self._volume + volume
+        self.value = self._weighted / self._volume if self._volume \
+            else math.nan
+        return self.value
+
+
+def _maximum(a: float, b: float) -> float:
+    """np.maximum for scalars: NaN wins"""
+    if a != a or b != b:
+        return math.nan
+    return a if a >= b else b
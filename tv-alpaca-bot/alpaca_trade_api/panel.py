@@ -0,0 +1,182 @@
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from .columnar import ColumnBuffer, timestamps_to_ns
+from .entity_v2 import bar_mapping_v2
+
+# raw bar fields kept in a panel, in the order of its last axis
+BAR_FIELDS = ('o', 'h', 'l', 'c', 'v', 'n', 'vw')
+# what a time without a bar of a symbol becomes:
+#   nan   all fields NaN
+#   ffill prices and vwap are the previous close, volume and trade_count
+#         0. times before the first bar of the symbol stay NaN.
+#   drop  only the times every symbol has a bar for are kept
+FILL_POLICIES = ('nan', 'ffill', 'drop')
+
+
+class BarPanel(object):
+    """
+    bars of several symbols aligned on one time index.
+
+    values is a C-contiguous float64 array of shape
+    (len(symbols), len(index), len(fields)), so a field of every symbol is
+    values[:, :, i] and cross-sectional computations are plain numpy
+    operations, without a groupby or pivot.
+    """
+
+    def __init__(self,
+                 symbols: List[str],
+                 index: pd.DatetimeIndex,
+                 values: np.ndarray,
+                 fields: Iterable[str] = None):
+        self.symbols = list(symbols)
+        self.index = index
+        self.values = values
+        self.fields = list(fields or [bar_mapping_v2[f] for f in BAR_FIELDS])
+        self._df = None
+
+    @classmethod
+    def from_pages(cls,
+                   pages: Iterable[List[dict]],
+                   symbols: List[str] = None,
+                   fill: str = 'nan') -> 'BarPanel':
+        """
+        :param pages: pages of raw multi-symbol bars, each with its 'S'
+        :param symbols: the symbols of the panel, in this order, upper
+               cased like the api returns them. symbols without any bar
+               get all NaN rows. defaults to the symbols found, sorted.
+        :param fill: one of FILL_POLICIES
+        """
+        if fill not in FILL_POLICIES:
+            raise ValueError('unknown fill policy: {}'.format(fill))
+        if symbols is not None:
+            symbols = list(dict.fromkeys(s.upper() for s in symbols))
+        codes = {s: i for i, s in enumerate(symbols or [])}
+        symbol_codes = ColumnBuffer()
+        timestamps = ColumnBuffer()
+        columns = [ColumnBuffer() for _ in BAR_FIELDS]
+        for page in pages:
+            if not page:
+                continue
+            page_codes = []
+            for item in page:
+                code = codes.get(item['S'])
+                if code is None:
+                    if symbols is not None:
+                        raise ValueError(
+                            'unexpected symbol: {}'.format(item['S']))
+                    code = codes[item['S']] = len(codes)
+                page_codes.append(code)
+            symbol_codes.append(np.asarray(page_codes, dtype=np.int64))
+            timestamps.append(timestamps_to_ns([item['t'] for item in page]))
+            for field, column in zip(BAR_FIELDS, columns):
+                column.append(np.array([item.get(field) for item in page],
+                                       dtype=np.float64))
+        rows = symbol_codes.values().astype(np.int64)
+        if symbols is None:
+            symbols = sorted(codes)
+            if len(rows):
+                # renumber the codes in sorted order
+                position = {s: i for i, s in enumerate(symbols)}
+                rows = np.array([position[s] for s in codes])[rows]
+        ns = timestamps.values().astype(np.int64)
+        times = np.unique(ns)
+        values = np.full((len(symbols), len(times), len(BAR_FIELDS)),
+                         np.nan)
+        positions = np.searchsorted(times, ns)
+        for i, column in enumerate(columns):
+            values[rows, positions, i] = column.values()
+        index = pd.DatetimeIndex(times.view('datetime64[ns]'),
+                                 name='timestamp').tz_localize('UTC')
+        panel = cls(symbols, index, values)
+        if fill == 'ffill':
+            panel._forward_fill()
+        elif fill == 'drop':
+            panel = panel._complete_times()
+        return panel
+
+    def field(self, name: str) -> np.ndarray:
+        """(symbols, times) view of a field"""
+        return self.values[:, :, self.fields.index(name)]
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        """a field as a times x symbols frame"""
+        return pd.DataFrame(self.field(name).T, index=self.index,
+                            columns=self.symbols)
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """
+        the panel as a frame indexed by (symbol, timestamp) with a column
+        per field, like the long frame of get_bars with the gaps in place
+        """
+        if self._df is None:
+            index = pd.MultiIndex.from_product([self.symbols, self.index],
+                                               names=['symbol', 'timestamp'])
+            self._df = pd.DataFrame(
+                self.values.reshape(-1, len(self.fields)), index=index,
+                columns=self.fields)
+        return self._df
+
+    def first(self, name: str) -> np.ndarray:
+        """first non NaN value of a field per symbol"""
+        return _edge(self.field(name), last=False)
+
+    def last(self, name: str) -> np.ndarray:
+        """last non NaN value of a field per symbol"""
+        return _edge(self.field(name), last=True)
+
+    def change(self, start: str = 'open', end: str = 'close') -> pd.Series:
+        """
+        relative change per symbol from the first start value to the last
+        end value, e.g. the return over the panel's time range
+        """
+        first = self.first(start)
+        return pd.Series((self.last(end) - first) / first,
+                         index=self.symbols)
+
+    def _forward_fill(self):
+        close = self.fields.index('close')
+        flat = np.isnan(self.values[:, :, close])
+        if not flat.any():
+            return
+        # for every time, the position of the last bar at or before it
+        times = np.arange(len(self.index))
+        last = np.where(flat, 0, times)
+        np.maximum.accumulate(last, axis=1, out=last)
+        has_bar = ~flat
+        seen = np.maximum.accumulate(has_bar, axis=1)
+        gaps = flat & seen
+        rows, cols = np.nonzero(gaps)
+        previous_close = self.values[rows, last[rows, cols], close]
+        for name in ('open', 'high', 'low', 'close', 'vwap'):
+            self.values[rows, cols, self.fields.index(name)] = previous_close
+        for name in ('volume', 'trade_count'):
+            self.values[rows, cols, self.fields.index(name)] = 0
+
+    def _complete_times(self) -> 'BarPanel':
+        complete = ~np.isnan(self.values[:, :, self.fields.index('close')])
+        keep = complete.all(axis=0)
+        return BarPanel(self.symbols, self.index[keep],
+                        np.ascontiguousarray(self.values[:, keep, :]),
+                        self.fields)
+
+    def __repr__(self):
+        return 'BarPanel(symbols={}, times={}, fields={})'.format(
+            len(self.symbols), len(self.index), self.fields)
+
+
+def _edge(values: np.ndarray, last: bool) -> np.ndarray:
+    if not values.shape[1]:
+        return np.full(values.shape[0], np.nan)
+    present = ~np.isnan(values)
+    if last:
+        positions = values.shape[1] - 1 - np.argmax(present[:, ::-1],
+                                                    axis=1)
+    else:
+        positions = np.argmax(present, axis=1)
+    result = values[np.arange(values.shape[0]), positions]
+    result[~present.any(axis=1)] = np.nan
+    return result
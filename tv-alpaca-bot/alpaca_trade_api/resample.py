@@ -0,0 +1,231 @@
+import datetime
+from typing import Iterable, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .entity import NY
+from .rest import TimeFrame, TimeFrameUnit
+
+REGULAR_HOURS = (datetime.time(9, 30), datetime.time(16, 0))
+EXTENDED_HOURS = (datetime.time(4, 0), datetime.time(20, 0))
+_MINUTE = 60 * 10 ** 9
+
+
+class Resampler(object):
+    """
+    builds N-minute, N-hour or session bars from 1-minute bars locally, in
+    one vectorised pass.
+
+    buckets start at the session open and never cross a session boundary:
+    with regular hours, 2-hour bars start at 9:30, 11:30, 13:30 and the
+    last one is 15:30-16:00. minute bars outside of a session are dropped.
+    sessions come from the exchange calendar (REST.get_calendar) when
+    given, otherwise every weekday is taken as a session.
+
+    frames are the ones of BarsV2.df and get_bars_df: a UTC timestamp
+    index, open, high, low, close and volume columns, and optionally
+    trade_count, vwap and symbol. with a symbol column every symbol is
+    resampled separately.
+
+    resample() is stateless. update() keeps the minute bars of the buckets
+    not complete yet and returns only the bars that are, so it can be fed
+    the minute bars of a stream as they arrive.
+    """
+
+    def __init__(self,
+                 timeframe: Union[TimeFrame, int],
+                 calendar: Iterable = None,
+                 extended_hours: bool = False,
+                 base: pd.Timedelta = pd.Timedelta(minutes=1)):
+        """
+        :param timeframe: a TimeFrame of minutes or hours, a day for one
+               bar per session, or a number of minutes (e.g. 90)
+        :param calendar: Calendar entities or raw calendar dicts
+        :param extended_hours: sessions span the extended hours
+               (session_open to session_close, 4:00 to 20:00 by default)
+        :param base: period of the input bars
+        """
+        if isinstance(timeframe, TimeFrame):
+            unit = timeframe.unit
+            if unit == TimeFrameUnit.Minute:
+                minutes = timeframe.amount
+            elif unit == TimeFrameUnit.Hour:
+                minutes = timeframe.amount * 60
+            elif unit == TimeFrameUnit.Day:
+                minutes = None
+            else:
+                raise ValueError('cannot resample to {}'.format(timeframe))
+        else:
+            minutes = int(timeframe)
+            if minutes <= 0:
+                raise ValueError('minutes must be positive')
+        self.width = None if minutes is None else minutes * _MINUTE
+        self.extended_hours = extended_hours
+        self.base = int(pd.Timedelta(base).value)
+        self._sessions = None
+        if calendar is not None:
+            self._sessions = _calendar_sessions(calendar, extended_hours)
+        self._pending = None
+
+    def resample(self, df: pd.DataFrame) -> pd.DataFrame:
+        """the bars of every bucket with at least one minute bar"""
+        ns, codes, order = _sorted(df)
+        frame = df.iloc[order]
+        start, end, inside = self._buckets(ns)
+        return _aggregate(frame[inside], codes[inside], start[inside])
+
+    def update(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        add new minute bars and return the bars completed by them. a
+        bucket is complete once a minute bar at or after its end was seen
+        for the same symbol, or its last minute is in.
+        """
+        if self._pending is not None and len(self._pending):
+            df = pd.concat([self._pending, df])
+        ns, codes, order = _sorted(df)
+        frame = df.iloc[order]
+        start, end, inside = self._buckets(ns)
+        # the latest minute bar of every symbol covers up to seen
+        seen = np.zeros(len(ns), dtype=np.int64)
+        if len(ns):
+            last = np.r_[np.flatnonzero(np.diff(codes)), len(ns) - 1]
+            seen = np.repeat(ns[last] + self.base,
+                             np.diff(np.r_[-1, last]))
+        complete = inside & (end <= seen)
+        self._pending = frame[inside & ~complete]
+        return _aggregate(frame[complete], codes[complete], start[complete])
+
+    def flush(self) -> pd.DataFrame:
+        """the bars of the buckets still incomplete, emptying the state"""
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return _aggregate(pd.DataFrame(), np.empty(0, dtype=np.int64),
+                              np.empty(0, dtype=np.int64))
+        return self.resample(pending)
+
+    def _buckets(self, ns: np.ndarray) -> Tuple[np.ndarray, np.ndarray,
+                                                np.ndarray]:
+        """bucket start and end of every minute, and which are in a
+        session"""
+        if not len(ns):
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0, dtype=bool)
+        opens, closes = self._sessions or _weekday_sessions(
+            ns.min(), ns.max(), self.extended_hours)
+        session = np.searchsorted(opens, ns, side='right') - 1
+        valid = session >= 0
+        session = np.maximum(session, 0)
+        open_ns = opens[session]
+        close_ns = closes[session]
+        inside = valid & (ns < close_ns)
+        if self.width is None:
+            start = open_ns
+            end = close_ns
+        else:
+            start = open_ns + (ns - open_ns) // self.width * self.width
+            end = np.minimum(start + self.width, close_ns)
+        return start, end, inside
+
+
+def _sorted(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """epoch ns and symbol codes of the rows, in (symbol, time) order, and
+    that order"""
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is None:
+        index = index.tz_localize('UTC')
+    ns = np.asarray(index.tz_convert(None), dtype='datetime64[ns]').view(
+        'int64')
+    if 'symbol' in df.columns:
+        codes = pd.factorize(df['symbol'], sort=True)[0].astype(np.int64)
+    else:
+        codes = np.zeros(len(df), dtype=np.int64)
+    order = np.lexsort((ns, codes))
+    return ns[order], codes[order], order
+
+
+def _aggregate(frame: pd.DataFrame, codes: np.ndarray,
+               start: np.ndarray) -> pd.DataFrame:
+    """one bar per run of rows sharing symbol and bucket start"""
+    columns = [c for c in ('open', 'high', 'low', 'close', 'volume',
+                           'trade_count', 'vwap', 'symbol')
+               if c in frame.columns]
+    if not len(frame):
+        # keep the dtypes, so empty results concatenate with the others
+        empty = frame[columns].copy()
+        empty.index = pd.DatetimeIndex([], tz='UTC', name='timestamp')
+        return empty
+    first = np.r_[0, np.flatnonzero((np.diff(start) != 0) |
+                                    (np.diff(codes) != 0)) + 1]
+    last = np.r_[first[1:], len(frame)] - 1
+    data = {}
+    if 'open' in frame:
+        data['open'] = frame['open'].to_numpy()[first]
+    if 'high' in frame:
+        data['high'] = np.maximum.reduceat(frame['high'].to_numpy(), first)
+    if 'low' in frame:
+        data['low'] = np.minimum.reduceat(frame['low'].to_numpy(), first)
+    if 'close' in frame:
+        data['close'] = frame['close'].to_numpy()[last]
+    volume = None
+    if 'volume' in frame:
+        volume = frame['volume'].to_numpy()
+        data['volume'] = np.add.reduceat(volume, first)
+    if 'trade_count' in frame:
+        data['trade_count'] = np.add.reduceat(
+            frame['trade_count'].to_numpy(), first)
+    if 'vwap' in frame and volume is not None:
+        notional = np.add.reduceat(
+            frame['vwap'].to_numpy(dtype=np.float64) * volume, first)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            data['vwap'] = notional / data['volume']
+    if 'symbol' in frame:
+        data['symbol'] = frame['symbol'].to_numpy()[first]
+    index = pd.DatetimeIndex(start[first].view('datetime64[ns]'),
+                             name='timestamp').tz_localize('UTC')
+    return pd.DataFrame(data, index=index, columns=columns)
+
+
+def _to_ns(day: pd.Timestamp, time: datetime.time) -> int:
+    local = pd.Timestamp(datetime.datetime.combine(day.date(), time), tz=NY)
+    return local.tz_convert('UTC').value
+
+
+def _calendar_sessions(calendar: Iterable,
+                       extended_hours: bool) -> Tuple[np.ndarray, np.ndarray]:
+    opens, closes = [], []
+    for day in calendar:
+        raw = getattr(day, '_raw', day)
+        date = pd.Timestamp(raw['date'])
+        if extended_hours:
+            first, last = (_hhmm(raw.get('session_open'), EXTENDED_HOURS[0]),
+                           _hhmm(raw.get('session_close'),
+                                 EXTENDED_HOURS[1]))
+        else:
+            first = pd.Timestamp(raw['open']).time()
+            last = pd.Timestamp(raw['close']).time()
+        opens.append(_to_ns(date, first))
+        closes.append(_to_ns(date, last))
+    order = np.argsort(opens)
+    return (np.asarray(opens, dtype=np.int64)[order],
+            np.asarray(closes, dtype=np.int64)[order])
+
+
+def _weekday_sessions(first_ns: int, last_ns: int,
+                      extended_hours: bool) -> Tuple[np.ndarray, np.ndarray]:
+    hours = EXTENDED_HOURS if extended_hours else REGULAR_HOURS
+    days = pd.date_range(
+        pd.Timestamp(int(first_ns), tz='UTC').tz_convert(NY).normalize()
+        .tz_localize(None) - pd.Timedelta(days=1),
+        pd.Timestamp(int(last_ns), tz='UTC').tz_convert(NY).normalize()
+        .tz_localize(None), freq='B')
+    opens = np.array([_to_ns(d, hours[0]) for d in days], dtype=np.int64)
+    closes = np.array([_to_ns(d, hours[1]) for d in days], dtype=np.int64)
+    return opens, closes
+
+
+def _hhmm(value: Optional[str], default: datetime.time) -> datetime.time:
+    if not value:
+        return default
+    value = value.replace(':', '')
+    return datetime.time(int(value[:2]), int(value[2:4]))
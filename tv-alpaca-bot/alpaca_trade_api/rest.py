@@ -1,10 +1,21 @@
+import functools
+import hashlib
+import itertools
+import json
 import logging
 import os
-from typing import Iterator, List, Optional, Union
+import threading
+import uuid
+from typing import (
+    Any, Callable, Dict, Iterator, List, Optional, Tuple, Union,
+)
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
 import time
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+import pandas as pd
 from alpaca_trade_api import __version__
 from .common import (
     get_base_url,
@@ -12,6 +23,19 @@ from .common import (
     get_credentials,
     get_api_version, URL, FLOAT,
 )
+from .cache import HistoricalCache, ResponseCache
+from .columnar import ColumnarFrameBuilder, compact_frame
+from .concurrency import RateLimiter, SingleFlight, prefetch
+from .cursor import SyncCursor
+from .decoder import JSONDecoder
+from .hooks import (
+    AFTER_RESPONSE, BEFORE_SEND, ON_ERROR, ON_RETRY, Hooks, RequestEvent,
+)
+from .panel import BarPanel
+from .retry import TRANSIENT_ERRORS, RetryPolicy, RetryStats
+from .transport import (
+    Timeout, _env_flag, build_adapter, build_session, get_timeout,
+)
 from .entity import (
     Bar, Entity, Account, AccountConfigurations, AccountActivity,
     Asset, Order, Position, Clock, Calendar,
@@ -20,7 +44,8 @@ from .entity import (
 from .entity_v2 import (
     BarV2, BarsV2, LatestBarsV2, LatestQuotesV2, LatestTradesV2,
     SnapshotV2, SnapshotsV2, TradesV2, TradeV2, QuotesV2, QuoteV2,
-    NewsV2, NewsListV2, OrderbookV2, OrderbooksV2
+    NewsV2, NewsListV2, OrderbookV2, OrderbooksV2,
+    bar_mapping_v2, quote_mapping_v2, trade_mapping_v2, compact_types,
 )
 
 logger = logging.getLogger(__name__)
@@ -37,10 +62,19 @@ NewsIterator = Iterator[Union[NewsV2, dict]]
 
 DATA_V2_MAX_LIMIT = 10000  # max items per api call
 NEWS_MAX_LIMIT = 50  # max items per api call
+ORDERS_MAX_LIMIT = 500  # max orders per api call
+DEFAULT_ORDER_CONCURRENCY = 8
+# multi-symbol latest and snapshot requests are split so the symbols
+# query of each stays well below common url length limits
+SYMBOLS_MAX_CHARS = 2000
+DEFAULT_SYMBOL_CONCURRENCY = 8
 
 
 class RetryException(Exception):
-    pass
+    def __init__(self, *args, response=None, http_error=None):
+        super().__init__(*args)
+        self.response = response
+        self.http_error = http_error
 
 
 class APIError(Exception):
@@ -63,25 +97,81 @@ class APIError(Exception):
         http_error = self._http_error
         if http_error is not None and hasattr(http_error, 'response'):
             return http_error.response.status_code
+        # aiohttp.ClientResponseError, raised by AsyncTradingRest
+        return getattr(http_error, 'status', None)
 
     @property
     def request(self):
         if self._http_error is not None:
-            return self._http_error.request
+            return getattr(self._http_error, 'request',
+                           getattr(self._http_error, 'request_info', None))
 
     @property
     def response(self):
         if self._http_error is not None:
-            return self._http_error.response
+            return getattr(self._http_error, 'response', None)
 
 def raise_api_error(resp: requests.Response, http_error: requests.HTTPError):
+    raise api_error(resp.content, http_error) from None
+
+
+def api_error(body: bytes, http_error: Exception,
+              decode: Callable[[bytes], Any] = json.loads) -> Exception:
+    """
+    the exception of an error response: APIError when the body is an api
+    error message, the http error of the client otherwise
+    """
     try:
-        error = resp.json()
-    except:
-        raise http_error from None
-    if 'message' in error:
-        raise APIError(error, http_error) from None
-    raise http_error from None
+        error = decode(body)
+    except Exception:
+        return http_error
+    if isinstance(error, dict) and 'message' in error:
+        return APIError(error, http_error)
+    return http_error
+
+
+def _decode_response(policy: RetryPolicy, status: int, body: bytes,
+                     response, http_error: Optional[Exception],
+                     retries_left: int, decode: Callable[[bytes], Any]):
+    """
+    the decoded body of a response, shared by REST and AsyncTradingRest.
+    http_error is set for an error status: a retry code raises
+    RetryException while retries are left, the rest their api error.
+    """
+    if http_error is not None:
+        # retry if we hit Rate Limit
+        if policy.should_retry_status(status) and retries_left > 0:
+            raise RetryException(body, response=response,
+                                 http_error=http_error)
+        raise api_error(body, http_error, decode) from None
+    if body:
+        return decode(body)
+    return None
+
+
+def _retry_wait(policy: RetryPolicy, stats: RetryStats, error: Exception,
+                retries_left: int, decode: Callable[[bytes], Any],
+                transient: tuple = TRANSIENT_ERRORS) -> float:
+    """
+    seconds to sleep before the next attempt of a call that failed with
+    error, shared by REST and AsyncTradingRest. a call that gives up is
+    reported to the policy and raises the api error of its last response,
+    or error itself.
+    """
+    if isinstance(error, RetryException):
+        wait = policy.wait_time(stats.retries, error.response)
+        if policy.within_deadline(stats, wait):
+            return wait
+        failure = api_error(error.args[0], error.http_error, decode)
+        policy.give_up(stats, failure)
+        raise failure from None
+    if retries_left > 0 and policy.should_retry_exception(
+            stats.method, error, transient):
+        wait = policy.wait_time(stats.retries)
+        if policy.within_deadline(stats, wait):
+            return wait
+    policy.give_up(stats, error)
+    raise error
 
 
 class TimeFrameUnit(Enum):
@@ -168,22 +258,147 @@ class REST(object):
                  base_url: URL = None,
                  api_version: str = None,
                  oauth=None,
-                 raw_data: bool = False
+                 raw_data: bool = False,
+                 pool_connections: int = None,
+                 pool_maxsize: int = None,
+                 timeout: Timeout = None,
+                 tcp_keepalive: bool = None,
+                 adapter: HTTPAdapter = None,
+                 retry_policy: RetryPolicy = None,
+                 rate_limiter: RateLimiter = None,
+                 cache: HistoricalCache = None,
+                 compact: bool = False,
+                 json_decoder: Callable[[bytes], Any] = None,
+                 response_cache: ResponseCache = None,
+                 coalesce: bool = None,
+                 hooks: Hooks = None,
+                 thread_safe: bool = None,
                  ):
         """
         :param raw_data: should we return api response raw or wrap it with
                          Entity objects.
+        :param pool_connections: number of per-host connection pools to
+               cache (env: APCA_POOL_CONNECTIONS, default 10)
+        :param pool_maxsize: max connections kept per host. should be at
+               least the number of threads sharing this instance
+               (env: APCA_POOL_MAXSIZE, default 32)
+        :param timeout: seconds, or a (connect, read) tuple applied to every
+               request (env: APCA_CONNECT_TIMEOUT / APCA_READ_TIMEOUT,
+               default (10, 30))
+        :param tcp_keepalive: enable TCP keepalive probes on pooled
+               connections (env: APCA_TCP_KEEPALIVE, default on)
+        :param adapter: a requests transport adapter mounted for http and
+               https instead of the default pooled one. pool_connections,
+               pool_maxsize and tcp_keepalive are ignored when given.
+        :param retry_policy: backoff used for rate limited, gateway timeout
+               and failed GET requests. defaults to RetryPolicy.from_env()
+               (env: APCA_RETRY_MAX, APCA_RETRY_WAIT, APCA_RETRY_CAP,
+               APCA_RETRY_DEADLINE, APCA_RETRY_CODES)
+        :param rate_limiter: token bucket shared by the concurrent data
+               fetches of this instance. defaults to RateLimiter.from_env()
+               (env: APCA_RATE_LIMIT requests per minute, default 200)
+        :param cache: on-disk store consulted by get_bars, get_trades and
+               get_quotes before going to the server. only missing time
+               ranges are fetched, and the current session is never cached.
+        :param compact: return trades, quotes and bars as __slots__ records
+               (CompactTradeV2, CompactQuoteV2, CompactBarV2) instead of
+               dict backed entities. they take about a tenth of the memory,
+               and their timestamp is epoch nanoseconds.
+        :param json_decoder: callable decoding a response body from bytes.
+               defaults to JSONDecoder.from_env(), which uses orjson,
+               msgspec or ujson when installed
+               (env: APCA_JSON_DECODER, default auto)
+        :param response_cache: cache of slowly changing endpoints (assets,
+               calendar, clock, account configurations, watchlists), kept
+               per path for a ttl and invalidated by writes to the same
+               resource. off unless given.
+        :param coalesce: let concurrent identical GETs share one request
+               and its result: the callers receive the same objects and
+               must not modify them (env: APCA_COALESCE_GETS, default off)
+        :param hooks: request lifecycle hooks (before_send, after_response,
+               on_retry, on_error), e.g. a registered MetricsCollector.
+               also created on first access of the hooks property.
+        :param thread_safe: give every thread using this instance its own
+               requests session. the sessions share one connection pool.
+               use it when threads share the instance
+               (env: APCA_THREAD_SAFE, default off)
         """
         self._key_id, self._secret_key, self._oauth = get_credentials(
             key_id, secret_key, oauth)
         self._base_url: URL = URL(base_url or get_base_url())
         self._api_version = get_api_version(api_version)
-        self._session = requests.Session()
+        self._adapter = adapter or build_adapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            tcp_keepalive=tcp_keepalive)
+        self._session = build_session(adapter=self._adapter)
+        if thread_safe is None:
+            thread_safe = _env_flag('APCA_THREAD_SAFE', False)
+        self._local = None
+        if thread_safe:
+            # requests.Session is not documented as thread safe (cookies,
+            # mounts and hooks are plain attributes), the adapter's urllib3
+            # pool manager is
+            self._local = threading.local()
+            self._local.session = self._session
+        self._timeout = get_timeout(timeout)
         self._use_raw_data = raw_data
-        self._retry = int(os.environ.get('APCA_RETRY_MAX', 3))
-        self._retry_wait = int(os.environ.get('APCA_RETRY_WAIT', 3))
-        self._retry_codes = [int(o) for o in os.environ.get(
-            'APCA_RETRY_CODES', '429,504').split(',')]
+        self._retry_policy = retry_policy or RetryPolicy.from_env()
+        self._rate_limiter = rate_limiter or RateLimiter.from_env()
+        self._data_prefetch = int(os.environ.get('APCA_DATA_PREFETCH', 0))
+        self._cache = cache
+        self._compact = compact
+        self._decode = json_decoder or JSONDecoder.from_env()
+        self._response_cache = response_cache
+        if coalesce is None:
+            coalesce = _env_flag('APCA_COALESCE_GETS', False)
+        self._single_flight = SingleFlight() if coalesce else None
+        self._hooks = hooks
+
+    @property
+    def hooks(self) -> Hooks:
+        """
+        the request lifecycle hooks. requests carry no hook overhead until
+        this is first used.
+        """
+        if self._hooks is None:
+            self._hooks = Hooks()
+        return self._hooks
+
+    def _thread_session(self) -> requests.Session:
+        """the session of the calling thread in thread safe mode"""
+        local = self._local
+        if local is None:
+            return self._session
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = build_session(adapter=self._adapter)
+        return session
+
+    # kept for backwards compatibility, these map onto the retry policy
+    @property
+    def _retry(self):
+        return self._retry_policy.max_retries
+
+    @_retry.setter
+    def _retry(self, value: int):
+        self._retry_policy.max_retries = max(int(value), 0)
+
+    @property
+    def _retry_wait(self):
+        return self._retry_policy.base
+
+    @_retry_wait.setter
+    def _retry_wait(self, value: float):
+        self._retry_policy.base = value
+
+    @property
+    def _retry_codes(self):
+        return self._retry_policy.retry_codes
+
+    @_retry_codes.setter
+    def _retry_codes(self, value: List[int]):
+        self._retry_policy.retry_codes = list(value)
 
     def _request(self,
                  method,
@@ -208,47 +423,98 @@ class REST(object):
             # uncanny issues in non-GET request redirecting http->https.
             # It's better to fail early if the URL isn't right.
             'allow_redirects': False,
+            'timeout':         self._timeout,
         }
         if method.upper() in ['GET', 'DELETE']:
             opts['params'] = data
         else:
             opts['json'] = data
 
-        retry = self._retry
-        if retry < 0:
-            retry = 0
-        while retry >= 0:
+        cache = self._response_cache
+        if cache is not None:
+            if method.upper() != 'GET':
+                try:
+                    return self._send(method, url, opts)
+                finally:
+                    cache.invalidate(path)
+            if cache.ttl(path) > 0:
+                key = cache.key(base_url + '/' + version, path, data)
+                found, value = cache.get(key)
+                if found:
+                    return value
+                value = self._get(url, opts, data)
+                cache.put(key, value, cache.ttl(path))
+                return value
+        if method.upper() == 'GET':
+            return self._get(url, opts, data)
+        return self._send(method, url, opts)
+
+    def _get(self, url: URL, opts: dict, params: dict = None):
+        """GET, sharing the call with identical GETs already in flight"""
+        if self._single_flight is None:
+            return self._send('GET', url, opts)
+        key = (url, _params_key(params))
+        return self._single_flight.do(
+            key, functools.partial(self._send, 'GET', url, opts))
+
+    def _send(self, method: str, url: URL, opts: dict):
+        """one api call, retried according to the retry policy"""
+        policy = self._retry_policy
+        stats = RetryStats(method, url)
+        hooks = self._hooks
+        event = None
+        while True:
+            retry = policy.max_retries - stats.retries
+            if hooks is not None:
+                event = RequestEvent(method, url, stats.retries)
             try:
-                return self._one_request(method, url, opts, retry)
-            except RetryException:
-                retry_wait = self._retry_wait
-                logger.warning(
-                    'sleep {} seconds and retrying {} '
-                    '{} more time(s)...'.format(
-                        retry_wait, url, retry))
-                time.sleep(retry_wait)
-                retry -= 1
-                continue
-
-    def _one_request(self, method: str, url: URL, opts: dict, retry: int):
+                result = self._one_request(method, url, opts, retry, event)
+            except Exception as e:
+                try:
+                    wait = _retry_wait(policy, stats, e, retry, self._decode)
+                except Exception as failure:
+                    if event is not None:
+                        event.failed(failure)
+                        hooks.emit(ON_ERROR, event)
+                    raise
+                error = e.http_error if isinstance(e, RetryException) else e
+            else:
+                policy.report(stats)
+                return result
+            if event is not None:
+                event.failed(error)
+                event.wait = wait
+                hooks.emit(ON_RETRY, event)
+            policy.retrying(stats, wait, retry)
+            time.sleep(wait)
+
+    def _one_request(self, method: str, url: URL, opts: dict, retry: int,
+                     event: RequestEvent = None):
         """
         Perform one request, possibly raising RetryException in the case
-        the response is 429. Otherwise, if error text contain "code" string,
-        then it decodes to json object and returns APIError.
+        the response status is one of the retry codes. Otherwise, if error
+        text contain "code" string, then it decodes to json object and
+        returns APIError.
         Returns the body json in the 200 status.
         """
-        retry_codes = self._retry_codes
-        resp = self._session.request(method, url, **opts)
+        session = self._thread_session()
+        if event is None:
+            resp = session.request(method, url, **opts)
+        else:
+            self._hooks.emit(BEFORE_SEND, event)
+            event.sent()
+            resp = session.request(method, url, **opts)
+            event.received(resp)
+            self._hooks.emit(AFTER_RESPONSE, event)
         try:
             resp.raise_for_status()
-        except HTTPError as http_error:
-            # retry if we hit Rate Limit
-            if resp.status_code in retry_codes and retry > 0:
-                raise RetryException()
-            raise_api_error(resp, http_error)
-        if resp.text != '':
-            return resp.json()
-        return None
+            http_error = None
+        except HTTPError as e:
+            http_error = e
+        # decode the raw bytes once, resp.text would decode them to str first
+        return _decode_response(self._retry_policy, resp.status_code,
+                                resp.content, resp, http_error, retry,
+                                self._decode)
 
     def get(self, path, data=None):
         return self._request('GET', path, data)
@@ -269,8 +535,7 @@ class REST(object):
                  feed: Optional[str] = None, api_version='v1'):
         base_url: URL = get_data_url()
         if feed:
-            data = data or {}
-            data['feed'] = feed
+            data = dict(data or {}, feed=feed)
         return self._request(
             'GET', path, data, base_url=base_url, api_version=api_version,
         )
@@ -334,24 +599,8 @@ class REST(object):
         :param symbols: list of str (symbols)
         :param side: Lets you filter to only 'buy' or 'sell' orders
         """
-        if params is None:
-            params = dict()
-        if limit is not None:
-            params['limit'] = limit
-        if after is not None:
-            params['after'] = after
-        if until is not None:
-            params['until'] = until
-        if direction is not None:
-            params['direction'] = direction
-        if status is not None:
-            params['status'] = status
-        if nested is not None:
-            params['nested'] = nested
-        if side is not None:
-            params['side'] = side
-        if symbols is not None:
-            params['symbols'] = ",".join(symbols)
+        params = _list_orders_params(status, limit, after, until, direction,
+                                     params, nested, symbols, side)
         url = '/orders'
         resp = self.get(url, params)
         if self._use_raw_data:
@@ -359,6 +608,78 @@ class REST(object):
         else:
             return [self.response_wrapper(o, Order) for o in resp]
 
+    def list_orders_iter(self,
+                         status: str = 'all',
+                         after: str = None,
+                         until: str = None,
+                         direction: str = 'asc',
+                         nested: bool = None,
+                         symbols: List[str] = None,
+                         side: str = None,
+                         page_size: int = ORDERS_MAX_LIMIT,
+                         cursor: SyncCursor = None,
+                         cursor_key: str = 'orders',
+                         ) -> Iterator[Order]:
+        """
+        every order submitted between after and until, oldest first by
+        default, requested page by page and yielded as they arrive.
+        list_orders returns at most 500.
+
+        the window of the next page starts at the submitted_at of the last
+        order received, orders sharing that timestamp are not repeated.
+        more than page_size orders submitted at the same timestamp cannot
+        be paged through this way: the iteration stops at that timestamp,
+        logging a warning, and the orders after it are missed. a bigger
+        page_size avoids that.
+
+        :param page_size: orders per request, at most 500
+        :param cursor: resume after the orders of the previous run and
+               record the new high-watermark after every page. requires
+               direction asc.
+        :param cursor_key: name of the watermark in cursor
+        """
+        ascending = direction == 'asc'
+        seen = set()  # ids of the orders at the edge of the window
+        if cursor is not None:
+            if not ascending:
+                raise ValueError('a cursor needs direction asc')
+            state = cursor.get(cursor_key) or {}
+            after = state.get('after', after)
+            seen = set(state.get('ids', []))
+        edge = after if ascending else until
+        while True:
+            # the bounds are exclusive, widen them to include the orders
+            # submitted at the edge and skip those already seen
+            window = _shift_timestamp(edge, -1 if ascending else 1)
+            params = _list_orders_params(
+                status, page_size,
+                after=window if ascending else after,
+                until=until if ascending else window,
+                direction=direction, nested=nested, symbols=symbols,
+                side=side)
+            page = self.get('/orders', params)
+            new = [o for o in page if o['id'] not in seen]
+            for order in new:
+                yield self.response_wrapper(order, Order)
+            if new:
+                last = new[-1]['submitted_at']
+                if last != edge:
+                    seen = set()
+                edge = last
+                seen.update(o['id'] for o in new
+                            if o['submitted_at'] == edge)
+                if cursor is not None:
+                    cursor.set(cursor_key, {'after': edge,
+                                            'ids': sorted(seen)})
+            if len(page) < page_size:
+                return
+            if not new:
+                logger.warning(
+                    'more than {} orders submitted at {}: list_orders_iter '
+                    'cannot page past them, the orders after them are not '
+                    'listed. use a bigger page_size.'.format(page_size, edge))
+                return
+
     def submit_order(self,
                      symbol: str,
                      qty: float = None,
@@ -396,40 +717,10 @@ class REST(object):
         :param notional: float. Mutually exclusive with "qty".
         """
         """Request a new order"""
-        params = {
-            'symbol':        symbol,
-            'side':          side,
-            'type':          type,
-            'time_in_force': time_in_force
-        }
-        if qty is not None:
-            params['qty'] = qty
-        if notional is not None:
-            params['notional'] = notional
-        if limit_price is not None:
-            params['limit_price'] = FLOAT(limit_price)
-        if stop_price is not None:
-            params['stop_price'] = FLOAT(stop_price)
-        if client_order_id is not None:
-            params['client_order_id'] = client_order_id
-        if extended_hours is not None:
-            params['extended_hours'] = extended_hours
-        if order_class is not None:
-            params['order_class'] = order_class
-        if take_profit is not None:
-            if 'limit_price' in take_profit:
-                take_profit['limit_price'] = FLOAT(take_profit['limit_price'])
-            params['take_profit'] = take_profit
-        if stop_loss is not None:
-            if 'limit_price' in stop_loss:
-                stop_loss['limit_price'] = FLOAT(stop_loss['limit_price'])
-            if 'stop_price' in stop_loss:
-                stop_loss['stop_price'] = FLOAT(stop_loss['stop_price'])
-            params['stop_loss'] = stop_loss
-        if trail_price is not None:
-            params['trail_price'] = trail_price
-        if trail_percent is not None:
-            params['trail_percent'] = trail_percent
+        params = _submit_order_params(
+            symbol, qty, side, type, time_in_force, limit_price, stop_price,
+            client_order_id, extended_hours, order_class, take_profit,
+            stop_loss, trail_price, trail_percent, notional)
         resp = self.post('/orders', params)
         return self.response_wrapper(resp, Order)
 
@@ -471,19 +762,8 @@ class REST(object):
         note: you cannot replace type of order. so, it was trailing_stop(e.g)
               it will remain trailing_stop.
         """
-        params = {}
-        if qty is not None:
-            params['qty'] = qty
-        if limit_price is not None:
-            params['limit_price'] = FLOAT(limit_price)
-        if stop_price is not None:
-            params['stop_price'] = FLOAT(stop_price)
-        if trail is not None:
-            params['trail'] = FLOAT(trail)
-        if time_in_force is not None:
-            params['time_in_force'] = time_in_force
-        if client_order_id is not None:
-            params['client_order_id'] = client_order_id
+        params = _replace_order_params(qty, limit_price, stop_price, trail,
+                                       time_in_force, client_order_id)
         resp = self.patch('/orders/{}'.format(order_id), params)
         return self.response_wrapper(resp, Order)
 
@@ -495,6 +775,106 @@ class REST(object):
         """Cancel all open orders"""
         self.delete('/orders')
 
+    def submit_orders(self,
+                      specs: List[dict],
+                      concurrency: int = None,
+                      batch_id: str = None,
+                      ) -> List[Union[Order, Exception]]:
+        """
+        submit many orders at once, up to `concurrency` in flight, each
+        request waiting on the rate limiter of this instance.
+
+        orders without a client_order_id get one derived from batch_id,
+        the position in specs and the spec itself. every call gets a new
+        batch_id unless one is given: to retry a batch after a partial
+        failure, pass the batch_id of the first attempt. the retry then
+        cannot place an order twice: the server rejects the reused id, and
+        the order it already has is returned instead.
+
+        :param specs: keyword arguments of submit_order, one dict per order
+        :param concurrency: max orders submitted in parallel
+               (env: APCA_ORDER_CONCURRENCY, default 8)
+        :param batch_id: identifies the batch, e.g. the signal that
+               produced it. the same batch_id and specs give the same ids.
+               defaults to a random one, so that repeating a basket places
+               it again.
+        :return: per spec, the Order (or raw dict) or the exception raised,
+                 in the order of specs
+        """
+        specs = [dict(spec) for spec in specs]
+        if batch_id is None:
+            batch_id = uuid.uuid4().hex
+        for i, spec in enumerate(specs):
+            if not spec.get('client_order_id'):
+                spec['client_order_id'] = _client_order_id(batch_id, i, spec)
+        return self._bulk(self._submit_once, specs, concurrency)
+
+    def _submit_once(self, spec: dict):
+        self._rate_limiter.acquire()
+        try:
+            return self.submit_order(**spec)
+        except APIError as e:
+            # 422 is what a reused client_order_id gets
+            if e.status_code != 422:
+                raise
+            try:
+                self._rate_limiter.acquire()
+                return self.get_order_by_client_order_id(
+                    spec['client_order_id'])
+            except APIError:
+                raise e from None
+
+    def cancel_orders(self,
+                      order_ids: List[str] = None,
+                      symbols: List[str] = None,
+                      concurrency: int = None,
+                      ) -> Dict[str, Optional[Exception]]:
+        """
+        cancel a set of orders, up to `concurrency` in flight, each request
+        waiting on the rate limiter of this instance.
+
+        :param order_ids: ids of the orders to cancel
+        :param symbols: also cancel every open order of these symbols
+        :param concurrency: max cancellations in parallel
+               (env: APCA_ORDER_CONCURRENCY, default 8)
+        :return: order id -> None when cancelled or the exception raised,
+                 in the order of order_ids followed by the open orders found
+                 for symbols
+        """
+        ids = list(dict.fromkeys(order_ids or []))
+        if symbols:
+            self._rate_limiter.acquire()
+            open_orders = self.get('/orders', _list_orders_params(
+                status='open', limit=500, symbols=symbols))
+            ids.extend(o['id'] for o in open_orders if o['id'] not in ids)
+        results = self._bulk(self._cancel_once, ids, concurrency)
+        return dict(zip(ids, results))
+
+    def _cancel_once(self, order_id: str):
+        self._rate_limiter.acquire()
+        self.cancel_order(order_id)
+
+    def _bulk(self, fn, items: list, concurrency: int = None) -> list:
+        """fn(item) for every item in parallel, results or exceptions in
+        the order of items"""
+        if concurrency is None:
+            concurrency = int(os.environ.get('APCA_ORDER_CONCURRENCY',
+                                             DEFAULT_ORDER_CONCURRENCY))
+
+        def call(item):
+            try:
+                return fn(item)
+            except Exception as e:
+                return e
+
+        if not items:
+            return []
+        if concurrency <= 1 or len(items) == 1:
+            return [call(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(items)),
+                                thread_name_prefix='alpaca-orders') as pool:
+            return list(pool.map(call, items))
+
     def list_positions(self) -> Positions:
         """Get a list of open positions"""
         resp = self.get('/positions')
@@ -553,6 +933,48 @@ class REST(object):
         resp = self.get('/assets/{}'.format(symbol))
         return self.response_wrapper(resp, Asset)
 
+    def _by_symbol_chunks(self,
+                          path: str,
+                          symbols: Union[str, List[str]],
+                          key: str = None,
+                          feed: Optional[str] = None,
+                          api_version: str = 'v2',
+                          concurrency: int = None) -> dict:
+        """
+        GET a multi-symbol latest or snapshot endpoint. long symbol lists
+        are split in chunks (see SYMBOLS_MAX_CHARS) requested concurrently,
+        and the per symbol results of all chunks are merged into one dict.
+
+        :param key: field of the response holding the results by symbol,
+               None when the response is that dict itself
+        :param concurrency: chunks requested at once
+               (env: APCA_SYMBOL_CONCURRENCY, default 8)
+        """
+        def fetch(chunk):
+            resp = self.data_get(path, data={'symbols': chunk}, feed=feed,
+                                 api_version=api_version)
+            return (resp.get(key) if key else resp) or {}
+
+        if isinstance(symbols, str):
+            return fetch(symbols)
+        chunks = _symbol_chunks(list(dict.fromkeys(symbols)))
+        if len(chunks) == 1:
+            return fetch(chunks[0])
+        if concurrency is None:
+            concurrency = int(os.environ.get('APCA_SYMBOL_CONCURRENCY',
+                                             DEFAULT_SYMBOL_CONCURRENCY))
+
+        def fetch_limited(chunk):
+            self._rate_limiter.acquire()
+            return fetch(chunk)
+
+        merged = {}
+        with ThreadPoolExecutor(max(min(concurrency, len(chunks)), 1),
+                                thread_name_prefix='alpaca-symbols') as pool:
+            for result in pool.map(fetch_limited, chunks):
+                merged.update(result)
+        return merged
+
     def _data_get(self,
                   endpoint: str,
                   symbol_or_symbols: Union[str, List[str]],
@@ -563,7 +985,78 @@ class REST(object):
                   feed: Optional[str] = None,
                   asof: Optional[str] = None,
                   loc: Optional[str] = None,
+                  concurrency: Optional[int] = None,
+                  rate_limiter: Optional[RateLimiter] = None,
+                  prefetch_pages: Optional[int] = None,
                   **kwargs):
+        if concurrency and concurrency > 1:
+            yield from self._data_get_parallel(
+                endpoint, symbol_or_symbols, concurrency,
+                api_version=api_version,
+                endpoint_base=endpoint_base,
+                resp_grouped_by_symbol=resp_grouped_by_symbol,
+                page_limit=page_limit,
+                feed=feed,
+                asof=asof,
+                loc=loc,
+                **kwargs)
+            return
+        pages = self._data_get_pages(
+            endpoint, symbol_or_symbols,
+            api_version=api_version,
+            endpoint_base=endpoint_base,
+            resp_grouped_by_symbol=resp_grouped_by_symbol,
+            page_limit=page_limit,
+            feed=feed,
+            asof=asof,
+            loc=loc,
+            rate_limiter=rate_limiter,
+            prefetch_pages=prefetch_pages,
+            **kwargs)
+        for page in pages:
+            yield from page
+
+    def _data_get_pages(self,
+                        endpoint: str,
+                        symbol_or_symbols: Union[str, List[str]],
+                        page_limit: int = DATA_V2_MAX_LIMIT,
+                        concurrency: Optional[int] = None,
+                        prefetch_pages: Optional[int] = None,
+                        **kwargs) -> Iterator[List[dict]]:
+        """
+        The items of _data_get, as lists of up to page_limit items.
+        """
+        if concurrency and concurrency > 1:
+            items = self._data_get(endpoint, symbol_or_symbols,
+                                   page_limit=page_limit,
+                                   concurrency=concurrency,
+                                   **kwargs)
+            return _batched(items, page_limit)
+        pages = self._data_pages(endpoint, symbol_or_symbols,
+                                 page_limit=page_limit, **kwargs)
+        if prefetch_pages is None:
+            prefetch_pages = self._data_prefetch
+        if prefetch_pages > 0:
+            # the next pages are requested while the caller is still
+            # processing the current one
+            pages = prefetch(pages, prefetch_pages)
+        return pages
+
+    def _data_pages(self,
+                    endpoint: str,
+                    symbol_or_symbols: Union[str, List[str]],
+                    api_version: str = 'v2',
+                    endpoint_base: str = 'stocks',
+                    resp_grouped_by_symbol: Optional[bool] = None,
+                    page_limit: int = DATA_V2_MAX_LIMIT,
+                    feed: Optional[str] = None,
+                    asof: Optional[str] = None,
+                    loc: Optional[str] = None,
+                    rate_limiter: Optional[RateLimiter] = None,
+                    **kwargs) -> Iterator[List[dict]]:
+        """
+        Walk next_page_token and yield the items of every page as a list.
+        """
         page_token = None
         total_items = 0
         limit = kwargs.get('limit')
@@ -577,7 +1070,9 @@ class REST(object):
                 actual_limit = min(int(limit) - total_items, page_limit)
                 if actual_limit < 1:
                     break
-            data = kwargs
+            # a new dict per page: the params of a request in flight, or
+            # of a coalesced one, must not change under it
+            data = dict(kwargs)
             data['limit'] = actual_limit
             data['page_token'] = page_token
             path = f'/{endpoint_base}'
@@ -591,24 +1086,150 @@ class REST(object):
                 data['asof'] = asof
             if endpoint:
                 path += f'/{endpoint}'
+            if rate_limiter is not None:
+                rate_limiter.acquire()
             resp = self.data_get(path, data=data, feed=feed,
                                  api_version=api_version)
             if not resp_grouped_by_symbol:
                 k = endpoint or endpoint_base
-                for item in resp.get(k, []) or []:
-                    yield item
-                    total_items += 1
+                page = resp.get(k, []) or []
             else:
+                page = []
                 by_symbol = resp.get(endpoint, {}) or {}
                 for sym, items in sorted(by_symbol.items()):
                     for item in items or []:
                         item['S'] = sym
-                        yield item
-                        total_items += 1
+                        page.append(item)
+            total_items += len(page)
+            yield page
             page_token = resp.get('next_page_token')
             if not page_token:
                 break
 
+    def _data_get_parallel(self,
+                           endpoint: str,
+                           symbol_or_symbols: Union[str, List[str]],
+                           concurrency: int,
+                           api_version: str = 'v2',
+                           resp_grouped_by_symbol: Optional[bool] = None,
+                           **kwargs):
+        """
+        Same items, in the same order, as the sequential _data_get, but the
+        request is split in shards by symbol group and by time range which
+        are fetched concurrently. Shards are submitted in output order and
+        at most 2 * concurrency of them are buffered at once.
+        """
+        is_multi_symbol = api_version == 'v1beta3' or \
+            not isinstance(symbol_or_symbols, str)
+        if resp_grouped_by_symbol is None:
+            resp_grouped_by_symbol = is_multi_symbol
+        if is_multi_symbol:
+            symbols = sorted(set([symbol_or_symbols]
+                                 if isinstance(symbol_or_symbols, str)
+                                 else symbol_or_symbols))
+            groups = _chunks(symbols, concurrency)
+        else:
+            groups = [symbol_or_symbols]
+        ranges = [(kwargs.get('start'), kwargs.get('end'))]
+        if _can_split_time(kwargs):
+            n_ranges = -(-concurrency // len(groups))
+            ranges = _split_time_range(kwargs['start'], kwargs['end'],
+                                       n_ranges)
+            if kwargs.get('sort') in (Sort.Desc, Sort.Desc.value):
+                ranges.reverse()
+        limit = kwargs.get('limit')
+
+        # set when the consumer stops early: running shards stop paging
+        stop = threading.Event()
+
+        def fetch(group, time_range):
+            shard_kwargs = dict(kwargs)
+            shard_kwargs['start'], shard_kwargs['end'] = time_range
+            items = []
+            for item in self._data_get(
+                    endpoint, group,
+                    api_version=api_version,
+                    resp_grouped_by_symbol=resp_grouped_by_symbol,
+                    rate_limiter=self._rate_limiter,
+                    **shard_kwargs):
+                if stop.is_set():
+                    break
+                items.append(item)
+            return items
+
+        total_items = 0
+        executor = ThreadPoolExecutor(concurrency)
+        pending = []
+        try:
+            shards = ((g, r) for g in groups for r in ranges)
+            for group in groups:
+                while len(pending) < len(ranges) + 2 * concurrency:
+                    shard = next(shards, None)
+                    if shard is None:
+                        break
+                    pending.append(executor.submit(fetch, *shard))
+                results = [f.result() for f in pending[:len(ranges)]]
+                del pending[:len(ranges)]
+                for item in _merge_shards(results, resp_grouped_by_symbol):
+                    yield item
+                    total_items += 1
+                    if limit and total_items >= int(limit):
+                        return
+        finally:
+            # on early exit (limit, close, error) do not wait for the
+            # shards: queued ones are cancelled, running ones stop at their
+            # next item. cancelling every pending future is what
+            # shutdown(cancel_futures=True) does, which needs python 3.9
+            stop.set()
+            for f in pending:
+                f.cancel()
+            executor.shutdown(wait=False)
+
+    def _cacheable(self, start, limit, asof) -> bool:
+        # a limited or as-of request is not a plain slice of the history
+        return self._cache is not None and start is not None and \
+            not limit and not asof
+
+    def _cached_data_get(self,
+                         endpoint: str,
+                         symbol_or_symbols: Union[str, List[str]],
+                         start: str,
+                         end: Optional[str],
+                         sort: Optional[Sort],
+                         feed: Optional[str] = None,
+                         timeframe: TimeFrame = None,
+                         adjustment: str = None,
+                         concurrency: Optional[int] = None) -> List[dict]:
+        """
+        _data_get served from the historical cache, symbol by symbol, in
+        the order the server would return them.
+        """
+        def fetch(symbol, lo, hi):
+            extra = {}
+            if timeframe is not None:
+                extra = dict(timeframe=timeframe, adjustment=adjustment)
+            return list(self._data_get(endpoint, symbol, start=lo, end=hi,
+                                       feed=feed, concurrency=concurrency,
+                                       **extra))
+
+        descending = sort in (Sort.Desc, Sort.Desc.value)
+        is_multi_symbol = not isinstance(symbol_or_symbols, str)
+        symbols = sorted(set(symbol_or_symbols)) if is_multi_symbol \
+            else [symbol_or_symbols]
+        result = []
+        for symbol in symbols:
+            items = self._cache.fetch(
+                endpoint, symbol, start, end, fetch,
+                timeframe=str(timeframe) if timeframe else '',
+                adjustment=adjustment or '',
+                feed=feed or '',
+                descending=descending)
+            if is_multi_symbol:
+                for item in items:
+                    item['S'] = symbol
+            result.extend(items)
+        return result
+
     def get_trades_iter(self,
                         symbol: Union[str, List[str]],
                         start: Optional[str] = None,
@@ -617,7 +1238,18 @@ class REST(object):
                         feed: Optional[str] = None,
                         asof: Optional[str] = None,
                         sort: Optional[Sort] = None,
-                        raw=False) -> TradeIterator:
+                        raw=False,
+                        concurrency: Optional[int] = None,
+                        prefetch_pages: Optional[int] = None,
+                        ) -> TradeIterator:
+        """
+        :param concurrency: fetch with this many parallel requests, split
+               by symbol group and time range. the order of the items is
+               the same as with sequential paging.
+        :param prefetch_pages: number of pages requested in the background
+               while the current one is consumed
+               (env: APCA_DATA_PREFETCH, default 0)
+        """
         trades = self._data_get('trades', symbol,
                                 start=start,
                                 end=end,
@@ -625,6 +1257,8 @@ class REST(object):
                                 feed=feed,
                                 asof=asof,
                                 sort=sort,
+                                concurrency=concurrency,
+                                prefetch_pages=prefetch_pages,
                                 )
         for trade in trades:
             if raw:
@@ -640,7 +1274,13 @@ class REST(object):
                    feed: Optional[str] = None,
                    asof: Optional[str] = None,
                    sort: Optional[Sort] = None,
+                   concurrency: Optional[int] = None,
                    ) -> TradesV2:
+        if self._cacheable(start, limit, asof):
+            trades = self._cached_data_get(
+                'trades', symbol, start, end, sort,
+                feed=feed, concurrency=concurrency)
+            return TradesV2(trades, compact=self._compact)
         trades = list(self.get_trades_iter(symbol,
                                            start=start,
                                            end=end,
@@ -648,8 +1288,41 @@ class REST(object):
                                            feed=feed,
                                            asof=asof,
                                            sort=sort,
-                                           raw=True))
-        return TradesV2(trades)
+                                           raw=True,
+                                           concurrency=concurrency))
+        return TradesV2(trades, compact=self._compact)
+
+    def get_trades_df(self,
+                      symbol: Union[str, List[str]],
+                      start: Optional[str] = None,
+                      end: Optional[str] = None,
+                      limit: int = None,
+                      feed: Optional[str] = None,
+                      asof: Optional[str] = None,
+                      sort: Optional[Sort] = None,
+                      concurrency: Optional[int] = None,
+                      prefetch_pages: Optional[int] = None,
+                      compact_dtypes: bool = False,
+                      ) -> pd.DataFrame:
+        """
+        get_trades(...).df, built column by column straight from the
+        response pages without creating an entity per trade.
+
+        :param compact_dtypes: categorical symbols, exchanges and
+               conditions, float32 prices and int32 sizes where lossless
+               (see columnar.compact_frame)
+        """
+        pages = self._data_get_pages('trades', symbol,
+                                     start=start,
+                                     end=end,
+                                     limit=limit,
+                                     feed=feed,
+                                     asof=asof,
+                                     sort=sort,
+                                     concurrency=concurrency,
+                                     prefetch_pages=prefetch_pages)
+        df = ColumnarFrameBuilder(trade_mapping_v2).add_pages(pages).to_df()
+        return compact_frame(df) if compact_dtypes else df
 
     def get_quotes_iter(self,
                         symbol: Union[str, List[str]],
@@ -659,7 +1332,18 @@ class REST(object):
                         feed: Optional[str] = None,
                         asof: Optional[str] = None,
                         sort: Optional[Sort] = None,
-                        raw=False) -> QuoteIterator:
+                        raw=False,
+                        concurrency: Optional[int] = None,
+                        prefetch_pages: Optional[int] = None,
+                        ) -> QuoteIterator:
+        """
+        :param concurrency: fetch with this many parallel requests, split
+               by symbol group and time range. the order of the items is
+               the same as with sequential paging.
+        :param prefetch_pages: number of pages requested in the background
+               while the current one is consumed
+               (env: APCA_DATA_PREFETCH, default 0)
+        """
         quotes = self._data_get('quotes', symbol,
                                 start=start,
                                 end=end,
@@ -667,6 +1351,8 @@ class REST(object):
                                 feed=feed,
                                 asof=asof,
                                 sort=sort,
+                                concurrency=concurrency,
+                                prefetch_pages=prefetch_pages,
                                 )
         for quote in quotes:
             if raw:
@@ -682,7 +1368,13 @@ class REST(object):
                    feed: Optional[str] = None,
                    asof: Optional[str] = None,
                    sort: Optional[Sort] = None,
+                   concurrency: Optional[int] = None,
                    ) -> QuotesV2:
+        if self._cacheable(start, limit, asof):
+            quotes = self._cached_data_get(
+                'quotes', symbol, start, end, sort,
+                feed=feed, concurrency=concurrency)
+            return QuotesV2(quotes, compact=self._compact)
         quotes = list(self.get_quotes_iter(symbol=symbol,
                                            start=start,
                                            end=end,
@@ -691,8 +1383,41 @@ class REST(object):
                                            raw=True,
                                            asof=asof,
                                            sort=sort,
+                                           concurrency=concurrency,
                                            ))
-        return QuotesV2(quotes)
+        return QuotesV2(quotes, compact=self._compact)
+
+    def get_quotes_df(self,
+                      symbol: Union[str, List[str]],
+                      start: Optional[str] = None,
+                      end: Optional[str] = None,
+                      limit: int = None,
+                      feed: Optional[str] = None,
+                      asof: Optional[str] = None,
+                      sort: Optional[Sort] = None,
+                      concurrency: Optional[int] = None,
+                      prefetch_pages: Optional[int] = None,
+                      compact_dtypes: bool = False,
+                      ) -> pd.DataFrame:
+        """
+        get_quotes(...).df, built column by column straight from the
+        response pages without creating an entity per quote.
+
+        :param compact_dtypes: categorical symbols, exchanges and
+               conditions, float32 prices and int32 sizes where lossless
+               (see columnar.compact_frame)
+        """
+        pages = self._data_get_pages('quotes', symbol,
+                                     start=start,
+                                     end=end,
+                                     limit=limit,
+                                     feed=feed,
+                                     asof=asof,
+                                     sort=sort,
+                                     concurrency=concurrency,
+                                     prefetch_pages=prefetch_pages)
+        df = ColumnarFrameBuilder(quote_mapping_v2).add_pages(pages).to_df()
+        return compact_frame(df) if compact_dtypes else df
 
     def get_bars_iter(self,
                       symbol: Union[str, List[str]],
@@ -704,7 +1429,18 @@ class REST(object):
                       feed: Optional[str] = None,
                       asof: Optional[str] = None,
                       sort: Optional[Sort] = None,
-                      raw=False) -> BarIterator:
+                      raw=False,
+                      concurrency: Optional[int] = None,
+                      prefetch_pages: Optional[int] = None,
+                      ) -> BarIterator:
+        """
+        :param concurrency: fetch with this many parallel requests, split
+               by symbol group and time range. the order of the items is
+               the same as with sequential paging.
+        :param prefetch_pages: number of pages requested in the background
+               while the current one is consumed
+               (env: APCA_DATA_PREFETCH, default 0)
+        """
         bars = self._data_get('bars', symbol,
                               timeframe=timeframe,
                               adjustment=adjustment,
@@ -714,6 +1450,8 @@ class REST(object):
                               feed=feed,
                               asof=asof,
                               sort=sort,
+                              concurrency=concurrency,
+                              prefetch_pages=prefetch_pages,
                               )
         for bar in bars:
             if raw:
@@ -731,7 +1469,14 @@ class REST(object):
                  feed: Optional[str] = None,
                  asof: Optional[str] = None,
                  sort: Optional[Sort] = None,
+                 concurrency: Optional[int] = None,
                  ) -> BarsV2:
+        if self._cacheable(start, limit, asof):
+            bars = self._cached_data_get(
+                'bars', symbol, start, end, sort,
+                feed=feed, concurrency=concurrency,
+                timeframe=timeframe, adjustment=adjustment)
+            return BarsV2(bars, compact=self._compact)
         bars = list(self.get_bars_iter(symbol,
                                        timeframe,
                                        start,
@@ -741,8 +1486,81 @@ class REST(object):
                                        feed=feed,
                                        asof=asof,
                                        sort=sort,
-                                       raw=True))
-        return BarsV2(bars)
+                                       raw=True,
+                                       concurrency=concurrency))
+        return BarsV2(bars, compact=self._compact)
+
+    def get_bars_df(self,
+                    symbol: Union[str, List[str]],
+                    timeframe: TimeFrame,
+                    start: Optional[str] = None,
+                    end: Optional[str] = None,
+                    adjustment: str = 'raw',
+                    limit: int = None,
+                    feed: Optional[str] = None,
+                    asof: Optional[str] = None,
+                    sort: Optional[Sort] = None,
+                    concurrency: Optional[int] = None,
+                    prefetch_pages: Optional[int] = None,
+                    compact_dtypes: bool = False,
+                    ) -> pd.DataFrame:
+        """
+        get_bars(...).df, built column by column straight from the
+        response pages without creating an entity per bar.
+
+        :param compact_dtypes: categorical symbols, exchanges and
+               conditions, float32 prices and int32 sizes where lossless
+               (see columnar.compact_frame)
+        """
+        pages = self._data_get_pages('bars', symbol,
+                                     timeframe=timeframe,
+                                     adjustment=adjustment,
+                                     start=start,
+                                     end=end,
+                                     limit=limit,
+                                     feed=feed,
+                                     asof=asof,
+                                     sort=sort,
+                                     concurrency=concurrency,
+                                     prefetch_pages=prefetch_pages)
+        df = ColumnarFrameBuilder(bar_mapping_v2).add_pages(pages).to_df()
+        return compact_frame(df) if compact_dtypes else df
+
+    def get_bars_panel(self,
+                       symbols: Union[str, List[str]],
+                       timeframe: TimeFrame,
+                       start: Optional[str] = None,
+                       end: Optional[str] = None,
+                       adjustment: str = 'raw',
+                       limit: int = None,
+                       feed: Optional[str] = None,
+                       asof: Optional[str] = None,
+                       fill: str = 'nan',
+                       concurrency: Optional[int] = None,
+                       prefetch_pages: Optional[int] = None,
+                       ) -> BarPanel:
+        """
+        the bars of several symbols aligned on one time index, as a
+        symbols x times x fields array (see BarPanel), built straight from
+        the response pages.
+
+        :param fill: what a time without a bar of a symbol becomes:
+               nan, ffill (previous close, no volume) or drop (only times
+               all symbols traded at are kept)
+        """
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        pages = self._data_get_pages('bars', list(symbols),
+                                     timeframe=timeframe,
+                                     adjustment=adjustment,
+                                     start=start,
+                                     end=end,
+                                     limit=limit,
+                                     feed=feed,
+                                     asof=asof,
+                                     concurrency=concurrency,
+                                     prefetch_pages=prefetch_pages)
+        return BarPanel.from_pages(pages, symbols=symbols, fill=fill)
 
     def get_latest_bar(self, symbol: str, feed: Optional[str] = None) -> BarV2:
         resp = self.data_get(
@@ -753,11 +1571,9 @@ class REST(object):
 
     def get_latest_bars(self, symbols: List[str],
                         feed: Optional[str] = None) -> LatestBarsV2:
-        resp = self.data_get(
-            f'/stocks/bars/latest?symbols={_join_with_commas(symbols)}',
-            feed=feed,
-            api_version='v2')
-        return self.response_wrapper(resp['bars'], LatestBarsV2)
+        resp = self._by_symbol_chunks('/stocks/bars/latest', symbols,
+                                      key='bars', feed=feed)
+        return self.response_wrapper(resp, LatestBarsV2)
 
     def get_latest_trade(self, symbol: str,
                          feed: Optional[str] = None) -> TradeV2:
@@ -769,11 +1585,9 @@ class REST(object):
 
     def get_latest_trades(self, symbols: List[str],
                           feed: Optional[str] = None) -> LatestTradesV2:
-        resp = self.data_get(
-            f'/stocks/trades/latest?symbols={_join_with_commas(symbols)}',
-            feed=feed,
-            api_version='v2')
-        return self.response_wrapper(resp['trades'], LatestTradesV2)
+        resp = self._by_symbol_chunks('/stocks/trades/latest', symbols,
+                                      key='trades', feed=feed)
+        return self.response_wrapper(resp, LatestTradesV2)
 
     def get_latest_quote(self, symbol: str,
                          feed: Optional[str] = None) -> QuoteV2:
@@ -785,11 +1599,9 @@ class REST(object):
 
     def get_latest_quotes(self, symbols: List[str],
                           feed: Optional[str] = None) -> LatestQuotesV2:
-        resp = self.data_get(
-            f'/stocks/quotes/latest?symbols={_join_with_commas(symbols)}',
-            feed=feed,
-            api_version='v2')
-        return self.response_wrapper(resp['quotes'], LatestQuotesV2)
+        resp = self._by_symbol_chunks('/stocks/quotes/latest', symbols,
+                                      key='quotes', feed=feed)
+        return self.response_wrapper(resp, LatestQuotesV2)
 
     def get_snapshot(self, symbol: str,
                      feed: Optional[str] = None) -> SnapshotV2:
@@ -800,10 +1612,7 @@ class REST(object):
 
     def get_snapshots(self, symbols: List[str],
                       feed: Optional[str] = None) -> SnapshotsV2:
-        resp = self.data_get(
-            '/stocks/snapshots?symbols={}'.format(_join_with_commas(symbols)),
-            feed=feed,
-            api_version='v2')
+        resp = self._by_symbol_chunks('/stocks/snapshots', symbols, feed=feed)
         return self.response_wrapper(resp, SnapshotsV2)
 
     def get_crypto_trades_iter(self,
@@ -832,7 +1641,8 @@ class REST(object):
                           sort: Optional[Sort] = None,
                           loc: str = "us") -> TradesV2:
         return TradesV2(list(self.get_crypto_trades_iter(
-            symbol, start, end, limit, sort, loc, raw=True)))
+            symbol, start, end, limit, sort, loc, raw=True)),
+            compact=self._compact)
 
     def get_crypto_quotes_iter(self,
                                symbol: Union[str, List[str]],
@@ -860,7 +1670,8 @@ class REST(object):
                           sort: Optional[Sort] = None,
                           loc: str = "us") -> QuotesV2:
         return QuotesV2(list(self.get_crypto_quotes_iter(
-            symbol, start, end, limit, sort, loc, raw=True)))
+            symbol, start, end, limit, sort, loc, raw=True)),
+            compact=self._compact)
 
     def get_crypto_bars_iter(self,
                              symbol: Union[str, List[str]],
@@ -891,31 +1702,26 @@ class REST(object):
                         sort: Optional[Sort] = None,
                         loc: str = "us") -> BarsV2:
         return BarsV2(list(self.get_crypto_bars_iter(
-            symbol, timeframe, start, end, limit, sort, loc, raw=True)))
+            symbol, timeframe, start, end, limit, sort, loc, raw=True)),
+            compact=self._compact)
 
     def get_latest_crypto_bars(self, symbols: List[str],
                                loc: str = "us") -> LatestBarsV2:
-        resp = self.data_get(
-            f'/crypto/{loc}/latest/bars',
-            data={'symbols': _join_with_commas(symbols)},
-            api_version='v1beta3')
-        return self.response_wrapper(resp['bars'], LatestBarsV2)
+        resp = self._by_symbol_chunks(f'/crypto/{loc}/latest/bars', symbols,
+                                      key='bars', api_version='v1beta3')
+        return self.response_wrapper(resp, LatestBarsV2)
 
     def get_latest_crypto_trades(self, symbols: List[str],
                                  loc: str = "us") -> LatestTradesV2:
-        resp = self.data_get(
-            f'/crypto/{loc}/latest/trades',
-            data={'symbols': _join_with_commas(symbols)},
-            api_version='v1beta3')
-        return self.response_wrapper(resp['trades'], LatestTradesV2)
+        resp = self._by_symbol_chunks(f'/crypto/{loc}/latest/trades', symbols,
+                                      key='trades', api_version='v1beta3')
+        return self.response_wrapper(resp, LatestTradesV2)
 
     def get_latest_crypto_quotes(self, symbols: List[str],
                                  loc: str = "us") -> LatestQuotesV2:
-        resp = self.data_get(
-            f'/crypto/{loc}/latest/quotes',
-            data={'symbols': _join_with_commas(symbols)},
-            api_version='v1beta3')
-        return self.response_wrapper(resp['quotes'], LatestQuotesV2)
+        resp = self._by_symbol_chunks(f'/crypto/{loc}/latest/quotes', symbols,
+                                      key='quotes', api_version='v1beta3')
+        return self.response_wrapper(resp, LatestQuotesV2)
 
     def get_crypto_snapshot(self, symbols: str,
                             loc: str = "us") -> SnapshotsV2:
@@ -927,11 +1733,9 @@ class REST(object):
 
     def get_crypto_snapshots(self, symbols: List[str],
                              loc: str = "us") -> SnapshotsV2:
-        resp = self.data_get(
-            f'/crypto/{loc}/snapshots',
-            data={'symbols': _join_with_commas(symbols)},
-            api_version='v1beta3')
-        return self.response_wrapper(resp['snapshots'], SnapshotsV2)
+        resp = self._by_symbol_chunks(f'/crypto/{loc}/snapshots', symbols,
+                                      key='snapshots', api_version='v1beta3')
+        return self.response_wrapper(resp, SnapshotsV2)
 
     def get_latest_crypto_orderbook(self, symbol: str,
                                     loc: str = "us") -> OrderbookV2:
@@ -1018,30 +1822,56 @@ class REST(object):
         :param page_token:
         :return:
         """
-        url = '/account/activities'
-        params = {}
-        if isinstance(activity_types, list):
-            params['activity_types'] = ','.join(activity_types)
-        elif activity_types is not None:
-            url += '/{}'.format(activity_types)
-        if after is not None:
-            params['after'] = after
-        if until is not None:
-            params['until'] = until
-        if direction is not None:
-            params['direction'] = direction
-        if date is not None:
-            params['date'] = date
-        if page_size is not None:
-            params['page_size'] = page_size
-        if page_token is not None:
-            params['page_token'] = page_token
+        url, params = _activities_query(activity_types, until, after,
+                                        direction, date, page_size,
+                                        page_token)
         resp = self.get(url, data=params)
         if self._use_raw_data:
             return resp
         else:
             return [self.response_wrapper(o, AccountActivity) for o in resp]
 
+    def get_activities_iter(
+            self,
+            activity_types: Union[str, List[str]] = None,
+            until: str = None,
+            after: str = None,
+            direction: str = 'asc',
+            page_size: int = 100,
+            cursor: SyncCursor = None,
+            cursor_key: str = 'activities',
+    ) -> Iterator[AccountActivity]:
+        """
+        every account activity between after and until, requested a page
+        at a time with page_token and yielded as they arrive.
+
+        :param activity_types: a type, or a list of types (e.g. ['FILL'])
+        :param direction: asc or desc
+        :param page_size: activities per request, at most 100
+        :param cursor: resume after the last activity of the previous run
+               and record the new high-watermark after every page.
+               requires direction asc.
+        :param cursor_key: name of the watermark in cursor
+        """
+        page_token = None
+        if cursor is not None:
+            if direction != 'asc':
+                raise ValueError('a cursor needs direction asc')
+            page_token = cursor.get(cursor_key)
+        while True:
+            url, params = _activities_query(activity_types, until, after,
+                                            direction, None, page_size,
+                                            page_token)
+            page = self.get(url, data=params)
+            for activity in page:
+                yield self.response_wrapper(activity, AccountActivity)
+            if page:
+                page_token = page[-1]['id']
+                if cursor is not None:
+                    cursor.set(cursor_key, page_token)
+            if len(page) < page_size:
+                return
+
     def get_calendar(self, start: str = None, end: str = None) -> Calendars:
         """
         :param start: isoformat date string eg '2006-01-02T15:04:05Z' or
@@ -1172,11 +2002,270 @@ class REST(object):
         """
         if self._use_raw_data:
             return obj
-        else:
-            return entity(obj)
+        if self._compact:
+            entity = compact_types.get(entity, entity)
+        return entity(obj)
 
 
 def _join_with_commas(x: Union[str, List[str]]) -> str:
     if isinstance(x, str):
         return x
     return ','.join(x)
+
+
+def _symbol_chunks(symbols: List[str],
+                   max_chars: int = SYMBOLS_MAX_CHARS) -> List[str]:
+    """comma joined symbols, each string at most max_chars long unless a
+    single symbol is longer"""
+    chunks, current, size = [], [], -1
+    for symbol in symbols:
+        if current and size + 1 + len(symbol) > max_chars:
+            chunks.append(','.join(current))
+            current, size = [], -1
+        current.append(symbol)
+        size += 1 + len(symbol)
+    if current or not chunks:
+        chunks.append(','.join(current))
+    return chunks
+
+
+def _batched(items: Iterator, size: int) -> Iterator[List]:
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _chunks(items: List, n: int) -> List[List]:
+    """split items in at most n contiguous, evenly sized chunks"""
+    n = max(min(n, len(items)), 1)
+    size = -(-len(items) // n)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _can_split_time(kwargs: dict) -> bool:
+    """
+    time sharding needs both bounds, and bars longer than a day would be
+    aggregated differently if their period was cut by a shard boundary.
+    """
+    if not kwargs.get('start') or not kwargs.get('end'):
+        return False
+    timeframe = kwargs.get('timeframe')
+    if timeframe is not None:
+        value = str(timeframe)
+        if value.endswith(TimeFrameUnit.Week.value) or \
+                value.endswith(TimeFrameUnit.Month.value):
+            return False
+    return True
+
+
+def _split_time_range(start: str, end: str, n: int) -> List[tuple]:
+    """
+    split the inclusive [start, end] range in up to n contiguous ranges
+    whose boundaries fall on utc midnight, so intraday bars are never
+    split. returned bounds are RFC3339 strings.
+    """
+    start_ts = _to_utc_timestamp(start)
+    end_ts = _to_utc_timestamp(end)
+    days = pd.date_range(start_ts.ceil('D'), end_ts, freq='D')
+    days = [d for d in days if start_ts < d <= end_ts]
+    if n <= 1 or not days:
+        return [(start, end)]
+    k = min(n - 1, len(days))
+    cuts = sorted(set(days[i * len(days) // (k + 1)]
+                      for i in range(1, k + 1)))
+    ranges = []
+    lower = start
+    for cut in cuts:
+        ranges.append((lower,
+                       (cut - pd.Timedelta(1, 'ns')).isoformat()))
+        lower = cut.isoformat()
+    ranges.append((lower, end))
+    return ranges
+
+
+def _to_utc_timestamp(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        return ts.tz_localize('UTC')
+    return ts.tz_convert('UTC')
+
+
+def _merge_shards(results: List[List[dict]], grouped_by_symbol: bool):
+    """
+    merge the shards of one symbol group, fetched per time range, back in
+    the sequential order: symbol first when grouped, then time range.
+    """
+    if not grouped_by_symbol:
+        for items in results:
+            yield from items
+        return
+    by_symbol = {}
+    for i, items in enumerate(results):
+        for item in items:
+            by_symbol.setdefault(item['S'], [[] for _ in results])[i].append(
+                item)
+    for sym in sorted(by_symbol):
+        for items in by_symbol[sym]:
+            yield from items
+
+
+def _list_orders_params(status: str = None,
+                        limit: int = None,
+                        after: str = None,
+                        until: str = None,
+                        direction: str = None,
+                        params: dict = None,
+                        nested: bool = None,
+                        symbols: List[str] = None,
+                        side: str = None) -> dict:
+    """query of GET /orders, shared by REST and AsyncTradingRest"""
+    if params is None:
+        params = dict()
+    if limit is not None:
+        params['limit'] = limit
+    if after is not None:
+        params['after'] = after
+    if until is not None:
+        params['until'] = until
+    if direction is not None:
+        params['direction'] = direction
+    if status is not None:
+        params['status'] = status
+    if nested is not None:
+        params['nested'] = nested
+    if side is not None:
+        params['side'] = side
+    if symbols is not None:
+        params['symbols'] = ",".join(symbols)
+    return params
+
+
+def _submit_order_params(symbol: str,
+                         qty: float = None,
+                         side: str = "buy",
+                         type: str = "market",
+                         time_in_force: str = "day",
+                         limit_price: str = None,
+                         stop_price: str = None,
+                         client_order_id: str = None,
+                         extended_hours: bool = None,
+                         order_class: str = None,
+                         take_profit: dict = None,
+                         stop_loss: dict = None,
+                         trail_price: str = None,
+                         trail_percent: str = None,
+                         notional: float = None) -> dict:
+    """body of POST /orders, shared by REST and AsyncTradingRest"""
+    params = {
+        'symbol':        symbol,
+        'side':          side,
+        'type':          type,
+        'time_in_force': time_in_force
+    }
+    if qty is not None:
+        params['qty'] = qty
+    if notional is not None:
+        params['notional'] = notional
+    if limit_price is not None:
+        params['limit_price'] = FLOAT(limit_price)
+    if stop_price is not None:
+        params['stop_price'] = FLOAT(stop_price)
+    if client_order_id is not None:
+        params['client_order_id'] = client_order_id
+    if extended_hours is not None:
+        params['extended_hours'] = extended_hours
+    if order_class is not None:
+        params['order_class'] = order_class
+    # the legs are copied, callers may share one spec between orders
+    if take_profit is not None:
+        params['take_profit'] = _leg_params(take_profit)
+    if stop_loss is not None:
+        params['stop_loss'] = _leg_params(stop_loss)
+    if trail_price is not None:
+        params['trail_price'] = trail_price
+    if trail_percent is not None:
+        params['trail_percent'] = trail_percent
+    return params
+
+
+def _leg_params(leg: dict) -> dict:
+    """a take_profit or stop_loss leg with its prices as FLOAT"""
+    return {k: FLOAT(v) if k in ('limit_price', 'stop_price') else v
+            for k, v in leg.items()}
+
+
+def _replace_order_params(qty: str = None,
+                          limit_price: str = None,
+                          stop_price: str = None,
+                          trail: str = None,
+                          time_in_force: str = None,
+                          client_order_id: str = None) -> dict:
+    """body of PATCH /orders/{id}, shared by REST and AsyncTradingRest"""
+    params = {}
+    if qty is not None:
+        params['qty'] = qty
+    if limit_price is not None:
+        params['limit_price'] = FLOAT(limit_price)
+    if stop_price is not None:
+        params['stop_price'] = FLOAT(stop_price)
+    if trail is not None:
+        params['trail'] = FLOAT(trail)
+    if time_in_force is not None:
+        params['time_in_force'] = time_in_force
+    if client_order_id is not None:
+        params['client_order_id'] = client_order_id
+    return params
+
+
+def _params_key(params: Optional[dict]) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in (params or {}).items()
+                        if v is not None))
+
+
+def _digest(obj) -> str:
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=str).encode(
+        'utf-8')).hexdigest()
+
+
+def _client_order_id(batch_id: str, index: int, spec: dict) -> str:
+    """the same batch, position and order always give the same id"""
+    return 'bulk-' + _digest([batch_id, index, spec])[:32]
+
+
+def _activities_query(activity_types: Union[str, List[str]] = None,
+                      until: str = None,
+                      after: str = None,
+                      direction: str = None,
+                      date: str = None,
+                      page_size: int = None,
+                      page_token: str = None) -> Tuple[str, dict]:
+    """path and query of GET /account/activities"""
+    url = '/account/activities'
+    params = {}
+    if isinstance(activity_types, list):
+        params['activity_types'] = ','.join(activity_types)
+    elif activity_types is not None:
+        url += '/{}'.format(activity_types)
+    if after is not None:
+        params['after'] = after
+    if until is not None:
+        params['until'] = until
+    if direction is not None:
+        params['direction'] = direction
+    if date is not None:
+        params['date'] = date
+    if page_size is not None:
+        params['page_size'] = page_size
+    if page_token is not None:
+        params['page_token'] = page_token
+    return url, params
+
+
+def _shift_timestamp(value: Optional[str], microseconds: int) -> Optional[str]:
+    if value is None:
+        return None
+    ts = pd.Timestamp(value) + pd.Timedelta(microseconds=microseconds)
+    return ts.isoformat()
@@ -1,10 +1,32 @@
 import aiohttp
 import asyncio
+import os
+from typing import List, Optional
 
+from alpaca_trade_api import __version__
+from alpaca_trade_api.entity import (
+    Account, AccountConfigurations, Asset, Calendar, Clock, Entity, Order,
+    Position,
+)
 from alpaca_trade_api.entity_v2 import BarsV2, QuotesV2, TradesV2, \
     EntityList, TradeV2, QuoteV2
 import pandas as pd
-from alpaca_trade_api.common import URL, get_credentials, get_data_url
+from alpaca_trade_api.common import URL, get_api_version, get_base_url, \
+    get_credentials, get_data_url
+from alpaca_trade_api.decoder import Decoder, JSONDecoder
+from alpaca_trade_api.rest import (
+    Assets, Calendars, Orders, Positions, _decode_response,
+    _list_orders_params, _replace_order_params, _retry_wait,
+    _submit_order_params,
+)
+from alpaca_trade_api.retry import RetryPolicy, RetryStats
+from alpaca_trade_api.transport import (
+    DEFAULT_POOL_MAXSIZE, Timeout, get_timeout,
+)
+
+# failures of an aiohttp request that are worth retrying, like
+# retry.TRANSIENT_ERRORS for requests
+TRANSIENT_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
 
 
 class AsyncRest:
@@ -176,3 +198,324 @@ async def gather_with_concurrency(n, *tasks):
 
     return await asyncio.gather(*(sem_task(task) for task in tasks),
                                 return_exceptions=True)
+
+
+class AsyncTradingRest(object):
+    """
+    asyncio client of the trading api (account, orders, positions, assets,
+    clock and calendar) with the same methods, arguments, retry policy and
+    entity wrapping as REST, so coroutines can trade without threads.
+
+    every request goes through one pooled aiohttp session, created on
+    first use in the running event loop. close it with `await close()`
+    or by using the client as an async context manager.
+    """
+
+    def __init__(self,
+                 key_id: str = None,
+                 secret_key: str = None,
+                 base_url: URL = None,
+                 api_version: str = None,
+                 oauth=None,
+                 raw_data: bool = False,
+                 pool_maxsize: int = None,
+                 timeout: Timeout = None,
+                 retry_policy: RetryPolicy = None,
+                 json_decoder: Decoder = None,
+                 ):
+        """
+        :param raw_data: should we return api response raw or wrap it with
+                         Entity objects.
+        :param pool_maxsize: max simultaneous connections of the session
+               (env: APCA_POOL_MAXSIZE, default 32)
+        :param timeout: seconds, or a (connect, read) tuple applied to every
+               request (env: APCA_CONNECT_TIMEOUT / APCA_READ_TIMEOUT)
+        :param retry_policy: same as for REST, defaults to
+               RetryPolicy.from_env()
+        :param json_decoder: same as for REST, defaults to
+               JSONDecoder.from_env()
+        """
+        self._key_id, self._secret_key, self._oauth = get_credentials(
+            key_id, secret_key, oauth)
+        self._base_url: URL = URL(base_url or get_base_url())
+        self._api_version = get_api_version(api_version)
+        self._use_raw_data = raw_data
+        self._pool_maxsize = pool_maxsize or int(os.environ.get(
+            'APCA_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE))
+        self._timeout = _client_timeout(get_timeout(timeout))
+        self._retry_policy = retry_policy or RetryPolicy.from_env()
+        self._decode = json_decoder or JSONDecoder.from_env()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            headers = {'User-Agent': 'APCA-TRADE-SDK-PY/' + __version__}
+            if self._oauth:
+                headers['Authorization'] = 'Bearer ' + self._oauth
+            else:
+                headers['APCA-API-KEY-ID'] = self._key_id
+                headers['APCA-API-SECRET-KEY'] = self._secret_key
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_maxsize),
+                headers=headers,
+                timeout=self._timeout,
+            )
+        return self._session
+
+    async def _request(self, method, path, data=None):
+        url: URL = URL(self._base_url + '/' + self._api_version + path)
+        # same as REST, fail early instead of following a redirect
+        opts = {'allow_redirects': False}
+        if method.upper() in ['GET', 'DELETE']:
+            opts['params'] = _query(data)
+        else:
+            opts['json'] = data
+
+        policy = self._retry_policy
+        stats = RetryStats(method, url)
+        while True:
+            retry = policy.max_retries - stats.retries
+            try:
+                result = await self._one_request(method, url, opts, retry)
+            except Exception as e:
+                wait = _retry_wait(policy, stats, e, retry, self._decode,
+                                   TRANSIENT_ERRORS)
+            else:
+                policy.report(stats)
+                return result
+            policy.retrying(stats, wait, retry)
+            await asyncio.sleep(wait)
+
+    async def _one_request(self, method: str, url: URL, opts: dict,
+                           retry: int):
+        """
+        same contract as REST._one_request: RetryException for a retry
+        code while retries are left, APIError for other error statuses,
+        the decoded body otherwise.
+        """
+        session = self._get_session()
+        async with session.request(method, url, **opts) as resp:
+            body = await resp.read()
+            http_error = None
+            if resp.status >= 400:
+                http_error = aiohttp.ClientResponseError(
+                    resp.request_info, resp.history, status=resp.status,
+                    message=resp.reason or '', headers=resp.headers)
+        return _decode_response(self._retry_policy, resp.status, body, resp,
+                                http_error, retry, self._decode)
+
+    async def get(self, path, data=None):
+        return await self._request('GET', path, data)
+
+    async def post(self, path, data=None):
+        return await self._request('POST', path, data)
+
+    async def put(self, path, data=None):
+        return await self._request('PUT', path, data)
+
+    async def patch(self, path, data=None):
+        return await self._request('PATCH', path, data)
+
+    async def delete(self, path, data=None):
+        return await self._request('DELETE', path, data)
+
+    def response_wrapper(self, obj, entity: Entity):
+        if self._use_raw_data:
+            return obj
+        return entity(obj)
+
+    def _wrap_list(self, resp, entity: Entity):
+        if self._use_raw_data:
+            return resp
+        return [entity(o) for o in resp]
+
+    async def get_account(self) -> Account:
+        """Get the account"""
+        resp = await self.get('/account')
+        return self.response_wrapper(resp, Account)
+
+    async def get_account_configurations(self) -> AccountConfigurations:
+        """Get account configs"""
+        resp = await self.get('/account/configurations')
+        return self.response_wrapper(resp, AccountConfigurations)
+
+    async def update_account_configurations(
+            self,
+            no_shorting: bool = None,
+            dtbp_check: str = None,
+            trade_confirm_email: str = None,
+            suspend_trade: bool = None) -> AccountConfigurations:
+        """see REST.update_account_configurations"""
+        params = {}
+        if no_shorting is not None:
+            params['no_shorting'] = no_shorting
+        if dtbp_check is not None:
+            params['dtbp_check'] = dtbp_check
+        if trade_confirm_email is not None:
+            params['trade_confirm_email'] = trade_confirm_email
+        if suspend_trade is not None:
+            params['suspend_trade'] = suspend_trade
+        resp = await self.patch('/account/configurations', params)
+        return self.response_wrapper(resp, AccountConfigurations)
+
+    async def list_orders(self,
+                          status: str = None,
+                          limit: int = None,
+                          after: str = None,
+                          until: str = None,
+                          direction: str = None,
+                          params=None,
+                          nested: bool = None,
+                          symbols: List[str] = None,
+                          side: str = None
+                          ) -> Orders:
+        """see REST.list_orders"""
+        params = _list_orders_params(status, limit, after, until, direction,
+                                     params, nested, symbols, side)
+        resp = await self.get('/orders', params)
+        return self._wrap_list(resp, Order)
+
+    async def submit_order(self,
+                           symbol: str,
+                           qty: float = None,
+                           side: str = "buy",
+                           type: str = "market",
+                           time_in_force: str = "day",
+                           limit_price: str = None,
+                           stop_price: str = None,
+                           client_order_id: str = None,
+                           extended_hours: bool = None,
+                           order_class: str = None,
+                           take_profit: dict = None,
+                           stop_loss: dict = None,
+                           trail_price: str = None,
+                           trail_percent: str = None,
+                           notional: float = None) -> Order:
+        """see REST.submit_order"""
+        params = _submit_order_params(
+            symbol, qty, side, type, time_in_force, limit_price, stop_price,
+            client_order_id, extended_hours, order_class, take_profit,
+            stop_loss, trail_price, trail_percent, notional)
+        resp = await self.post('/orders', params)
+        return self.response_wrapper(resp, Order)
+
+    async def get_order_by_client_order_id(self,
+                                           client_order_id: str) -> Order:
+        """Get an order by client order id"""
+        params = {
+            'client_order_id': client_order_id,
+        }
+        resp = await self.get('/orders:by_client_order_id', params)
+        return self.response_wrapper(resp, Order)
+
+    async def get_order(self, order_id: str, nested: bool = None) -> Order:
+        """Get an order"""
+        params = {}
+        if nested is not None:
+            params['nested'] = nested
+        resp = await self.get('/orders/{}'.format(order_id), params)
+        return self.response_wrapper(resp, Order)
+
+    async def replace_order(
+            self,
+            order_id: str,
+            qty: str = None,
+            limit_price: str = None,
+            stop_price: str = None,
+            trail: str = None,
+            time_in_force: str = None,
+            client_order_id: str = None,
+    ) -> Order:
+        """see REST.replace_order"""
+        params = _replace_order_params(qty, limit_price, stop_price, trail,
+                                       time_in_force, client_order_id)
+        resp = await self.patch('/orders/{}'.format(order_id), params)
+        return self.response_wrapper(resp, Order)
+
+    async def cancel_order(self, order_id: str) -> None:
+        """Cancel an order"""
+        await self.delete('/orders/{}'.format(order_id))
+
+    async def cancel_all_orders(self) -> None:
+        """Cancel all open orders"""
+        await self.delete('/orders')
+
+    async def list_positions(self) -> Positions:
+        """Get a list of open positions"""
+        resp = await self.get('/positions')
+        return self._wrap_list(resp, Position)
+
+    async def get_position(self, symbol: str) -> Position:
+        """Get an open position"""
+        resp = await self.get('/positions/{}'.format(symbol))
+        return self.response_wrapper(resp, Position)
+
+    async def close_position(self, symbol: str, *,
+                             qty: float = None) -> Position:
+        """Liquidates the position for the given symbol at market price"""
+        data = {'qty': qty} if qty else {}
+        resp = await self.delete('/positions/{}'.format(symbol), data=data)
+        return self.response_wrapper(resp, Position)
+
+    async def close_all_positions(self) -> Positions:
+        """Liquidates all open positions at market price"""
+        resp = await self.delete('/positions')
+        return self._wrap_list(resp, Position)
+
+    async def list_assets(self, status=None, asset_class=None) -> Assets:
+        """Get a list of assets"""
+        params = {
+            'status':      status,
+            'asset_class': asset_class,
+        }
+        resp = await self.get('/assets', params)
+        return self._wrap_list(resp, Asset)
+
+    async def get_asset(self, symbol: str) -> Asset:
+        """Get an asset"""
+        resp = await self.get('/assets/{}'.format(symbol))
+        return self.response_wrapper(resp, Asset)
+
+    async def get_clock(self) -> Clock:
+        resp = await self.get('/clock')
+        return self.response_wrapper(resp, Clock)
+
+    async def get_calendar(self, start: str = None,
+                           end: str = None) -> Calendars:
+        """see REST.get_calendar"""
+        params = {}
+        if start is not None:
+            params['start'] = start
+        if end is not None:
+            params['end'] = end
+        resp = await self.get('/calendar', data=params)
+        return self._wrap_list(resp, Calendar)
+
+
+def _query(params: Optional[dict]) -> Optional[dict]:
+    """
+    aiohttp refuses None and bool query values. drop the None ones and
+    stringify the rest the way requests does.
+    """
+    if not params:
+        return None
+    return {k: str(v) for k, v in params.items() if v is not None}
+
+
+def _client_timeout(timeout: Timeout) -> aiohttp.ClientTimeout:
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return aiohttp.ClientTimeout(total=None, sock_connect=connect,
+                                     sock_read=read)
+    return aiohttp.ClientTimeout(total=timeout)
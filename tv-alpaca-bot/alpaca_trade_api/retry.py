@@ -0,0 +1,191 @@
+import email.utils
+import logging
+import os
+import random
+import time
+from typing import Callable, Iterable, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRY_MAX = 3
+DEFAULT_RETRY_WAIT = 3
+DEFAULT_RETRY_CAP = 30
+DEFAULT_RETRY_CODES = '429,504'
+# failures of a blocking request that are worth retrying
+TRANSIENT_ERRORS = (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout)
+
+
+class RetryStats(object):
+    """
+    summary of a single REST call, handed to the retry policy hooks once
+    the call either succeeded or gave up.
+    """
+
+    def __init__(self, method: str, url: str):
+        self.method = method
+        self.url = url
+        self.retries = 0
+        self.total_sleep = 0.0
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+        self.error = None
+
+    def __repr__(self):
+        return ('RetryStats(method={!r}, url={!r}, retries={}, '
+                'total_sleep={:.3f}, elapsed={:.3f}, error={!r})').format(
+            self.method, self.url, self.retries, self.total_sleep,
+            self.elapsed, self.error)
+
+
+class RetryPolicy(object):
+    """
+    exponential backoff with full jitter.
+
+    the n-th retry sleeps a random amount in [0, min(cap, base * 2**n)],
+    which spreads out threads that hit a rate limit at the same moment.
+    when the server says how long to wait (Retry-After, or the rate limit
+    reset time on a 429) that wait is honored, plus jitter, up to cap.
+    """
+
+    def __init__(self,
+                 max_retries: int = DEFAULT_RETRY_MAX,
+                 base: float = DEFAULT_RETRY_WAIT,
+                 cap: float = DEFAULT_RETRY_CAP,
+                 deadline: Optional[float] = None,
+                 retry_codes: Iterable[int] = (429, 504),
+                 retry_connection_errors: bool = True,
+                 jitter: bool = True,
+                 hooks: List[Callable[[RetryStats], None]] = None):
+        """
+        :param max_retries: retries after the first attempt
+        :param base: seconds, the backoff of the first retry
+        :param cap: max seconds slept between two attempts
+        :param deadline: total seconds budget of a call, sleeps included.
+               once the next sleep would exceed it the call gives up.
+        :param retry_codes: http status codes that are retried
+        :param retry_connection_errors: retry GET requests that failed to
+               connect or timed out
+        :param jitter: randomize the backoff
+        :param hooks: callables receiving a RetryStats after every call
+        """
+        self.max_retries = max(int(max_retries), 0)
+        self.base = base
+        self.cap = cap
+        self.deadline = deadline
+        self.retry_codes = list(retry_codes)
+        self.retry_connection_errors = retry_connection_errors
+        self.jitter = jitter
+        self.hooks = list(hooks or [])
+
+    @classmethod
+    def from_env(cls) -> 'RetryPolicy':
+        deadline = os.environ.get('APCA_RETRY_DEADLINE')
+        return cls(
+            max_retries=int(os.environ.get('APCA_RETRY_MAX',
+                                           DEFAULT_RETRY_MAX)),
+            base=float(os.environ.get('APCA_RETRY_WAIT', DEFAULT_RETRY_WAIT)),
+            cap=float(os.environ.get('APCA_RETRY_CAP', DEFAULT_RETRY_CAP)),
+            deadline=float(deadline) if deadline else None,
+            retry_codes=[int(o) for o in os.environ.get(
+                'APCA_RETRY_CODES', DEFAULT_RETRY_CODES).split(',')],
+        )
+
+    def add_hook(self, hook: Callable[[RetryStats], None]):
+        self.hooks.append(hook)
+
+    def backoff(self, attempt: int) -> float:
+        """seconds to sleep before retry number attempt (0 based)"""
+        ceiling = min(self.cap, self.base * (2 ** attempt))
+        if self.jitter:
+            return random.uniform(0, ceiling)
+        return ceiling
+
+    def wait_time(self,
+                  attempt: int,
+                  response: requests.Response = None) -> float:
+        hinted = server_wait_hint(response)
+        if hinted is None:
+            return self.backoff(attempt)
+        if self.jitter:
+            hinted += random.uniform(0, min(self.cap, self.base))
+        # a bogus or hostile header must not block the call for hours
+        return min(hinted, self.cap)
+
+    def should_retry_status(self, status_code: int) -> bool:
+        return status_code in self.retry_codes
+
+    def should_retry_exception(self, method: str,
+                               exc: Exception,
+                               transient: tuple = TRANSIENT_ERRORS) -> bool:
+        """
+        connection failures are only retried for GET: a POST that timed out
+        may still have reached the server, and replaying it could submit
+        the same order twice.
+        :param transient: exception types counted as connection failures,
+               the asyncio client passes the aiohttp ones
+        """
+        if not self.retry_connection_errors or method.upper() != 'GET':
+            return False
+        return isinstance(exc, transient)
+
+    def within_deadline(self, stats: RetryStats, wait: float) -> bool:
+        if self.deadline is None:
+            return True
+        spent = time.monotonic() - stats.started
+        return spent + wait <= self.deadline
+
+    def retrying(self, stats: RetryStats, wait: float, retries_left: int):
+        """count a retry of the call about to sleep wait seconds"""
+        logger.warning(
+            'sleep {:.2f} seconds and retrying {} '
+            '{} more time(s)...'.format(wait, stats.url, retries_left))
+        stats.retries += 1
+        stats.total_sleep += wait
+
+    def give_up(self, stats: RetryStats, error: Exception):
+        stats.error = error
+        self.report(stats)
+
+    def report(self, stats: RetryStats):
+        stats.elapsed = time.monotonic() - stats.started
+        for hook in self.hooks:
+            try:
+                hook(stats)
+            except Exception:
+                logger.exception('retry hook failed')
+
+
+def server_wait_hint(response: requests.Response = None) -> Optional[float]:
+    """
+    seconds the server asked us to wait, from the Retry-After header
+    (delta seconds or an http date) or, for a 429, the rate limit reset
+    epoch. None when the response carries no usable hint. aiohttp
+    responses are accepted too.
+    """
+    if response is None:
+        return None
+    status = getattr(response, 'status_code', None)
+    if status is None:
+        status = getattr(response, 'status', None)
+    headers = response.headers
+    retry_after = headers.get('Retry-After')
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            try:
+                when = email.utils.parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError):
+                when = None
+            if when is not None:
+                return max(when.timestamp() - time.time(), 0.0)
+    reset = headers.get('X-RateLimit-Reset')
+    if reset and status == 429:
+        try:
+            return max(float(reset) - time.time(), 0.0)
+        except ValueError:
+            pass
+    return None
@@ -0,0 +1,1055 @@
+import asyncio
+import datetime
+import http.client
+import inspect
+import itertools
+import json
+import threading
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import BaseAdapter
+
+from .entity import NY, Entity
+from .transport import build_adapter
+
+PAPER_URL = 'https://paper-api.alpaca.markets'
+ORDER_TYPES = ('market', 'limit', 'stop', 'stop_limit', 'trailing_stop')
+TIME_IN_FORCE = ('day', 'gtc', 'opg', 'cls', 'ioc', 'fok')
+ORDER_CLASSES = ('simple', 'bracket', 'oco', 'oto')
+OPEN_STATUSES = ('new', 'held')
+ORDERS_DEFAULT_LIMIT = 50
+ORDERS_MAX_LIMIT = 500
+# stop orders are matched first within a bar: when a bar reaches both the
+# stop and the limit of an oco pair, the loss is assumed
+_STOPS = ('stop', 'stop_limit', 'trailing_stop')
+_EPSILON = 1e-9
+_MARKET_HOURS = (datetime.time(9, 30), datetime.time(16, 0))
+
+
+class SimulatorError(Exception):
+    """a request the broker rejects, answered with status and code"""
+
+    def __init__(self, status: int, code: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+def _not_found(message: str = 'not found') -> SimulatorError:
+    return SimulatorError(404, 40410000, message)
+
+
+def _unprocessable(message: str) -> SimulatorError:
+    return SimulatorError(422, 42210000, message)
+
+
+class _Order(object):
+    __slots__ = ('seq', 'id', 'client_order_id', 'symbol', 'side', 'type',
+                 'qty', 'notional', 'time_in_force', 'limit_price',
+                 'stop_price', 'trail_price', 'trail_percent', 'hwm',
+                 'order_class', 'extended_hours', 'status', 'filled_qty',
+                 'filled_avg_price', 'created_at', 'updated_at',
+                 'filled_at', 'canceled_at', 'expired_at', 'replaced_at',
+                 'replaced_by', 'replaces', 'legs', 'parent', 'triggered',
+                 'reserved')
+
+    def __init__(self, seq: int, symbol: str, side: str, type: str,
+                 time_in_force: str, now: int):
+        self.seq = seq
+        self.id = str(uuid.UUID(int=seq))
+        self.client_order_id = None
+        self.symbol = symbol
+        self.side = side
+        self.type = type
+        self.qty = None
+        self.notional = None
+        self.time_in_force = time_in_force
+        self.limit_price = None
+        self.stop_price = None
+        self.trail_price = None
+        self.trail_percent = None
+        self.hwm = None
+        self.order_class = ''
+        self.extended_hours = False
+        self.status = 'new'
+        self.filled_qty = 0.0
+        self.filled_avg_price = None
+        self.created_at = now
+        self.updated_at = now
+        self.filled_at = None
+        self.canceled_at = None
+        self.expired_at = None
+        self.replaced_at = None
+        self.replaced_by = None
+        self.replaces = None
+        self.legs = []
+        self.parent = None
+        self.triggered = False      # stop_limit: the stop was reached
+        self.reserved = 0.0         # buying power held by an open buy
+
+    @property
+    def is_open(self) -> bool:
+        return self.status in OPEN_STATUSES
+
+    def raw(self, nested: bool = True) -> dict:
+        legs = None
+        if nested and self.legs:
+            legs = [leg.raw() for leg in self.legs]
+        return {
+            'id': self.id,
+            'client_order_id': self.client_order_id,
+            'created_at': _iso(self.created_at),
+            'updated_at': _iso(self.updated_at),
+            'submitted_at': _iso(self.created_at),
+            'filled_at': _iso(self.filled_at),
+            'expired_at': _iso(self.expired_at),
+            'canceled_at': _iso(self.canceled_at),
+            'failed_at': None,
+            'replaced_at': _iso(self.replaced_at),
+            'replaced_by': self.replaced_by,
+            'replaces': self.replaces,
+            'asset_id': _asset_id(self.symbol),
+            'symbol': self.symbol,
+            'asset_class': 'us_equity',
+            'notional': _number(self.notional),
+            'qty': _number(self.qty),
+            'filled_qty': _number(self.filled_qty),
+            'filled_avg_price': _number(self.filled_avg_price),
+            'order_class': self.order_class,
+            'order_type': self.type,
+            'type': self.type,
+            'side': self.side,
+            'time_in_force': self.time_in_force,
+            'limit_price': _number(self.limit_price),
+            'stop_price': _number(self.stop_price),
+            'status': self.status,
+            'extended_hours': self.extended_hours,
+            'legs': legs,
+            'trail_percent': _number(self.trail_percent),
+            'trail_price': _number(self.trail_price),
+            'hwm': _number(self.hwm),
+        }
+
+
+class _Position(object):
+    __slots__ = ('symbol', 'qty', 'avg_entry_price')
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.qty = 0.0
+        self.avg_entry_price = 0.0
+
+
+class BrokerSimulator(object):
+    """
+    an in-process paper broker for backtests and tests of live code.
+
+    the strategy talks to it through a regular REST instance, made by
+    rest(): the trading endpoints (orders, positions, account, clock) are
+    answered by the simulator in the shape of the trading api, errors
+    included, so the code under test runs unchanged. data requests go to
+    the real data api, where a HistoricalCache of the REST instance can
+    serve them. no request ever reaches the trading api.
+
+    prices come from the market data fed with on_bar, on_quote or replay.
+    the simulated clock is the time of the latest data. orders fill
+    completely, never partially:
+
+    - against a quote, at the ask for buys and the bid for sells. a
+      marketable order submitted while the latest data of its symbol is
+      a quote fills at once.
+    - against a bar, the orders open when the bar arrives: market orders
+      at the open, limit orders at the open or their limit, stop orders
+      at the open or their stop. orders submitted while a bar is the
+      latest data wait for the next bar, so nothing fills on prices the
+      strategy has already seen.
+
+    bracket and oto exit legs are held until their entry fills and start
+    working on the next data. the legs of bracket and oco orders cancel
+    each other once one fills. day orders expire when the New York date
+    changes. trade updates are delivered like TradingStream delivers them,
+    to the handlers registered with subscribe_trade_updates.
+    """
+
+    def __init__(self,
+                 cash: float = 100000.0,
+                 multiplier: float = 1.0,
+                 shorting: bool = True,
+                 base_url: str = PAPER_URL,
+                 raw_data: bool = False):
+        """
+        :param cash: starting cash
+        :param multiplier: buying power multiplier, 1 for a cash account
+        :param shorting: allow selling more than the position
+        :param base_url: trading api url the REST instances of rest() use
+        :param raw_data: trade update handlers get the raw message
+               instead of an Entity of its data, as with TradingStream
+        """
+        self.multiplier = float(multiplier)
+        self.shorting = shorting
+        self.base_url = base_url.rstrip('/')
+        self.account_id = str(uuid.uuid5(uuid.NAMESPACE_URL, 'simulator'))
+        self._raw_data = raw_data
+        self._lock = threading.RLock()
+        self._cash = float(cash)
+        self._last_equity = float(cash)
+        self._orders: Dict[str, _Order] = {}
+        self._client_ids: Dict[str, _Order] = {}
+        self._history: List[_Order] = []
+        self._open: Dict[str, Dict[str, _Order]] = {}   # symbol -> orders
+        self._positions: Dict[str, _Position] = {}
+        self._prices: Dict[str, float] = {}
+        self._quotes: Dict[str, Tuple[float, float]] = {}
+        self._reserved = 0.0
+        self._now = 0
+        self._next_day = None
+        self._seq = itertools.count(1)
+        self._executions = itertools.count(1)
+        self._handlers: List[Callable] = []
+        self._events = deque()
+        self._delivering = False
+        self._loop = None
+
+    def rest(self, passthrough: BaseAdapter = None, **kwargs):
+        """
+        a REST instance trading with this simulator
+
+        :param passthrough: adapter of the requests to other hosts, i.e.
+               the data api. defaults to a new pooled adapter.
+        :param kwargs: other REST arguments, e.g. cache or raw_data
+        """
+        from .rest import REST
+        kwargs.setdefault('key_id', 'simulator')
+        kwargs.setdefault('secret_key', 'simulator')
+        return REST(base_url=self.base_url, api_version='v2',
+                    adapter=SimulatorAdapter(self, passthrough), **kwargs)
+
+    # market data
+
+    def on_bar(self, symbol: str, bar) -> None:
+        """
+        match the open orders of symbol against a bar, a BarV2 or its raw
+        dict with t, o, h, l and c
+        """
+        raw = getattr(bar, '_raw', bar)
+        with self._lock:
+            self._bar(symbol, _to_ns(raw['t']), float(raw['o']),
+                      float(raw['h']), float(raw['l']), float(raw['c']))
+        self._deliver()
+
+    def on_quote(self, symbol: str, quote) -> None:
+        """
+        match the open orders of symbol against a quote, a QuoteV2 or its
+        raw dict with t, bp and ap
+        """
+        raw = getattr(quote, '_raw', quote)
+        with self._lock:
+            self._quote(symbol, _to_ns(raw['t']), float(raw['bp']),
+                        float(raw['ap']))
+        self._deliver()
+
+    def replay(self,
+               df: pd.DataFrame,
+               on_time: Callable[[pd.Timestamp, pd.DataFrame], Any] = None,
+               symbol: str = None) -> None:
+        """
+        feed the bars or quotes of a frame in time order, e.g. the result
+        of get_bars_df or get_quotes_df. frames with bid_price and
+        ask_price columns are quotes, others bars.
+
+        :param on_time: called with the time and the rows of that time
+               once they are applied, the place for the strategy to look
+               at the data and trade
+        :param symbol: symbol of all the rows, for frames without a
+               symbol column
+        """
+        index = pd.DatetimeIndex(df.index)
+        if index.tz is None:
+            index = index.tz_localize('UTC')
+        ns = np.asarray(index.tz_convert(None), dtype='datetime64[ns]').view(
+            'int64')
+        order = np.argsort(ns, kind='stable')
+        ns = ns[order]
+        if 'symbol' in df.columns:
+            symbols = df['symbol'].to_numpy()[order]
+        else:
+            symbols = np.full(len(df), symbol, dtype=object)
+        quotes = 'bid_price' in df.columns and 'ask_price' in df.columns
+        if quotes:
+            columns = [df[c].to_numpy(dtype=np.float64)[order]
+                       for c in ('bid_price', 'ask_price')]
+        else:
+            columns = [df[c].to_numpy(dtype=np.float64)[order]
+                       for c in ('open', 'high', 'low', 'close')]
+        bounds = np.r_[0, np.flatnonzero(np.diff(ns)) + 1, len(ns)].tolist()
+        rows = list(zip(symbols.tolist(), *[c.tolist() for c in columns]))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            t = int(ns[start])
+            with self._lock:
+                for row in rows[start:end]:
+                    if quotes:
+                        self._quote(row[0], t, row[1], row[2])
+                    else:
+                        self._bar(row[0], t, *row[1:])
+            self._deliver()
+            if on_time is not None:
+                on_time(pd.Timestamp(t, tz='UTC'),
+                        df.iloc[order[start:end]])
+
+    @property
+    def now(self) -> pd.Timestamp:
+        """the simulated time"""
+        return pd.Timestamp(self._now, tz='UTC')
+
+    # trade updates
+
+    def subscribe_trade_updates(self, handler: Callable) -> None:
+        """
+        deliver trade updates (new, fill, canceled, expired, replaced) to
+        handler, a coroutine function like TradingStream handlers or a
+        plain function. updates are delivered after the state changed, in
+        order, on the thread that caused them.
+        """
+        with self._lock:
+            self._handlers.append(handler)
+
+    def unsubscribe_trade_updates(self, handler: Callable = None) -> None:
+        with self._lock:
+            if handler is None:
+                self._handlers.clear()
+            else:
+                self._handlers.remove(handler)
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.close()
+            self._loop = None
+
+    # the trading api
+
+    def handle(self, method: str, path: str, query: Dict[str, str],
+               body: Optional[dict]) -> Tuple[int, Any]:
+        """answer a trading api request: (http status, json body)"""
+        try:
+            with self._lock:
+                result = self._route(method.upper(), path, query, body or {})
+        except SimulatorError as e:
+            return e.status, {'code': e.code, 'message': str(e)}
+        finally:
+            self._deliver()
+        return result
+
+    def _route(self, method: str, path: str, query: Dict[str, str],
+               body: dict) -> Tuple[int, Any]:
+        if not path.startswith('/v2/'):
+            raise _not_found()
+        segments = path[len('/v2/'):].rstrip('/').split('/')
+        resource, key = segments[0], '/'.join(segments[1:]) or None
+        if resource == 'orders' and key is None:
+            if method == 'GET':
+                return 200, self._list_orders(query)
+            if method == 'POST':
+                return 200, self._submit(body).raw()
+            if method == 'DELETE':
+                return 207, [{'id': o.id, 'status': 200,
+                              'body': o.raw()} for o in self._cancel_all()]
+        elif resource == 'orders:by_client_order_id' and method == 'GET':
+            order = self._client_ids.get(query.get('client_order_id'))
+            if order is None:
+                raise _not_found('order not found')
+            return 200, order.raw()
+        elif resource == 'orders':
+            order = self._orders.get(key)
+            if order is None:
+                raise _not_found('order not found')
+            if method == 'GET':
+                return 200, order.raw(_flag(query.get('nested')))
+            if method == 'DELETE':
+                self._cancel_order(order)
+                return 204, None
+            if method == 'PATCH':
+                return 200, self._replace(order, body).raw()
+        elif resource == 'positions' and key is None:
+            if method == 'GET':
+                return 200, [self._position_raw(p) for _, p in
+                             sorted(self._positions.items())]
+            if method == 'DELETE':
+                if _flag(query.get('cancel_orders')):
+                    self._cancel_all()
+                return 207, [{'symbol': s, 'status': 200,
+                              'body': self._close(s, query).raw()}
+                             for s in sorted(self._positions)]
+        elif resource == 'positions':
+            if key not in self._positions:
+                raise _not_found('position does not exist')
+            if method == 'GET':
+                return 200, self._position_raw(self._positions[key])
+            if method == 'DELETE':
+                return 200, self._close(key, query).raw()
+        elif resource == 'account' and key is None and method == 'GET':
+            return 200, self._account_raw()
+        elif resource == 'clock' and method == 'GET':
+            return 200, self._clock_raw()
+        raise _not_found('{} {} is not simulated'.format(method, path))
+
+    def _submit(self, body: dict) -> _Order:
+        symbol = body.get('symbol')
+        side = body.get('side', 'buy')
+        kind = body.get('type', 'market')
+        tif = body.get('time_in_force', 'day')
+        order_class = body.get('order_class') or 'simple'
+        if not symbol:
+            raise _unprocessable('symbol is required')
+        if side not in ('buy', 'sell'):
+            raise _unprocessable('invalid side: {}'.format(side))
+        if kind not in ORDER_TYPES:
+            raise _unprocessable('invalid order type: {}'.format(kind))
+        if tif not in TIME_IN_FORCE:
+            raise _unprocessable('invalid time_in_force: {}'.format(tif))
+        if order_class not in ORDER_CLASSES:
+            raise _unprocessable('invalid order_class: {}'.format(
+                order_class))
+        qty = _float(body.get('qty'))
+        notional = _float(body.get('notional'))
+        if (qty is None) == (notional is None):
+            raise _unprocessable('qty or notional is required')
+        if (qty if qty is not None else notional) <= 0:
+            raise _unprocessable('qty must be > 0')
+        if notional is not None and (kind != 'market' or tif != 'day'):
+            raise _unprocessable(
+                'notional orders must be market orders with day time in '
+                'force')
+        client_order_id = body.get('client_order_id')
+        if client_order_id in self._client_ids:
+            raise _unprocessable('client_order_id must be unique')
+        take_profit = body.get('take_profit') or {}
+        stop_loss = body.get('stop_loss') or {}
+        if order_class == 'oco':
+            # the take profit limit is the order itself, the stop its leg
+            if kind != 'limit':
+                raise _unprocessable('oco orders must be limit orders')
+            body = dict(body, limit_price=take_profit.get(
+                'limit_price', body.get('limit_price')))
+        order = self._new_order(symbol, side, kind, tif, body)
+        order.qty = qty
+        order.notional = notional
+        order.client_order_id = client_order_id or _client_id(order)
+        order.order_class = '' if order_class == 'simple' else order_class
+        order.extended_hours = bool(body.get('extended_hours'))
+        # an oco pair closes a position on its own, its legs are on its side
+        exit_side = side if order_class == 'oco' else \
+            'sell' if side == 'buy' else 'buy'
+        if order_class in ('bracket', 'oco') or \
+                (order_class == 'oto' and take_profit):
+            if 'limit_price' not in take_profit and order_class != 'oco':
+                raise _unprocessable('take_profit.limit_price is required')
+            if order_class != 'oco':
+                order.legs.append(self._new_order(
+                    symbol, exit_side, 'limit', tif, take_profit))
+        if order_class in ('bracket', 'oco') or \
+                (order_class == 'oto' and stop_loss):
+            if 'stop_price' not in stop_loss:
+                raise _unprocessable('stop_loss.stop_price is required')
+            order.legs.append(self._new_order(
+                symbol, exit_side,
+                'stop_limit' if 'limit_price' in stop_loss else 'stop',
+                tif, stop_loss))
+        if order_class == 'oto' and len(order.legs) != 1:
+            raise _unprocessable(
+                'oto orders need one of take_profit or stop_loss')
+        for leg in order.legs:
+            leg.qty = qty
+            leg.parent = order
+            leg.order_class = order.order_class
+            leg.client_order_id = _client_id(leg)
+            leg.status = 'new' if order_class == 'oco' else 'held'
+        self._check_buying_power(order)
+        self._accept(order)
+        for leg in order.legs:
+            self._accept(leg)
+        if symbol in self._quotes:
+            self._match(symbol, *self._quote_prices(symbol))
+        return order
+
+    def _new_order(self, symbol: str, side: str, kind: str, tif: str,
+                   prices: dict) -> _Order:
+        order = _Order(next(self._seq), symbol, side, kind, tif, self._now)
+        order.limit_price = _float(prices.get('limit_price'))
+        order.stop_price = _float(prices.get('stop_price'))
+        order.trail_price = _float(prices.get('trail_price'))
+        order.trail_percent = _float(prices.get('trail_percent'))
+        if kind in ('limit', 'stop_limit') and order.limit_price is None:
+            raise _unprocessable('limit_price is required')
+        if kind in ('stop', 'stop_limit') and order.stop_price is None:
+            raise _unprocessable('stop_price is required')
+        if kind == 'trailing_stop':
+            if (order.trail_price is None) == (order.trail_percent is None):
+                raise _unprocessable(
+                    'one of trail_price or trail_percent is required')
+            order.hwm = self._prices.get(symbol)
+        return order
+
+    def _check_buying_power(self, order: _Order):
+        if order.side == 'buy':
+            price = order.limit_price or order.stop_price or \
+                self._reference_price(order.symbol, 'buy')
+            cost = order.notional if order.notional is not None else \
+                (order.qty * price if price else 0.0)
+            available = self._buying_power()
+            if cost > available + _EPSILON:
+                raise SimulatorError(403, 40310000,
+                                     'insufficient buying power')
+            order.reserved = cost
+            return
+        if self.shorting:
+            return
+        position = self._positions.get(order.symbol)
+        working = self._open.get(order.symbol, {}).values()
+        held = sum(o.qty or 0.0 for o in working
+                   if o.side == 'sell' and o.parent is None)
+        available = (position.qty if position else 0.0) - held
+        requested = order.qty if order.qty is not None else 0.0
+        if requested > available + _EPSILON:
+            raise SimulatorError(
+                403, 40310000,
+                'insufficient qty available for order (requested: {}, '
+                'available: {})'.format(_number(requested),
+                                        _number(max(available, 0.0))))
+
+    def _accept(self, order: _Order):
+        self._orders[order.id] = order
+        self._client_ids[order.client_order_id] = order
+        self._history.append(order)
+        self._reserved += order.reserved
+        if order.status == 'new':
+            self._open.setdefault(order.symbol, {})[order.id] = order
+            self._emit('new', order)
+
+    def _list_orders(self, query: Dict[str, str]) -> List[dict]:
+        status = query.get('status', 'open')
+        if status not in ('open', 'closed', 'all'):
+            raise _unprocessable('invalid status: {}'.format(status))
+        limit = min(int(query.get('limit', ORDERS_DEFAULT_LIMIT)),
+                    ORDERS_MAX_LIMIT)
+        after = _to_ns(query['after']) if query.get('after') else None
+        until = _to_ns(query['until']) if query.get('until') else None
+        nested = _flag(query.get('nested'))
+        side = query.get('side')
+        symbols = None
+        if query.get('symbols'):
+            symbols = set(query['symbols'].upper().split(','))
+        # the open orders are few, the history can be millions long
+        orders = self._open_orders() if status == 'open' else self._history
+        if query.get('direction', 'desc') == 'desc':
+            orders = reversed(orders)
+        result = []
+        for order in orders:
+            if nested and order.parent is not None:
+                continue
+            if status == 'open' and not order.is_open or \
+                    status == 'closed' and order.is_open:
+                continue
+            if after is not None and order.created_at <= after or \
+                    until is not None and order.created_at > until:
+                continue
+            if side and order.side != side or \
+                    symbols is not None and order.symbol not in symbols:
+                continue
+            result.append(order.raw(nested))
+            if len(result) >= limit:
+                break
+        return result
+
+    def _cancel_order(self, order: _Order):
+        if not order.is_open:
+            raise _unprocessable('order is already in "{}" state'.format(
+                order.status))
+        self._close_order(order, 'canceled')
+
+    def _cancel_all(self) -> List[_Order]:
+        canceled = []
+        for order in self._open_orders():
+            if order.is_open:
+                canceled.append(order)
+                self._close_order(order, 'canceled')
+        return canceled
+
+    def _open_orders(self) -> List[_Order]:
+        """the working orders and the legs they hold, oldest first"""
+        orders = []
+        for working in self._open.values():
+            for order in working.values():
+                orders.append(order)
+                orders.extend(leg for leg in order.legs
+                              if leg.status == 'held')
+        orders.sort(key=lambda o: o.seq)
+        return orders
+
+    def _replace(self, order: _Order, body: dict) -> _Order:
+        if order.status != 'new':
+            raise _unprocessable('order is already in "{}" state'.format(
+                order.status))
+        client_order_id = body.get('client_order_id')
+        if client_order_id in self._client_ids:
+            raise _unprocessable('client_order_id must be unique')
+        prices = {'limit_price': body.get('limit_price', order.limit_price),
+                  'stop_price': body.get('stop_price', order.stop_price),
+                  'trail_price': order.trail_price,
+                  'trail_percent': order.trail_percent}
+        if body.get('trail') is not None:
+            key = 'trail_price' if order.trail_price is not None \
+                else 'trail_percent'
+            prices[key] = body['trail']
+        new = self._new_order(order.symbol, order.side, order.type,
+                              body.get('time_in_force', order.time_in_force),
+                              prices)
+        new.qty = _float(body.get('qty')) or order.qty
+        new.notional = order.notional
+        new.client_order_id = client_order_id or _client_id(new)
+        new.order_class = order.order_class
+        new.extended_hours = order.extended_hours
+        new.hwm = order.hwm if order.hwm is not None else new.hwm
+        if new.side == 'buy' and order.parent is None:
+            # the replacement may use what the original holds, and is
+            # rejected like a new order otherwise, leaving the original
+            self._reserved -= order.reserved
+            try:
+                self._check_buying_power(new)
+            finally:
+                self._reserved += order.reserved
+        new.replaces = order.id
+        new.parent = order.parent
+        new.legs = order.legs
+        for leg in new.legs:
+            leg.parent = new
+        if new.parent is not None:
+            legs = new.parent.legs
+            legs[legs.index(order)] = new
+        order.legs = []
+        self._release(order)
+        order.status = 'replaced'
+        order.replaced_by = new.id
+        order.replaced_at = order.updated_at = self._now
+        self._emit('replaced', order)
+        self._accept(new)
+        return new
+
+    def _close(self, symbol: str, query: Dict[str, str]) -> _Order:
+        position = self._positions[symbol]
+        qty = abs(position.qty)
+        if query.get('qty'):
+            qty = min(float(query['qty']), qty)
+        elif query.get('percentage'):
+            qty = qty * float(query['percentage']) / 100
+        return self._submit({
+            'symbol': symbol, 'qty': qty, 'type': 'market',
+            'side': 'sell' if position.qty > 0 else 'buy',
+            'time_in_force': 'day'})
+
+    def _account_raw(self) -> dict:
+        long_value, short_value = self._market_values()
+        equity = self._cash + long_value + short_value
+        return {
+            'id': self.account_id,
+            'account_number': 'SIM' + self.account_id[:8].upper(),
+            'status': 'ACTIVE',
+            'currency': 'USD',
+            'cash': _number(self._cash),
+            'portfolio_value': _number(equity),
+            'equity': _number(equity),
+            'last_equity': _number(self._last_equity),
+            'long_market_value': _number(long_value),
+            'short_market_value': _number(short_value),
+            'buying_power': _number(self._buying_power()),
+            'regt_buying_power': _number(self._buying_power()),
+            'daytrading_buying_power': '0',
+            'non_marginable_buying_power': _number(max(self._cash, 0.0)),
+            'initial_margin': '0',
+            'maintenance_margin': '0',
+            'multiplier': _number(self.multiplier),
+            'pattern_day_trader': False,
+            'trading_blocked': False,
+            'transfers_blocked': False,
+            'account_blocked': False,
+            'trade_suspended_by_user': False,
+            'shorting_enabled': self.shorting,
+            'created_at': _iso(0),
+        }
+
+    def _position_raw(self, position: _Position) -> dict:
+        price = self._prices.get(position.symbol, position.avg_entry_price)
+        cost = position.qty * position.avg_entry_price
+        value = position.qty * price
+        return {
+            'asset_id': _asset_id(position.symbol),
+            'symbol': position.symbol,
+            'exchange': '',
+            'asset_class': 'us_equity',
+            'avg_entry_price': _number(position.avg_entry_price),
+            'qty': _number(position.qty),
+            'qty_available': _number(position.qty),
+            'side': 'long' if position.qty > 0 else 'short',
+            'market_value': _number(value),
+            'cost_basis': _number(cost),
+            'unrealized_pl': _number(value - cost),
+            'unrealized_plpc': _number((value - cost) / abs(cost)
+                                       if cost else 0.0),
+            'current_price': _number(price),
+        }
+
+    def _clock_raw(self) -> dict:
+        local = pd.Timestamp(self._now, tz='UTC').tz_convert(NY)
+        day = local.normalize()
+        is_open = local.weekday() < 5 and \
+            _MARKET_HOURS[0] <= local.time() < _MARKET_HOURS[1]
+        next_open = next_close = None
+        for offset in range(8):
+            date = (day + pd.Timedelta(days=offset)).date()
+            if date.weekday() >= 5:
+                continue
+            opens = pd.Timestamp(datetime.datetime.combine(
+                date, _MARKET_HOURS[0]), tz=NY)
+            closes = pd.Timestamp(datetime.datetime.combine(
+                date, _MARKET_HOURS[1]), tz=NY)
+            if next_open is None and opens > local:
+                next_open = opens
+            if next_close is None and closes > local:
+                next_close = closes
+            if next_open is not None and next_close is not None:
+                break
+        return {'timestamp': local.isoformat(), 'is_open': is_open,
+                'next_open': next_open.isoformat(),
+                'next_close': next_close.isoformat()}
+
+    # matching
+
+    def _advance(self, ns: int):
+        if ns <= self._now:
+            return
+        self._now = ns
+        if self._next_day is None or ns >= self._next_day:
+            if self._next_day is not None:
+                self._expire_day_orders()
+                long_value, short_value = self._market_values()
+                self._last_equity = self._cash + long_value + short_value
+            local = pd.Timestamp(ns, tz='UTC').tz_convert(NY).normalize()
+            self._next_day = (local + pd.Timedelta(days=1)).normalize() \
+                .tz_convert('UTC').value
+
+    def _expire_day_orders(self):
+        for order in self._open_orders():
+            if order.is_open and \
+                    order.time_in_force in ('day', 'opg', 'cls'):
+                self._close_order(order, 'expired')
+
+    def _bar(self, symbol: str, ns: int, open_: float, high: float,
+             low: float, close: float):
+        self._advance(ns)
+        self._quotes.pop(symbol, None)
+        prices = (open_, high, low)
+        self._match(symbol, prices, prices)
+        self._prices[symbol] = close
+
+    def _quote(self, symbol: str, ns: int, bid: float, ask: float):
+        self._advance(ns)
+        self._quotes[symbol] = (bid, ask)
+        self._prices[symbol] = (bid + ask) / 2
+        self._match(symbol, *self._quote_prices(symbol))
+
+    def _quote_prices(self, symbol: str):
+        bid, ask = self._quotes[symbol]
+        return (ask, ask, ask), (bid, bid, bid)
+
+    def _match(self, symbol: str, buy: tuple, sell: tuple):
+        """fill the open orders of symbol the (open, high, low) of the
+        buy and sell side reach"""
+        orders = self._open.get(symbol)
+        if not orders:
+            return
+        working = sorted(orders.values(),
+                         key=lambda o: (o.type not in _STOPS, o.seq))
+        for order in working:
+            if not order.is_open:
+                continue    # canceled by a sibling filled before it
+            price = _fill_price(order, *(buy if order.side == 'buy'
+                                         else sell))
+            if price is not None:
+                self._fill(order, price)
+            elif order.time_in_force in ('ioc', 'fok'):
+                self._close_order(order, 'canceled')
+
+    def _fill(self, order: _Order, price: float):
+        qty = order.qty if order.qty is not None else order.notional / price
+        signed = qty if order.side == 'buy' else -qty
+        self._cash -= signed * price
+        position = self._positions.get(order.symbol)
+        if position is None:
+            position = self._positions[order.symbol] = _Position(
+                order.symbol)
+        old = position.qty
+        new = old + signed
+        if abs(new) < _EPSILON:
+            del self._positions[order.symbol]
+            new = 0.0
+        elif old == 0 or (old > 0) != (new > 0):
+            position.avg_entry_price = price
+        elif abs(new) > abs(old):
+            position.avg_entry_price = (position.avg_entry_price * abs(old) +
+                                        price * qty) / abs(new)
+        position.qty = new
+        self._release(order)
+        order.qty = qty
+        order.status = 'filled'
+        order.filled_qty = qty
+        order.filled_avg_price = price
+        order.filled_at = order.updated_at = self._now
+        self._emit('fill', order, execution_id=str(uuid.UUID(
+            int=(1 << 64) + next(self._executions))), price=_number(price),
+            qty=_number(qty), position_qty=_number(new))
+        if order.parent is not None:
+            parent = order.parent
+            group = parent.legs + ([parent] if parent.order_class == 'oco'
+                                   else [])
+            for other in group:
+                if other is not order and other.is_open:
+                    self._close_order(other, 'canceled')
+        elif order.order_class == 'oco':
+            for leg in order.legs:
+                if leg.is_open:
+                    self._close_order(leg, 'canceled')
+        else:
+            for leg in order.legs:
+                leg.status = 'new'
+                leg.updated_at = self._now
+                if leg.type == 'trailing_stop' and leg.hwm is None:
+                    leg.hwm = price
+                self._open.setdefault(leg.symbol, {})[leg.id] = leg
+                self._emit('new', leg)
+
+    def _close_order(self, order: _Order, status: str):
+        """cancel or expire an open order and its open legs"""
+        self._release(order)
+        order.status = status
+        order.updated_at = self._now
+        if status == 'canceled':
+            order.canceled_at = self._now
+        else:
+            order.expired_at = self._now
+        self._emit(status, order)
+        for leg in order.legs:
+            if leg.is_open:
+                self._close_order(leg, status)
+
+    def _release(self, order: _Order):
+        orders = self._open.get(order.symbol)
+        if orders is not None:
+            orders.pop(order.id, None)
+        self._reserved -= order.reserved
+        order.reserved = 0.0
+
+    def _reference_price(self, symbol: str, side: str) -> Optional[float]:
+        quote = self._quotes.get(symbol)
+        if quote is not None:
+            return quote[1] if side == 'buy' else quote[0]
+        return self._prices.get(symbol)
+
+    def _market_values(self) -> Tuple[float, float]:
+        long_value = short_value = 0.0
+        for symbol, position in self._positions.items():
+            value = position.qty * self._prices.get(
+                symbol, position.avg_entry_price)
+            if value > 0:
+                long_value += value
+            else:
+                short_value += value
+        return long_value, short_value
+
+    def _buying_power(self) -> float:
+        long_value, short_value = self._market_values()
+        equity = self._cash + long_value + short_value
+        exposure = long_value - short_value
+        return max(equity * self.multiplier - exposure - self._reserved, 0.0)
+
+    # events
+
+    def _emit(self, event: str, order: _Order, **fields):
+        if not self._handlers:
+            return
+        data = {'event': event, 'order': order.raw(),
+                'timestamp': _iso(self._now)}
+        data.update(fields)
+        self._events.append({'stream': 'trade_updates', 'data': data})
+
+    def _deliver(self):
+        """hand the queued updates to the handlers, outside of the lock.
+        updates caused by a handler are queued and delivered after it."""
+        with self._lock:
+            if self._delivering:
+                return
+            self._delivering = True
+        try:
+            while True:
+                with self._lock:
+                    if not self._events:
+                        return
+                    msg = self._events.popleft()
+                    handlers = list(self._handlers)
+                update = msg if self._raw_data else Entity(msg['data'])
+                for handler in handlers:
+                    self._call(handler, update)
+        finally:
+            with self._lock:
+                self._delivering = False
+
+    def _call(self, handler: Callable, update):
+        result = handler(update)
+        if not inspect.isawaitable(result):
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not None:
+            running.create_task(result)
+            return
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(result)
+
+
+class SimulatorAdapter(BaseAdapter):
+    """
+    requests transport answering the trading api host from a
+    BrokerSimulator and sending everything else through passthrough
+    """
+
+    def __init__(self, broker: BrokerSimulator,
+                 passthrough: BaseAdapter = None):
+        super().__init__()
+        self.broker = broker
+        self.host = urlsplit(broker.base_url).netloc
+        self.passthrough = passthrough or build_adapter()
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        if parts.netloc != self.host:
+            return self.passthrough.send(request, **kwargs)
+        body = request.body
+        if isinstance(body, bytes):
+            body = body.decode()
+        status, payload = self.broker.handle(
+            request.method, unquote(parts.path), dict(parse_qsl(parts.query)),
+            json.loads(body) if body else None)
+        response = requests.Response()
+        response.status_code = status
+        response.reason = http.client.responses.get(status, '')
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        response.headers['Content-Type'] = 'application/json'
+        response._content = b'' if payload is None else \
+            json.dumps(payload).encode()
+        return response
+
+    def close(self):
+        self.passthrough.close()
+
+
+def _fill_price(order: _Order, open_: float, high: float,
+                low: float) -> Optional[float]:
+    """the price order fills at on a bar (open, high, low), if it does"""
+    buy = order.side == 'buy'
+    kind = order.type
+    if kind == 'market':
+        return open_
+    if kind == 'limit' or kind == 'stop_limit' and order.triggered:
+        return _limit_price(buy, order.limit_price, open_, high, low)
+    if kind == 'trailing_stop':
+        if order.hwm is None:
+            order.hwm = open_
+        if buy:
+            stop = order.hwm + order.trail_price if order.trail_price \
+                is not None else order.hwm * (1 + order.trail_percent / 100)
+        else:
+            stop = order.hwm - order.trail_price if order.trail_price \
+                is not None else order.hwm * (1 - order.trail_percent / 100)
+        order.stop_price = stop
+        if buy and high >= stop:
+            return max(open_, stop)
+        if not buy and low <= stop:
+            return min(open_, stop)
+        # the stop follows the best price seen, from the next bar on
+        order.hwm = min(order.hwm, low) if buy else max(order.hwm, high)
+        return None
+    # stop and stop_limit
+    stop = order.stop_price
+    if buy and high >= stop:
+        trigger = max(open_, stop)
+    elif not buy and low <= stop:
+        trigger = min(open_, stop)
+    else:
+        return None
+    if kind == 'stop':
+        return trigger
+    order.triggered = True
+    # once triggered a stop limit is a limit order. on the triggering bar
+    # only the trigger price is known to have traded after the stop
+    if buy and trigger <= order.limit_price or \
+            not buy and trigger >= order.limit_price:
+        return trigger
+    return None
+
+
+def _limit_price(buy: bool, limit: float, open_: float, high: float,
+                 low: float) -> Optional[float]:
+    if buy and low <= limit:
+        return min(open_, limit)
+    if not buy and high >= limit:
+        return max(open_, limit)
+    return None
+
+
+def _float(value) -> Optional[float]:
+    return None if value is None or value == '' else float(value)
+
+
+def _flag(value) -> bool:
+    return str(value).lower() in ('true', '1')
+
+
+def _number(value) -> Optional[str]:
+    """a number in the string form of the api"""
+    if value is None:
+        return None
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _iso(ns: Optional[int]) -> Optional[str]:
+    if ns is None:
+        return None
+    return pd.Timestamp(ns, tz='UTC').strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _to_ns(value) -> int:
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return ts.value
+
+
+def _client_id(order: _Order) -> str:
+    # deterministic, so two runs of a backtest produce the same orders
+    return str(uuid.UUID(int=(2 << 64) + order.seq))
+
+
+def _asset_id(symbol: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, 'asset/' + symbol))
@@ -0,0 +1,493 @@
+import asyncio
+import base64
+import functools
+import json
+import logging
+import re
+import socket
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import msgpack
+import numpy as np
+import pandas as pd
+from aiohttp import WSMsgType, web
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SYMBOLS = ('AAPL', 'AMZN', 'GOOG', 'META', 'MSFT', 'NVDA', 'SPY',
+                   'TSLA')
+DEFAULT_START = '2021-01-04T00:00:00Z'
+DEFAULT_TICK_INTERVAL = 0.001       # seconds between two trades or quotes
+DEFAULT_ITEMS = 100000              # per symbol and request
+DEFAULT_PAGE_LIMIT = 1000
+MAX_PAGE_LIMIT = 10000
+# channels of the stock data stream and the message type they carry
+DATA_CHANNELS = {'trades': 't', 'quotes': 'q', 'bars': 'b',
+                 'updatedBars': 'u', 'dailyBars': 'd', 'statuses': None,
+                 'lulds': None}
+# stream frames are encoded once and sent in a cycle of this many
+_FRAME_CYCLE = 16
+_TIMEFRAME = re.compile(r'^(\d+)(Min|T|Hour|H|Day|D|Week|W|Month|M)$')
+_TIMEFRAME_SECONDS = {'Min': 60, 'T': 60, 'Hour': 3600, 'H': 3600,
+                      'Day': 86400, 'D': 86400, 'Week': 7 * 86400,
+                      'W': 7 * 86400, 'Month': 30 * 86400, 'M': 30 * 86400}
+
+
+class StandInServer(object):
+    """
+    a local stand-in for the alpaca data and streaming servers, to load
+    test and benchmark this client offline and deterministically:
+
+    - the historical trades, quotes and bars endpoints, single and multi
+      symbol, paginated with next_page_token like the data api
+    - the msgpack stock data stream (/v2/iex, /v2/sip): connected, auth
+      and subscribe handshake, then trades, quotes and bars of the
+      subscribed symbols at message_rate messages per second
+    - the json trading stream (/stream): authenticate and listen, then
+      trade_updates at trade_update_rate messages per second
+
+    the data is synthetic but the same for the same arguments: trades
+    and quotes every tick_interval seconds and bars every timeframe from
+    start, with prices moving smoothly around a per-symbol level. stream
+    frames are encoded once and sent in a cycle.
+
+        with StandInServer(message_rate=50000) as server:
+            os.environ['APCA_API_DATA_URL'] = server.url
+            api = REST('key', 'secret', base_url=server.url)
+            stream = Stream('key', 'secret', base_url=server.url,
+                            data_stream_url=server.url)
+    """
+
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 symbols: Iterable[str] = DEFAULT_SYMBOLS,
+                 items: int = DEFAULT_ITEMS,
+                 tick_interval: float = DEFAULT_TICK_INTERVAL,
+                 message_rate: float = 0,
+                 batch_size: int = 100,
+                 max_messages: Optional[int] = None,
+                 trade_update_rate: float = 0,
+                 latency: float = 0.0,
+                 key_id: str = None,
+                 secret_key: str = None):
+        """
+        :param port: 0 picks a free port, see url
+        :param symbols: the symbols a '*' subscription streams
+        :param items: max trades, quotes or bars per symbol of a request
+        :param tick_interval: seconds between two trades or quotes
+        :param message_rate: data stream messages per second and
+               connection, 0 for as fast as the connection takes them
+        :param batch_size: data stream messages per frame
+        :param max_messages: stop streaming after this many messages per
+               connection, e.g. to time a fixed amount of work
+        :param trade_update_rate: trading stream messages per second, 0
+               for as fast as possible
+        :param latency: seconds every rest response is delayed by
+        :param key_id: credentials to accept. None accepts any.
+        """
+        self.host = host
+        self.symbols = sorted(symbols)
+        self.items = int(items)
+        self.tick_interval = int(tick_interval * 10 ** 9)
+        self.message_rate = message_rate
+        self.batch_size = max(int(batch_size), 1)
+        self.max_messages = max_messages
+        self.trade_update_rate = trade_update_rate
+        self.latency = latency
+        self._credentials = (key_id, secret_key)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self.port = self._socket.getsockname()[1]
+        self._loop = None
+        self._thread = None
+        self._runner = None
+
+    @property
+    def url(self) -> str:
+        """base url of the rest endpoints and, as ws://, of the streams"""
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/v2/stocks/{kind:trades|quotes|bars}',
+                           self._historical)
+        app.router.add_get('/v2/stocks/{symbol}/{kind:trades|quotes|bars}',
+                           self._historical)
+        app.router.add_get('/v2/{feed:iex|sip|test}', self._data_stream)
+        app.router.add_get('/stream', self._trading_stream)
+        app.router.add_get('/stream/', self._trading_stream)
+        return app
+
+    def start(self) -> 'StandInServer':
+        """serve from a daemon thread until stop()"""
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def serve():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._setup())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, daemon=True,
+                                        name='alpaca-standin')
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def run(self):
+        """serve in the calling thread until interrupted"""
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(self._setup())
+        log.info('serving on {}'.format(self.url))
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(self._runner.cleanup())
+            loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    async def _setup(self):
+        # no access log, it would cost more than serving a page from cache
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        await web.SockSite(self._runner, self._socket).start()
+
+    # rest
+
+    async def _historical(self, request: web.Request) -> web.Response:
+        kind = request.match_info['kind']
+        query = request.query
+        symbol = request.match_info.get('symbol')
+        if symbol is not None:
+            symbols = (symbol.upper(),)
+        elif query.get('symbols'):
+            symbols = tuple(sorted(set(query['symbols'].upper().split(','))))
+        else:
+            return _error(400, 40010001, 'symbols is required')
+        try:
+            interval = self.tick_interval if kind != 'bars' else \
+                _timeframe_ns(query.get('timeframe', '1Min'))
+            start = _to_ns(query.get('start') or DEFAULT_START)
+            count = self.items
+            if query.get('end'):
+                span = _to_ns(query['end']) - start
+                count = min(count, max(-(-span // interval), 0))
+            limit = int(query.get('limit') or DEFAULT_PAGE_LIMIT)
+            position = _decode_token(query.get('page_token'))
+        except ValueError as e:
+            return _error(422, 42210000, str(e))
+        if not 0 < limit <= MAX_PAGE_LIMIT:
+            return _error(422, 42210000, 'invalid limit: {}'.format(limit))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        body = _page(kind, symbols, symbol is None, start, interval, count,
+                     position, limit)
+        return web.Response(body=body, content_type='application/json')
+
+    # streams
+
+    async def _data_stream(self, request: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_bytes(msgpack.packb(
+            [{'T': 'success', 'msg': 'connected'}]))
+        subscriptions = {channel: set() for channel in DATA_CHANNELS}
+        authenticated = False
+        publisher = None
+        try:
+            async for frame in ws:
+                if frame.type not in (WSMsgType.BINARY, WSMsgType.TEXT):
+                    continue
+                msg = msgpack.unpackb(frame.data) \
+                    if frame.type == WSMsgType.BINARY \
+                    else json.loads(frame.data)
+                action = msg.get('action')
+                if action == 'auth':
+                    authenticated = self._authorized(msg.get('key'),
+                                                     msg.get('secret'))
+                    reply = {'T': 'success', 'msg': 'authenticated'} \
+                        if authenticated else \
+                        {'T': 'error', 'code': 402, 'msg': 'auth failed'}
+                elif not authenticated:
+                    reply = {'T': 'error', 'code': 401,
+                             'msg': 'not authenticated'}
+                elif action in ('subscribe', 'unsubscribe'):
+                    for channel, symbols in subscriptions.items():
+                        change = set(msg.get(channel) or ())
+                        if action == 'subscribe':
+                            symbols |= change
+                        else:
+                            symbols -= change
+                    reply = {'T': 'subscription'}
+                    reply.update({c: sorted(s)
+                                  for c, s in subscriptions.items()})
+                    if publisher is not None:
+                        publisher.cancel()
+                    publisher = asyncio.ensure_future(self._publish(
+                        ws, self._frames(subscriptions)))
+                else:
+                    reply = {'T': 'error', 'code': 400,
+                             'msg': 'invalid syntax'}
+                await ws.send_bytes(msgpack.packb([reply]))
+        finally:
+            if publisher is not None:
+                publisher.cancel()
+        return ws
+
+    async def _trading_stream(self, request: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        authenticated = False
+        publisher = None
+        try:
+            async for frame in ws:
+                if frame.type not in (WSMsgType.BINARY, WSMsgType.TEXT):
+                    continue
+                msg = json.loads(frame.data)
+                data = msg.get('data') or {}
+                action = msg.get('action')
+                if action == 'authenticate':
+                    authenticated = self._authorized(data.get('key_id'),
+                                                     data.get('secret_key'))
+                    reply = {'stream': 'authorization', 'data': {
+                        'action': 'authenticate',
+                        'status': 'authorized' if authenticated
+                        else 'unauthorized'}}
+                elif action == 'listen' and authenticated:
+                    streams = list(data.get('streams') or ())
+                    reply = {'stream': 'listening',
+                             'data': {'streams': streams}}
+                    if publisher is None and 'trade_updates' in streams:
+                        publisher = asyncio.ensure_future(self._publish(
+                            ws, _trade_updates(), text=True,
+                            rate=self.trade_update_rate))
+                else:
+                    reply = {'stream': 'listening', 'data': {
+                        'error': 'access key verification failed'}}
+                await ws.send_str(json.dumps(reply))
+        finally:
+            if publisher is not None:
+                publisher.cancel()
+        return ws
+
+    def _authorized(self, key_id: str, secret_key: str) -> bool:
+        expected_key, expected_secret = self._credentials
+        return (expected_key is None or key_id == expected_key) and \
+            (expected_secret is None or secret_key == expected_secret)
+
+    def _frames(self, subscriptions: Dict[str, set]) -> List[Tuple[bytes,
+                                                                   int]]:
+        """a cycle of encoded frames of the subscribed streams"""
+        streams = []
+        for channel, symbols in subscriptions.items():
+            kind = DATA_CHANNELS[channel]
+            if kind is None or not symbols:
+                continue
+            wanted = self.symbols if '*' in symbols else sorted(symbols)
+            streams.extend((kind, s) for s in wanted)
+        if not streams:
+            return []
+        frames = []
+        seq = 0
+        start = _to_ns(DEFAULT_START)
+        for _ in range(_FRAME_CYCLE):
+            msgs = []
+            for _ in range(self.batch_size):
+                kind, symbol = streams[seq % len(streams)]
+                msgs.append(_stream_message(kind, symbol, seq,
+                                            start + seq * self.tick_interval))
+                seq += 1
+            frames.append((msgpack.packb(msgs), len(msgs)))
+        return frames
+
+    async def _publish(self, ws: web.WebSocketResponse,
+                       frames: List[Tuple[object, int]], text: bool = False,
+                       rate: float = None):
+        """send frames in a cycle at rate messages per second, up to
+        max_messages"""
+        if not frames:
+            return
+        if rate is None:
+            rate = self.message_rate
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        sent = 0
+        for frame, size in _cycle(frames):
+            if self.max_messages is not None and sent >= self.max_messages:
+                return
+            if ws.closed:
+                return
+            if text:
+                await ws.send_str(frame)
+            else:
+                await ws.send_bytes(frame)
+            sent += size
+            delay = started + sent / rate - loop.time() if rate else 0
+            # yield even when not pacing, so other connections progress
+            await asyncio.sleep(max(delay, 0))
+
+
+def _cycle(frames):
+    while True:
+        yield from frames
+
+
+def _error(status: int, code: int, message: str) -> web.Response:
+    return web.json_response({'code': code, 'message': message},
+                             status=status)
+
+
+def _to_ns(value: str) -> int:
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return ts.value
+
+
+def _timeframe_ns(timeframe: str) -> int:
+    match = _TIMEFRAME.match(timeframe)
+    if match is None:
+        raise ValueError('invalid timeframe: {}'.format(timeframe))
+    return int(match.group(1)) * _TIMEFRAME_SECONDS[match.group(2)] * 10 ** 9
+
+
+def _encode_token(position: int) -> str:
+    return base64.urlsafe_b64encode(str(position).encode()).decode()
+
+
+def _decode_token(token: Optional[str]) -> int:
+    if not token:
+        return 0
+    try:
+        return int(base64.urlsafe_b64decode(token.encode()))
+    except Exception:
+        raise ValueError('invalid page_token') from None
+
+
+@functools.lru_cache(maxsize=256)
+def _page(kind: str, symbols: Tuple[str, ...], multi: bool, start: int,
+          interval: int, count: int, position: int, limit: int) -> bytes:
+    """
+    the encoded page of limit items from position, in the order of the
+    api: by symbol, then by time
+    """
+    total = count * len(symbols)
+    end = min(position + limit, total)
+    grouped = {}
+    at = position
+    while at < end:
+        symbol = symbols[at // count]
+        first = at % count
+        last = min(count, first + end - at)
+        grouped[symbol] = _items(kind, symbol, start, interval, first, last)
+        at += last - first
+    body = {'next_page_token': _encode_token(end) if end < total else None}
+    if multi:
+        body[kind] = grouped
+    else:
+        body[kind] = grouped.get(symbols[0], [])
+        body['symbol'] = symbols[0]
+    return json.dumps(body).encode()
+
+
+def _items(kind: str, symbol: str, start: int, interval: int, first: int,
+           last: int) -> List[dict]:
+    k = np.arange(first, last)
+    stamps = np.datetime_as_string(
+        (start + k * interval).astype('datetime64[ns]'), unit='ns')
+    price = _prices(symbol, k)
+    size = 1 + (k * 7919 + 13) % 500
+    if kind == 'trades':
+        return [{'t': t + 'Z', 'x': 'V', 'p': p, 's': s, 'c': ['@'],
+                 'i': i, 'z': 'C'}
+                for t, p, s, i in zip(stamps.tolist(), price.tolist(),
+                                      size.tolist(), (k + 1).tolist())]
+    if kind == 'quotes':
+        return [{'t': t + 'Z', 'ax': 'V', 'ap': round(p + 0.01, 2),
+                 'as': s, 'bx': 'V', 'bp': p, 'bs': s, 'c': ['R'],
+                 'z': 'C'}
+                for t, p, s in zip(stamps.tolist(), price.tolist(),
+                                   size.tolist())]
+    close = _prices(symbol, k + 1)
+    return [{'t': t + 'Z', 'o': o, 'h': round(max(o, c) + 0.05, 2),
+             'l': round(min(o, c) - 0.05, 2), 'c': c, 'v': int(v) * 10,
+             'n': int(v) // 5 + 1, 'vw': round((o + c) / 2, 4)}
+            for t, o, c, v in zip(stamps.tolist(), price.tolist(),
+                                  close.tolist(), size.tolist())]
+
+
+def _prices(symbol: str, k: np.ndarray) -> np.ndarray:
+    """a smooth, deterministic price path of symbol"""
+    seed = zlib.crc32(symbol.encode())
+    level = 20 + seed % 480
+    phase = (seed >> 9) % 628 / 100
+    noise = ((np.floor(k) * 2654435761) % 1000 - 500) / 100000
+    return np.round(level * (1 + 0.02 * np.sin(k / 500 + phase) + noise), 2)
+
+
+def _stream_message(kind: str, symbol: str, seq: int, ns: int) -> dict:
+    t = msgpack.Timestamp.from_unix_nano(ns)
+    price = float(_prices(symbol, np.array([seq]))[0])
+    size = 1 + (seq * 7919 + 13) % 500
+    if kind == 't':
+        return {'T': 't', 'S': symbol, 'i': seq + 1, 'x': 'V', 'p': price,
+                's': size, 't': t, 'c': ['@'], 'z': 'C'}
+    if kind == 'q':
+        return {'T': 'q', 'S': symbol, 'ax': 'V', 'ap': round(price + 0.01, 2),
+                'as': size, 'bx': 'V', 'bp': price, 'bs': size, 't': t,
+                'c': ['R'], 'z': 'C'}
+    return {'T': kind, 'S': symbol, 'o': price, 'h': round(price + 0.05, 2),
+            'l': round(price - 0.05, 2), 'c': price, 'v': size * 10,
+            't': t, 'n': size // 5 + 1, 'vw': price}
+
+
+def _trade_updates() -> List[Tuple[str, int]]:
+    """a cycle of encoded new and fill updates of market orders"""
+    updates = []
+    start = _to_ns(DEFAULT_START)
+    for seq in range(_FRAME_CYCLE):
+        symbol = DEFAULT_SYMBOLS[seq % len(DEFAULT_SYMBOLS)]
+        timestamp = pd.Timestamp(start + seq * 10 ** 6, tz='UTC').isoformat()
+        price = float(_prices(symbol, np.array([seq]))[0])
+        order = {
+            'id': '00000000-0000-4000-8000-{:012d}'.format(seq),
+            'client_order_id': 'standin-{}'.format(seq),
+            'symbol': symbol, 'asset_class': 'us_equity', 'qty': '1',
+            'side': 'buy', 'type': 'market', 'order_type': 'market',
+            'time_in_force': 'day', 'order_class': '',
+            'created_at': timestamp, 'submitted_at': timestamp,
+            'updated_at': timestamp,
+        }
+        for event in ('new', 'fill'):
+            data = {'event': event, 'timestamp': timestamp,
+                    'order': dict(order, status=event if event == 'new'
+                                  else 'filled')}
+            if event == 'fill':
+                data['order'].update(filled_qty='1', filled_at=timestamp,
+                                     filled_avg_price=str(price))
+                data.update(price=str(price), qty='1', position_qty='1',
+                            execution_id='standin-{}'.format(seq))
+            updates.append((json.dumps({'stream': 'trade_updates',
+                                        'data': data}), 1))
+    return updates
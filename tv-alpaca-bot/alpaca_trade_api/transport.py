@@ -0,0 +1,121 @@
+import os
+import socket
+from typing import Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+Timeout = Union[None, float, Tuple[Optional[float], Optional[float]]]
+
+# requests keeps 10 pooled connections per host by default, which makes
+# threads beyond the 10th open and discard a fresh socket on every call.
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 32
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_KEEPALIVE_IDLE = 60
+DEFAULT_KEEPALIVE_INTERVAL = 15
+DEFAULT_KEEPALIVE_COUNT = 4
+
+
+def keepalive_socket_options(idle: int = DEFAULT_KEEPALIVE_IDLE,
+                             interval: int = DEFAULT_KEEPALIVE_INTERVAL,
+                             count: int = DEFAULT_KEEPALIVE_COUNT) -> list:
+    """
+    socket options enabling TCP keepalive probes, so a connection silently
+    dropped by a NAT or load balancer is detected instead of hanging.
+    platform specific knobs are only set where the os supports them.
+    """
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle))
+    elif hasattr(socket, 'TCP_KEEPALIVE'):
+        # macOS names the idle option differently
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle))
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval))
+    if hasattr(socket, 'TCP_KEEPCNT'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count))
+    return options
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose pooled connections have TCP keepalive enabled.
+    """
+
+    def __init__(self, *args, socket_options: list = None, **kwargs):
+        if socket_options is None:
+            socket_options = keepalive_socket_options()
+        self._socket_options = (HTTPConnection.default_socket_options +
+                                socket_options)
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self._socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs['socket_options'] = self._socket_options
+        return super().proxy_manager_for(*args, **kwargs)
+
+
+def build_adapter(pool_connections: int = None,
+                  pool_maxsize: int = None,
+                  tcp_keepalive: bool = None) -> HTTPAdapter:
+    """
+    a pooled adapter sized from the arguments and the APCA_POOL_* /
+    APCA_TCP_KEEPALIVE environment variables. its urllib3 pool manager is
+    thread safe, so several sessions can share it and its connections.
+    """
+    if pool_connections is None:
+        pool_connections = int(os.environ.get(
+            'APCA_POOL_CONNECTIONS', DEFAULT_POOL_CONNECTIONS))
+    if pool_maxsize is None:
+        pool_maxsize = int(os.environ.get(
+            'APCA_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE))
+    if tcp_keepalive is None:
+        tcp_keepalive = _env_flag('APCA_TCP_KEEPALIVE', True)
+    adapter_cls = KeepAliveAdapter if tcp_keepalive else HTTPAdapter
+    return adapter_cls(pool_connections=pool_connections,
+                       pool_maxsize=pool_maxsize)
+
+
+def build_session(pool_connections: int = None,
+                  pool_maxsize: int = None,
+                  tcp_keepalive: bool = None,
+                  adapter: HTTPAdapter = None) -> requests.Session:
+    """
+    create a requests session whose http and https transports are either
+    the given adapter, or a pooled adapter built by build_adapter.
+    """
+    if adapter is None:
+        adapter = build_adapter(pool_connections=pool_connections,
+                                pool_maxsize=pool_maxsize,
+                                tcp_keepalive=tcp_keepalive)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_timeout(timeout: Timeout = None) -> Timeout:
+    """
+    resolve the (connect, read) timeout used for every request. an explicit
+    value wins, otherwise APCA_CONNECT_TIMEOUT and APCA_READ_TIMEOUT are
+    read from the environment. a value of 0 disables that timeout.
+    """
+    if timeout is not None:
+        return timeout
+    connect = float(os.environ.get('APCA_CONNECT_TIMEOUT',
+                                   DEFAULT_CONNECT_TIMEOUT))
+    read = float(os.environ.get('APCA_READ_TIMEOUT', DEFAULT_READ_TIMEOUT))
+    return connect or None, read or None
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ('0', 'false', 'no', 'off', '')
@@ -0,0 +1,67 @@
+"""
+Peak memory and time of building a bars DataFrame through the entity
+path (get_bars(...).df) versus the columnar path (get_bars_df).
+
+Pages are generated locally in the shape the data api returns them, so
+only the client side cost is measured:
+    PYTHONPATH=. python benchmarks/columnar_bars.py --rows 10000000
+"""
+import argparse
+import time
+import tracemalloc
+
+import pandas as pd
+
+from alpaca_trade_api.columnar import ColumnarFrameBuilder
+from alpaca_trade_api.entity_v2 import BarsV2, bar_mapping_v2
+
+PAGE_SIZE = 10000
+
+
+def pages(rows: int):
+    start = pd.Timestamp('2021-01-04T09:30:00Z')
+    for offset in range(0, rows, PAGE_SIZE):
+        size = min(PAGE_SIZE, rows - offset)
+        stamps = pd.date_range(start + pd.Timedelta(minutes=offset),
+                               periods=size, freq='min').strftime(
+            '%Y-%m-%dT%H:%M:%SZ')
+        yield [{
+            't': t,
+            'o': 100.0 + i % 7, 'h': 101.0, 'l': 99.0, 'c': 100.5,
+            'v': 1000 + i % 13, 'n': 10, 'vw': 100.2,
+        } for i, t in enumerate(stamps)]
+
+
+def entity_path(rows: int) -> pd.DataFrame:
+    items = [item for page in pages(rows) for item in page]
+    return BarsV2(items).df
+
+
+def columnar_path(rows: int) -> pd.DataFrame:
+    return ColumnarFrameBuilder(bar_mapping_v2).add_pages(
+        pages(rows)).to_df()
+
+
+def measure(name, fn, rows):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    df = fn(rows)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:10s} rows={len(df)} time={elapsed:.2f}s '
+          f'peak={peak / 2 ** 20:.1f}MiB')
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+    entity = measure('entity', entity_path, args.rows)
+    columnar = measure('columnar', columnar_path, args.rows)
+    print(f'peak memory ratio: {entity / columnar:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Time of reading timestamp attributes of entities, with the parsed value
+memoized per entity versus parsing it again on every read (the behavior
+before memoization, emulated by clearing the memo).
+
+    PYTHONPATH=. python benchmarks/entity_timestamps.py --reads 1000000
+"""
+import argparse
+import time
+
+from alpaca_trade_api.entity import Order, rfc3339_to_ns
+from alpaca_trade_api.entity_v2 import TradeV2
+
+import pandas as pd
+
+
+def order():
+    return Order({
+        'id': '904837e3-3b76-47ec-b432-046db621571b',
+        'symbol': 'AAPL',
+        'filled_at': '2021-03-16T18:38:01.942282Z',
+        'filled_avg_price': '134.70',
+    })
+
+
+def trade():
+    return TradeV2({
+        't': '2021-04-20T12:40:34.123456789Z', 'x': 'J', 'p': 134.7,
+        's': 20, 'c': ['@', 'T', 'I'], 'i': 32, 'z': 'C',
+    })
+
+
+def read(entity, attr: str, reads: int, memoized: bool) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reads):
+        if not memoized:
+            entity._parsed.clear()
+        getattr(entity, attr)
+    return time.perf_counter() - t0
+
+
+def parse(reads: int, fn) -> float:
+    value = '2021-03-16T18:38:01.942282Z'
+    t0 = time.perf_counter()
+    for _ in range(reads):
+        fn(value)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reads', type=int, default=1000000)
+    args = parser.parse_args()
+    for name, entity, attr in (('order.filled_at', order(), 'filled_at'),
+                               ('trade.timestamp', trade(), 'timestamp')):
+        # parsing is far slower, a tenth of the reads is enough to time it
+        parsed = read(entity, attr, args.reads // 10, False) * 10
+        memoized = read(entity, attr, args.reads, True)
+        print(f'{name:16s} reads={args.reads} parse-every-time='
+              f'{parsed:.2f}s memoized={memoized:.2f}s '
+              f'speedup={parsed / memoized:.0f}x')
+    scalar = args.reads // 10
+    pandas = parse(scalar, lambda v: pd.Timestamp(v).value)
+    fast = parse(scalar, rfc3339_to_ns)
+    print(f'scalar parse     n={scalar} pandas={pandas:.2f}s '
+          f'rfc3339_to_ns={fast:.2f}s speedup={pandas / fast:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Time of the batch indicators over a (symbols, bars) array of random walk
+closes, like a BarPanel field:
+    PYTHONPATH=. python benchmarks/indicators.py --symbols 5000 --bars 100000
+
+The closes alone take symbols * bars * 8 bytes (4GB for 5000 x 100k) and
+every indicator allocates its result, so size --bars to the memory at hand;
+the throughput printed does not depend much on it.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from alpaca_trade_api import indicators
+
+
+def measure(name, fn, bars):
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    print(f'{name:5s} time={elapsed:.2f}s '
+          f'{bars / elapsed / 1e6:.0f}M bars/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=5000)
+    parser.add_argument('--bars', type=int, default=10000)
+    parser.add_argument('--all', action='store_true',
+                        help='besides EMA(9), time SMA, RSI and ATR')
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    close = 100 + rng.standard_normal(
+        (args.symbols, args.bars)).cumsum(axis=1)
+    bars = close.size
+    measure('ema', lambda: indicators.ema(close, 9), bars)
+    if args.all:
+        measure('sma', lambda: indicators.sma(close, 20), bars)
+        measure('rsi', lambda: indicators.rsi(close, 14), bars)
+        measure('atr', lambda: indicators.atr(close + 0.5, close - 0.5,
+                                              close, 14), bars)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Decode cost per response page: the previous path (resp.text, then
+resp.json() decoding the body again) against decoding resp.content once
+with each available JSONDecoder backend.
+
+Pages are generated locally in the shape the api returns them:
+    PYTHONPATH=. python benchmarks/json_decode.py --items 10000
+"""
+import argparse
+import json
+import time
+
+import requests
+
+from alpaca_trade_api.decoder import AUTO_ORDER, JSONDecoder
+
+
+def bars(n: int) -> dict:
+    return {'bars': [{
+        't': '2021-06-01T{:02d}:{:02d}:00Z'.format(i // 60 % 24, i % 60),
+        'o': 100.0 + i % 7, 'h': 101.25, 'l': 99.5, 'c': 100.5,
+        'v': 1000 + i, 'n': 12, 'vw': 100.21,
+    } for i in range(n)], 'symbol': 'AAPL', 'next_page_token': 'QUFQTHxN'}
+
+
+def trades(n: int) -> dict:
+    return {'trades': [{
+        't': '2021-06-01T13:30:00.{:09d}Z'.format(i), 'x': 'V',
+        'p': 124.61 + i % 5 / 100, 's': 100, 'c': ['@', 'I'], 'i': 5000 + i,
+        'z': 'C',
+    } for i in range(n)], 'symbol': 'AAPL', 'next_page_token': 'QUFQTHxN'}
+
+
+def quotes(n: int) -> dict:
+    return {'quotes': [{
+        't': '2021-06-01T13:30:00.{:09d}Z'.format(i), 'ax': 'V',
+        'ap': 124.62, 'as': 3, 'bx': 'Q', 'bp': 124.6, 'bs': 1,
+        'c': ['R'], 'z': 'C',
+    } for i in range(n)], 'symbol': 'AAPL', 'next_page_token': 'QUFQTHxN'}
+
+
+def orders(n: int) -> list:
+    return [{
+        'id': '904837e3-3b76-47ec-b432-{:012d}'.format(i),
+        'client_order_id': 'c{}'.format(i), 'symbol': 'AAPL',
+        'created_at': '2021-03-16T18:38:01.942282Z',
+        'filled_at': '2021-03-16T18:38:01.942282Z', 'qty': '1',
+        'filled_qty': '1', 'type': 'market', 'side': 'buy',
+        'time_in_force': 'day', 'status': 'filled', 'legs': None,
+    } for i in range(n)]
+
+
+def response(body: bytes) -> requests.Response:
+    resp = requests.Response()
+    resp._content = body
+    resp.status_code = 200
+    resp.headers['Content-Type'] = 'application/json'
+    return resp
+
+
+def previous(body: bytes):
+    # a fresh response per call: requests caches neither text nor json
+    resp = response(body)
+    if resp.text != '':
+        return resp.json()
+
+
+def timed(fn, body: bytes, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    decoders = [JSONDecoder('json')]
+    for name in AUTO_ORDER:
+        try:
+            decoders.append(JSONDecoder(name))
+        except ImportError:
+            print('{} not installed, skipped'.format(name))
+
+    for kind, make in (('bars', bars), ('trades', trades),
+                       ('quotes', quotes), ('orders', orders)):
+        body = json.dumps(make(args.items)).encode()
+        base = timed(previous, body, args.repeat)
+        line = ['{:7s} {:6.2f}MiB text+json={:7.2f}ms'.format(
+            kind, len(body) / 2 ** 20, base * 1000)]
+        for decoder in decoders:
+            cost = timed(lambda b: decoder(response(b).content), body,
+                         args.repeat)
+            line.append('{}={:.2f}ms ({:.1f}x)'.format(
+                decoder.name, cost * 1000, base / cost))
+        print(' '.join(line))
+
+
+if __name__ == '__main__':
+    main()
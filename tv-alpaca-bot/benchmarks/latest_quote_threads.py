@@ -0,0 +1,57 @@
+"""
+32 threads issuing get_latest_quote through a single REST instance.
+
+Compare connection pool settings, e.g:
+    APCA_POOL_MAXSIZE=10 PYTHONPATH=. python benchmarks/latest_quote_threads.py
+    APCA_POOL_MAXSIZE=32 PYTHONPATH=. python benchmarks/latest_quote_threads.py
+or with identical concurrent requests coalesced or not:
+    APCA_COALESCE_GETS=1 PYTHONPATH=. python benchmarks/latest_quote_threads.py
+
+Credentials and endpoints are read from the usual APCA_* environment
+variables, so APCA_API_DATA_URL can point at a local stand-in server.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from alpaca_trade_api.rest import REST
+
+
+def run(threads: int, calls: int, symbol: str):
+    api = REST()
+    latencies = []
+
+    def one_call(_):
+        t0 = time.perf_counter()
+        api.get_latest_quote(symbol)
+        latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one_call, range(threads * calls)))
+    elapsed = time.perf_counter() - start
+    api.close()
+
+    latencies.sort()
+    print(f'threads={threads} requests={len(latencies)} '
+          f'elapsed={elapsed:.2f}s rps={len(latencies) / elapsed:.1f}')
+    print(f'p50={statistics.median(latencies) * 1000:.1f}ms '
+          f'p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms')
+    flights = api._single_flight
+    if flights is not None:
+        print(f'sent={flights.calls} coalesced={flights.shared}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--calls', type=int, default=20,
+                        help='calls per thread')
+    parser.add_argument('--symbol', default='AAPL')
+    args = parser.parse_args()
+    run(args.threads, args.calls, args.symbol)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Throughput of paginated historical requests, of the data stream and of the
+trading stream, against the local stand-in server:
+    PYTHONPATH=. python benchmarks/standin.py --items 200000 --messages 200000
+
+The server runs in a thread of this process by default, so both share the
+interpreter. To keep it out of the measurement, start it separately and
+pass its url:
+    PYTHONPATH=. python -m alpaca_trade_api standin --port 8765 &
+    PYTHONPATH=. python benchmarks/standin.py --url http://127.0.0.1:8765
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+
+from alpaca_trade_api.rest import REST
+from alpaca_trade_api.standin import StandInServer
+from alpaca_trade_api.stream import DataStream, TradingStream
+
+
+def report(name, count, elapsed, unit):
+    print(f'{name:14s} {count} {unit} in {elapsed:.2f}s '
+          f'{count / elapsed:,.0f} {unit}/s')
+
+
+def historical(url, items, limit):
+    os.environ['APCA_API_DATA_URL'] = url
+    api = REST('key', 'secret', base_url=url)
+    for kind in ('trades', 'quotes', 'bars'):
+        kwargs = {'timeframe': '1Min'} if kind == 'bars' else {}
+        t0 = time.perf_counter()
+        count = 0
+        for _ in api._data_get(kind, 'AAPL', start='2021-01-04',
+                               limit=items, page_limit=limit, **kwargs):
+            count += 1
+        report(kind, count, time.perf_counter() - t0, 'items')
+
+
+async def consume(stream, subscribe, messages):
+    received = 0
+    done = asyncio.Event()
+
+    async def handler(_):
+        nonlocal received
+        received += 1
+        if received == messages:
+            done.set()
+
+    subscribe(handler)
+    runner = asyncio.ensure_future(stream._run_forever())
+    while not stream._running:
+        await asyncio.sleep(0.01)
+    t0 = time.perf_counter()
+    await done.wait()
+    elapsed = time.perf_counter() - t0
+    await stream.stop_ws()
+    runner.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await runner
+    return elapsed
+
+
+def data_stream(url, messages, raw_data):
+    stream = DataStream('key', 'secret', url, raw_data=raw_data, feed='iex')
+    elapsed = asyncio.run(consume(
+        stream, lambda h: stream.subscribe_trades(h, '*'), messages))
+    report('stream raw' if raw_data else 'stream', messages, elapsed,
+           'msgs')
+
+
+def trading_stream(url, messages):
+    stream = TradingStream('key', 'secret', url)
+    elapsed = asyncio.run(consume(
+        stream, stream.subscribe_trade_updates, messages))
+    report('trade_updates', messages, elapsed, 'msgs')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='a running stand-in server')
+    parser.add_argument('--items', type=int, default=100000,
+                        help='historical items per kind')
+    parser.add_argument('--page-limit', type=int, default=10000)
+    parser.add_argument('--messages', type=int, default=100000,
+                        help='stream messages per run')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='data stream messages per frame')
+    args = parser.parse_args()
+    server = None
+    url = args.url
+    if url is None:
+        server = StandInServer(items=args.items,
+                               batch_size=args.batch_size).start()
+        url = server.url
+    try:
+        historical(url, args.items, args.page_limit)
+        data_stream(url, args.messages, raw_data=True)
+        data_stream(url, args.messages, raw_data=False)
+        trading_stream(url, args.messages // 10)
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,7 @@ APCA_API_BASE_URL = "https://paper-api.alpaca.markets"
 
 class LongShort:
   def __init__(self):
-    self.alpaca = tradeapi.REST(API_KEY, API_SECRET, APCA_API_BASE_URL, 'v2')
+    self.alpaca = tradeapi.REST(API_KEY, API_SECRET, APCA_API_BASE_URL, 'v2', thread_safe=True)
 
     stockUniverse = ['DOMO', 'TLRY', 'SQ', 'MRO', 'AAPL', 'GM', 'SNAP', 'SHOP',
                      'SPLK', 'BA', 'AMZN', 'SUI', 'SUN', 'TSLA', 'CGC', 'SPWR',
@@ -290,18 +290,22 @@ class LongShort:
   def sendBatchOrder(self, qty, stocks, side, resp):
     executed = []
     incomplete = []
-    for stock in stocks:
-      if(self.blacklist.isdisjoint({stock})):
-        respSO = []
-        tSubmitOrder = threading.Thread(target=self.submitOrder, args=[qty, stock, side, respSO])
-        tSubmitOrder.start()
-        tSubmitOrder.join()
-        if(not respSO[0]):
-          # Stock order did not go through, add it to incomplete.
-          incomplete.append(stock)
-        else:
-          executed.append(stock)
-        respSO.clear()
+    stocks = [stock for stock in stocks if self.blacklist.isdisjoint({stock})]
+    if(qty > 0):
+      # The orders are sent in parallel, results come back in the same order.
+      results = self.alpaca.submit_orders([
+        {"symbol": stock, "qty": qty, "side": side, "type": "market", "time_in_force": "day"}
+        for stock in stocks])
+    else:
+      results = [None] * len(stocks)
+    for stock, result in zip(stocks, results):
+      if(isinstance(result, Exception)):
+        # Stock order did not go through, add it to incomplete.
+        print("Order of | " + str(qty) + " " + stock + " " + side + " | did not go through.")
+        incomplete.append(stock)
+      else:
+        print("Market order of | " + str(qty) + " " + stock + " " + side + " | completed.")
+        executed.append(stock)
     resp.append([executed, incomplete])
 
   # Submit an order if quantity is above 0.
@@ -321,14 +325,17 @@ class LongShort:
   # Get percent changes of the stock prices over the past 10 minutes.
   def getPercentChanges(self):
     length = 10
-    for i, stock in enumerate(self.allStocks):
-      bars = self.alpaca.get_bars(stock[0], TimeFrame.Minute,
-                                  pd.Timestamp('now').date(),
-                                  pd.Timestamp('now').date(), limit=length,
-                                  adjustment='raw')
-      if len(bars) != 0:
-        self.allStocks[i][1] = (bars[len(bars) - 1].c - bars[0].o) / bars[0].o
-      
+    end = pd.Timestamp.now(tz='UTC')
+    start = end - pd.Timedelta(minutes=length)
+    # The bars of the whole universe aligned on one time index, the change of
+    # every stock is then a single vectorised operation.
+    panel = self.alpaca.get_bars_panel([stock[0] for stock in self.allStocks],
+                                       TimeFrame.Minute, start.isoformat(),
+                                       end.isoformat(), adjustment='raw')
+    changes = panel.change(start='open', end='close').fillna(0)
+    for stock in self.allStocks:
+      stock[1] = changes[stock[0]]
+
 
   # Mechanism used to rank the stocks, the basis of the Long-Short Equity Strategy.
   def rank(self):
@@ -4,6 +4,7 @@ from alpaca_trade_api.rest import APIError
 
 import os
 import pytest
+import requests
 import requests_mock
 
 
@@ -1177,3 +1178,1525 @@ def test_no_resource_warning_with_context_manager():
         warnings.simplefilter("error")
         with tradeapi.REST("key-id", "secret-key", api_version="v1") as api:
             assert api
+
+
+def test_transport_options(reqmock):
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v1',
+                        pool_maxsize=64, timeout=(2, 5))
+    adapter = api._session.get_adapter('https://api.alpaca.markets')
+    assert isinstance(adapter, tradeapi.transport.KeepAliveAdapter)
+    assert adapter._pool_maxsize == 64
+
+    reqmock.get('https://api.alpaca.markets/v1/clock', text='''{
+      "timestamp": "2018-04-01T12:00:00.000Z",
+      "is_open": true,
+      "next_open": "2018-04-01T12:00:00.000Z",
+      "next_close": "2018-04-01T12:00:00.000Z"
+    }''')
+    api.get_clock()
+    assert reqmock.last_request.timeout == (2, 5)
+
+    os.environ['APCA_READ_TIMEOUT'] = '0'
+    try:
+        api = tradeapi.REST('key-id', 'secret-key', api_version='v1',
+                            tcp_keepalive=False)
+        assert api._timeout == (10.0, None)
+        adapter = api._session.get_adapter('https://api.alpaca.markets')
+        assert not isinstance(adapter, tradeapi.transport.KeepAliveAdapter)
+    finally:
+        del os.environ['APCA_READ_TIMEOUT']
+
+    custom = requests.adapters.HTTPAdapter(pool_maxsize=3)
+    api = tradeapi.REST('key-id', 'secret-key', adapter=custom)
+    assert api._session.get_adapter('http://localhost') is custom
+
+
+def test_retry_policy(reqmock, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('time.sleep', sleeps.append)
+    calls = []
+    policy = tradeapi.retry.RetryPolicy(max_retries=3, base=1, cap=4,
+                                        jitter=False, hooks=[calls.append])
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v1',
+                        retry_policy=policy)
+
+    clock = '''{"timestamp": "2018-04-01T12:00:00.000Z", "is_open": true}'''
+    reqmock.get('https://api.alpaca.markets/v1/clock', [
+        {'status_code': 429, 'headers': {'Retry-After': '7'}},
+        {'status_code': 504},
+        {'exc': requests.exceptions.ConnectTimeout},
+        {'text': clock},
+    ])
+    assert api.get_clock().is_open
+    # Retry-After is honored up to the cap, then exponential backoff 1 * 2**n
+    assert sleeps == [4, 2, 4]
+    assert calls[-1].retries == 3
+    assert calls[-1].total_sleep == 10
+    assert calls[-1].error is None
+
+    # connection errors are not retried for non idempotent requests
+    reqmock.post('https://api.alpaca.markets/v1/orders',
+                 exc=requests.exceptions.ConnectionError)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        api.submit_order('AAPL', qty=1)
+    assert calls[-1].retries == 0
+
+    # the deadline budget stops retrying and surfaces the api error
+    sleeps.clear()
+    policy.deadline = 3
+    reqmock.get('https://api.alpaca.markets/v1/account',
+                status_code=429, headers={'Retry-After': '10'},
+                text='{"code": 42910000, "message": "rate limit exceeded"}')
+    with pytest.raises(APIError) as err:
+        api.get_account()
+    assert err.value.status_code == 429
+    assert sleeps == []
+
+    response = requests.Response()
+    response.status_code = 503
+    response.headers['Retry-After'] = '3'
+    assert policy.wait_time(0, response) == 3
+    response.headers['Retry-After'] = '86400'
+    assert policy.wait_time(0, response) == 4
+    assert tradeapi.retry.RetryPolicy(cap=4).wait_time(0, response) == 4
+
+    backoff = tradeapi.retry.RetryPolicy(base=1, cap=8)
+    for attempt in range(6):
+        assert 0 <= backoff.backoff(attempt) <= min(8, 2 ** attempt)
+
+
+def _paged_bars_callback(bars_by_symbol, page_size=2, kind='bars'):
+    """
+    serve bars (or trades/quotes) the way the data api does: filtered by
+    start/end, sorted by symbol then time, and paged with next_page_token.
+    """
+    import pandas as pd
+
+    def callback(request, context):
+        qs = request.qs
+        if 'symbols' in qs:
+            symbols = sorted(qs['symbols'][0].upper().split(','))
+        else:
+            symbols = [request.path.split('/')[3].upper()]
+        start = pd.Timestamp(qs['start'][0].upper())
+        end = pd.Timestamp(qs['end'][0].upper()) if 'end' in qs \
+            else pd.Timestamp.now(tz='UTC')
+        start = start if start.tzinfo else start.tz_localize('UTC')
+        end = end if end.tzinfo else end.tz_localize('UTC')
+        rows = [(sym, bar) for sym in symbols
+                for bar in bars_by_symbol.get(sym, [])
+                if start <= pd.Timestamp(bar['t']) <= end]
+        offset = int(qs.get('page_token', ['0'])[0])
+        limit = int(qs.get('limit', [page_size])[0])
+        page = rows[offset:offset + min(page_size, limit)]
+        token = offset + len(page)
+        body = {'next_page_token': str(token) if token < len(rows) else None}
+        if 'symbols' in qs:
+            body[kind] = {}
+            for sym, bar in page:
+                body[kind].setdefault(sym, []).append(dict(bar))
+        else:
+            body[kind] = [dict(bar) for _, bar in page]
+        return body
+    return callback
+
+
+def test_data_parallel(reqmock):
+    import re
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2')
+    bars = {
+        sym: [{'t': f'2021-06-0{day}T{hour}:00:00Z', 'o': i, 'h': i,
+               'l': i, 'c': i, 'v': day}
+              for i, (day, hour) in enumerate(
+                  (d, h) for d in range(1, 8) for h in (14, 18))]
+        for sym in ('AAPL', 'MSFT', 'SPY', 'TSLA', 'GOOG')
+    }
+    reqmock.get(re.compile('https://data.alpaca.markets/v2/stocks/.*bars'),
+                json=_paged_bars_callback(bars))
+
+    sequential = list(api.get_bars_iter(
+        'AAPL', tradeapi.TimeFrame.Hour, '2021-06-01', '2021-06-07T23:00:00Z',
+        raw=True))
+    parallel = list(api.get_bars_iter(
+        'AAPL', tradeapi.TimeFrame.Hour, '2021-06-01', '2021-06-07T23:00:00Z',
+        raw=True, concurrency=4))
+    assert len(sequential) == 14
+    assert parallel == sequential
+
+    symbols = ['TSLA', 'AAPL', 'SPY', 'MSFT', 'GOOG']
+    sequential = list(api.get_bars_iter(
+        symbols, tradeapi.TimeFrame.Hour, '2021-06-02', '2021-06-06',
+        raw=True))
+    parallel = list(api.get_bars_iter(
+        symbols, tradeapi.TimeFrame.Hour, '2021-06-02', '2021-06-06',
+        raw=True, concurrency=3))
+    assert len(sequential) == 5 * 8
+    assert parallel == sequential
+
+    limited = list(api.get_bars_iter(
+        symbols, tradeapi.TimeFrame.Hour, '2021-06-02', '2021-06-06',
+        limit=11, raw=True, concurrency=3))
+    assert limited == sequential[:11]
+
+    df = api.get_bars(symbols, tradeapi.TimeFrame.Hour, '2021-06-02',
+                      '2021-06-06', concurrency=8).df
+    assert len(df) == 40
+
+    # stopping early neither waits for the other shards nor lets them page
+    import time
+    paged = _paged_bars_callback(bars, page_size=1)
+
+    def slow(request, context):
+        # the shards after the first one take a while
+        if 'AAPL' not in request.qs['symbols'][0].upper():
+            time.sleep(0.05)
+        return paged(request, context)
+
+    matcher = reqmock.get(
+        re.compile('https://data.alpaca.markets/v2/stocks/.*bars'),
+        json=slow)
+    args = (symbols, tradeapi.TimeFrame.Hour, '2021-06-02', '2021-06-06')
+    it = api.get_bars_iter(*args, raw=True, concurrency=4)
+    next(it)
+    t0 = time.perf_counter()
+    it.close()
+    assert time.perf_counter() - t0 < 0.05
+    closed = matcher.call_count
+    time.sleep(0.2)
+    # only the requests in flight when the iterator was closed land
+    assert matcher.call_count <= closed + 4
+
+
+def test_data_prefetch(reqmock):
+    import re
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2')
+    bars = {'AAPL': [{'t': f'2021-06-01T{h:02d}:00:00Z', 'o': h, 'h': h,
+                      'l': h, 'c': h, 'v': h} for h in range(24)]}
+    reqmock.get(re.compile('https://data.alpaca.markets/v2/stocks/.*bars'),
+                json=_paged_bars_callback(bars, page_size=5))
+
+    args = ('AAPL', tradeapi.TimeFrame.Hour, '2021-06-01', '2021-06-02')
+    sequential = list(api.get_bars_iter(*args, raw=True))
+    prefetched = list(api.get_bars_iter(*args, raw=True, prefetch_pages=2))
+    assert len(sequential) == 24
+    assert prefetched == sequential
+
+    # abandoning the iterator stops the background fetches
+    import threading
+    it = api.get_bars_iter(*args, raw=True, prefetch_pages=1)
+    assert next(it)['o'] == 0
+    it.close()
+    assert 'alpaca-prefetch' not in [t.name for t in threading.enumerate()]
+
+    # errors raised while fetching surface in the caller
+    reqmock.get(re.compile('https://data.alpaca.markets/v2/stocks/.*trades'),
+                status_code=403, json={'message': 'forbidden'})
+    with pytest.raises(APIError):
+        list(api.get_trades_iter('AAPL', '2021-06-01', '2021-06-02',
+                                 prefetch_pages=1))
+
+
+def test_historical_cache(reqmock, tmp_path):
+    import re
+    cache = tradeapi.cache.HistoricalCache(str(tmp_path / 'history.sqlite'))
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2',
+                        cache=cache)
+    bars = {sym: [{'t': f'2021-06-0{d}T14:00:00Z', 'o': d, 'h': d, 'l': d,
+                   'c': d, 'v': d} for d in range(1, 10)]
+            for sym in ('AAPL', 'MSFT')}
+    matcher = reqmock.get(
+        re.compile('https://data.alpaca.markets/v2/stocks/.*bars'),
+        json=_paged_bars_callback(bars, page_size=3))
+
+    first = api.get_bars('AAPL', tradeapi.TimeFrame.Day,
+                         '2021-06-02', '2021-06-05')
+    assert [b.o for b in first] == [2, 3, 4]
+    calls = matcher.call_count
+
+    # fully cached: no request at all
+    again = api.get_bars('AAPL', tradeapi.TimeFrame.Day,
+                         '2021-06-02', '2021-06-05')
+    assert again._raw == first._raw
+    assert matcher.call_count == calls
+
+    # overlapping range: only the missing tail is fetched
+    wider = api.get_bars('AAPL', tradeapi.TimeFrame.Day,
+                         '2021-06-03', '2021-06-08', sort='desc')
+    assert [b.o for b in wider] == [7, 6, 5, 4, 3]
+    new_requests = reqmock.request_history[calls:]
+    assert all(r.qs['start'][0] >= '2021-06-05' for r in new_requests)
+
+    # other keys are cached separately and multi symbol results merge
+    multi = api.get_bars(['MSFT', 'AAPL'], tradeapi.TimeFrame.Day,
+                         '2021-06-02', '2021-06-04')
+    assert [(b['S'], b['o']) for b in multi._raw] == [
+        ('AAPL', 2), ('AAPL', 3), ('MSFT', 2), ('MSFT', 3)]
+    assert cache.missing(('bars', 'AAPL', '1Day', 'raw', ''),
+                         tradeapi.cache._to_ns('2021-06-02'),
+                         tradeapi.cache._to_ns('2021-06-08')) == []
+
+    # the current session is always fetched and never stored
+    import pandas as pd
+    from alpaca_trade_api.entity import NY
+    today = pd.Timestamp.now(tz=NY).normalize().tz_convert('UTC')
+    today = today.strftime('%Y-%m-%dT%H:%M:%SZ')
+    bars['AAPL'].append({'t': today, 'o': 0, 'h': 0, 'l': 0, 'c': 0,
+                         'v': 0})
+    calls = matcher.call_count
+    assert api.get_bars('AAPL', tradeapi.TimeFrame.Day, today)[-1].o == 0
+    assert api.get_bars('AAPL', tradeapi.TimeFrame.Day, today)[-1].o == 0
+    assert matcher.call_count == calls + 2
+
+
+def test_data_df(reqmock):
+    import re
+    import pandas as pd
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2')
+    bars = {sym: [{'t': f'2021-06-01T{h:02d}:00:00Z', 'o': h + 0.5,
+                   'h': h + 1.0, 'l': float(h), 'c': h + 0.25, 'v': 100 * h,
+                   'n': h, 'vw': h + 0.3} for h in range(10)]
+            for sym in ('AAPL', 'MSFT')}
+    trades = {'AAPL': [{'t': f'2021-06-01T14:00:0{i}.12345678{i}Z',
+                        'x': 'V', 'p': 100 + i, 's': 10 * i,
+                        'c': ['@', 'I'] if i % 2 else ['@'],
+                        'i': i, 'z': 'C'} for i in range(7)]}
+    reqmock.get(re.compile('https://data.alpaca.markets/v2/stocks/.*bars'),
+                json=_paged_bars_callback(bars, page_size=4))
+    reqmock.get(re.compile('https://data.alpaca.markets/v2/stocks/.*trades'),
+                json=_paged_bars_callback(trades, page_size=3,
+                                          kind='trades'))
+
+    args = (tradeapi.TimeFrame.Hour, '2021-06-01', '2021-06-02')
+    for symbol in ('AAPL', ['MSFT', 'AAPL']):
+        expected = api.get_bars(symbol, *args).df
+        df = api.get_bars_df(symbol, *args)
+        pd.testing.assert_frame_equal(df, expected, check_like=True,
+                                      check_index_type=False)
+        assert df.index.name == 'timestamp'
+    parallel = api.get_bars_df(['MSFT', 'AAPL'], *args, concurrency=2)
+    pd.testing.assert_frame_equal(parallel, df)
+
+    expected = api.get_trades('AAPL', '2021-06-01', '2021-06-02').df
+    df = api.get_trades_df('AAPL', '2021-06-01', '2021-06-02')
+    pd.testing.assert_frame_equal(df, expected, check_like=True,
+                                  check_index_type=False)
+    assert df.conditions.iloc[1] == ['@', 'I']
+    assert df.index[6].nanosecond == 786
+
+    empty = api.get_bars_df('AAPL', tradeapi.TimeFrame.Hour, '2020-01-01',
+                            '2020-01-02')
+    assert empty.empty
+
+    # a field only some items of a page have still gets its column
+    from alpaca_trade_api.columnar import ColumnarFrameBuilder
+    from alpaca_trade_api.entity_v2 import trade_mapping_v2
+    page = [dict(trade) for trade in trades['AAPL'][:3]]
+    page[1]['tks'] = 'B'
+    df = ColumnarFrameBuilder(trade_mapping_v2).add_pages([page]).to_df()
+    assert df['takerside'].isna().tolist() == [True, False, True]
+    assert df['takerside'].iloc[1] == 'B'
+
+
+def test_lazy_entity_lists(monkeypatch):
+    from alpaca_trade_api.entity import Bar, Bars, LazyEntityList
+    from alpaca_trade_api.entity_v2 import BarsV2
+
+    created = []
+
+    class CountingBar(Bar):
+        def __init__(self, raw):
+            created.append(raw)
+            super().__init__(raw)
+
+    raw = [{'t': f'2021-06-01T{h:02d}:00:00Z', 'o': h, 'h': h, 'l': h,
+            'c': h, 'v': h} for h in range(10)]
+    bars = BarsV2(raw)
+    monkeypatch.setattr(bars, '_entity', CountingBar)
+    assert len(bars) == 10
+    assert len(bars.df) == 10
+    assert created == []
+
+    assert bars[-1].c == 9
+    assert len(created) == 1
+    tail = bars[7:]
+    assert type(tail) == BarsV2
+    assert len(created) == 1
+    assert [b.o for b in tail] == [7, 8, 9]
+    assert list(tail.df.open) == [7, 8, 9]
+    assert [b.o for b in reversed(bars)][:2] == [9, 8]
+    assert isinstance(bars[0], Bar)
+
+    # an item is wrapped once, and every list operation returns entities
+    first = bars[0]
+    assert bars[0] is first
+    assert tail[2] is bars[-1]  # wrapped before the slice was taken
+    assert first in bars
+    assert bars.index(first) == 0
+    assert bars.count(first) == 1
+    assert bars.copy()[0] is first
+    assert type(bars.copy()) == BarsV2
+    assert (bars + bars)[10] is first
+    assert type(bars + bars) == BarsV2
+    assert bars == bars.copy()
+    assert bars == list(bars)
+    assert bars != tail
+    copy = bars.copy()
+    last = copy.pop()
+    assert isinstance(last, Bar) and last.o == 9
+    assert len(copy) == 9 and len(bars) == 10
+    assert copy.pop(0) is first
+    copy.append(first)
+    assert copy[-1] is first and copy._raw[-1] is raw[0]
+    copy.clear()
+    assert len(copy) == 0 and len(bars) == 10
+    orders = LazyEntityList([{'submitted_at': '2021-06-01T13:30:00Z'}])
+    assert orders[0].submitted_at is orders[0].submitted_at
+
+    v1 = Bars([{'t': 1622505600, 'o': 1, 'h': 2, 'l': 0, 'c': 1, 'v': 5}])
+    assert v1[0].t.year == 2021
+    assert type(v1[:1]) == Bars
+    assert 'Bar(' in repr(v1)
+
+
+def test_compact_records(reqmock):
+    from alpaca_trade_api.entity_v2 import (
+        CompactBarV2, CompactQuoteV2, CompactTradeV2, BarsV2)
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v1',
+                        compact=True)
+
+    reqmock.get(
+        'https://data.alpaca.markets/v2/stocks/AAPL/trades/latest',
+        text='''
+        {"symbol": "AAPL",
+         "trade": {"t": "2021-04-20T12:40:34.123456789Z", "x": "J",
+                   "p": 134.7, "s": 20, "c": ["@", "T", "I"], "i": 32,
+                   "z": "C"}}
+        ''')
+    trade = api.get_latest_trade('AAPL')
+    assert type(trade) == CompactTradeV2
+    assert not hasattr(trade, '__dict__')
+    assert trade.price == trade.p == 134.7
+    assert trade.conditions == ["@", "T", "I"]
+    assert trade.timestamp == 1618922434123456789
+    assert trade.takerside is None
+    assert trade._raw['x'] == 'J'
+    assert trade == CompactTradeV2(trade._raw)
+
+    reqmock.get(
+        'https://data.alpaca.markets/v2/stocks/quotes/latest',
+        text='''
+        {"quotes": {"AAPL": {"t": "2021-04-20T12:40:34Z", "ax": "Q",
+                             "ap": 134.8, "as": 1, "bx": "K", "bp": 134.7,
+                             "bs": 3, "c": ["R"], "z": "C"}}}
+        ''')
+    quote = api.get_latest_quotes(['AAPL'])['AAPL']
+    assert type(quote) == CompactQuoteV2
+    assert quote.ask_size == getattr(quote, 'as') == 1
+
+    reqmock.get(
+        'https://data.alpaca.markets/v2/stocks/AAPL/bars',
+        text='''
+        {"bars": [{"t": "2021-06-01T04:00:00Z", "o": 1, "h": 2, "l": 0.5,
+                   "c": 1.5, "v": 10, "n": 3, "vw": 1.2}],
+         "symbol": "AAPL", "next_page_token": null}
+        ''')
+    bars = api.get_bars('AAPL', '1Day', limit=1)
+    assert type(bars) == BarsV2
+    assert type(bars[0]) == CompactBarV2
+    assert bars[0].close == bars[0].c == 1.5
+    assert type(bars[:1][0]) == CompactBarV2
+    assert list(bars.df.close) == [1.5]
+
+    default = tradeapi.REST('key-id', 'secret-key', api_version='v1')
+    assert type(default.get_latest_trade('AAPL')) != CompactTradeV2
+
+
+def test_entity_timestamps():
+    import pandas as pd
+    from alpaca_trade_api.entity import (
+        Clock, Order, parse_timestamp, rfc3339_to_ns)
+    from alpaca_trade_api.entity_v2 import TradeV2
+
+    assert rfc3339_to_ns('2021-04-20T12:40:34.123456789Z') == \
+        pd.Timestamp('2021-04-20T12:40:34.123456789Z').value
+    assert rfc3339_to_ns('2021-04-20T12:40:34Z') == \
+        pd.Timestamp('2021-04-20T12:40:34Z').value
+    assert rfc3339_to_ns('2021-04-20T12:40:34.5Z') == \
+        pd.Timestamp('2021-04-20T12:40:34.5Z').value
+    for value in ('2021-04-20T08:40:34-04:00', '2021-04-20',
+                  '2021-13-01T00:00:00Z', '2021-04-20T12:40:34.Z'):
+        assert rfc3339_to_ns(value) is None
+    ts = parse_timestamp('2021-04-20T08:40:34-04:00', tz='UTC')
+    assert ts == pd.Timestamp('2021-04-20T12:40:34Z')
+
+    order = Order({'filled_at': '2021-03-16T18:38:01.942282Z',
+                   'qty': '1'})
+    # the memo is only created by the first timestamp
+    assert '_parsed' not in vars(order)
+    filled_at = order.filled_at
+    assert '_parsed' in vars(order)
+    assert filled_at == pd.Timestamp('2021-03-16T18:38:01.942282Z')
+    assert order.filled_at is filled_at
+    assert order.qty == '1'
+    order._raw['filled_at'] = '2021-03-17T18:38:01Z'
+    assert order.filled_at.day == 17
+
+    trade = TradeV2({'t': '2021-04-20T12:40:34.123456789Z', 'p': 1})
+    assert trade.timestamp is trade.timestamp
+    assert str(trade.timestamp.tz) == 'America/New_York'
+    assert trade.timestamp.hour == 8
+    assert trade.timestamp.nanosecond == 789
+
+    clock = Clock({'timestamp': '2021-04-20T09:30:00.1-04:00',
+                   'is_open': True})
+    assert clock.timestamp is clock.timestamp
+    assert clock.timestamp.hour == 9
+
+
+def test_json_decoder(reqmock):
+    from alpaca_trade_api.decoder import JSONDecoder
+
+    assert JSONDecoder('json')(b'{"a": [1, 2.5]}') == {'a': [1, 2.5]}
+    auto = JSONDecoder()
+    assert auto.name in ('orjson', 'msgspec', 'ujson', 'json')
+    assert auto(b'{"p": 1.5, "c": ["@"]}') == {'p': 1.5, 'c': ['@']}
+    # the standard library accepts NaN, the fast parsers may not
+    assert auto(b'{"v": NaN}')['v'] != auto(b'{"v": NaN}')['v']
+    with pytest.raises(ValueError):
+        auto(b'{"v": ')
+    with pytest.raises(ValueError):
+        JSONDecoder('simplejson')
+
+    decoded = []
+
+    def decoder(body):
+        decoded.append(body)
+        return JSONDecoder('json')(body)
+
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2',
+                        json_decoder=decoder)
+    reqmock.get('https://api.alpaca.markets/v2/clock',
+                text='{"timestamp": "2021-04-20T09:30:00-04:00", '
+                     '"is_open": true}')
+    assert api.get_clock().is_open is True
+    assert decoded == [b'{"timestamp": "2021-04-20T09:30:00-04:00", '
+                       b'"is_open": true}']
+    reqmock.delete('https://api.alpaca.markets/v2/orders/abc', text='')
+    assert api.cancel_order('abc') is None
+    assert len(decoded) == 1
+
+
+def test_async_trading_rest():
+    import asyncio
+    from aiohttp import web
+    from alpaca_trade_api.entity import Clock, Order, Position
+    from alpaca_trade_api.retry import RetryPolicy
+
+    seen = []
+    attempts = {'clock': 0}
+
+    async def clock(request):
+        attempts['clock'] += 1
+        if attempts['clock'] == 1:
+            return web.json_response({'message': 'slow down'}, status=429,
+                                     headers={'Retry-After': '0'})
+        return web.json_response({'timestamp': '2021-04-20T09:30:00-04:00',
+                                  'is_open': True})
+
+    async def orders(request):
+        seen.append((request.method, dict(request.query),
+                     request.headers.get('APCA-API-KEY-ID')))
+        if request.method == 'POST':
+            body = await request.json()
+            seen.append(body)
+            return web.json_response(dict(body, id='o1', status='new'))
+        if request.method == 'DELETE':
+            return web.Response(status=207)
+        return web.json_response([{'id': 'o1', 'legs': None}])
+
+    async def position(request):
+        if request.match_info['symbol'] == 'NOPE':
+            return web.json_response(
+                {'code': 40410000, 'message': 'position does not exist'},
+                status=404)
+        return web.json_response({'symbol': 'AAPL', 'qty': '10'})
+
+    async def main():
+        app = web.Application()
+        app.router.add_get('/v2/clock', clock)
+        app.router.add_route('*', '/v2/orders', orders)
+        app.router.add_get('/v2/positions/{symbol}', position)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with tradeapi.AsyncTradingRest(
+                    'key-id', 'secret-key', f'http://127.0.0.1:{port}',
+                    retry_policy=RetryPolicy(base=0, jitter=False)) as api:
+                c = await api.get_clock()
+                assert isinstance(c, Clock) and c.is_open
+                assert attempts['clock'] == 2
+
+                order = await api.submit_order('AAPL', qty=1,
+                                               limit_price=1.5,
+                                               type='limit')
+                assert isinstance(order, Order) and order.id == 'o1'
+                assert float(seen[-1]['limit_price']) == 1.5
+
+                listed = await api.list_orders(status='all', nested=True,
+                                               symbols=['AAPL', 'MSFT'])
+                assert [o.id for o in listed] == ['o1']
+                assert seen[-1] == ('GET', {'status': 'all',
+                                            'nested': 'True',
+                                            'symbols': 'AAPL,MSFT'},
+                                    'key-id')
+                assert await api.cancel_all_orders() is None
+
+                p = await api.get_position('AAPL')
+                assert isinstance(p, Position) and p.qty == '10'
+                with pytest.raises(APIError) as err:
+                    await api.get_position('NOPE')
+                assert err.value.status_code == 404
+                assert err.value.code == 40410000
+
+                # concurrent calls share the session
+                results = await asyncio.gather(
+                    *[api.get_position('AAPL') for _ in range(10)])
+                assert len(results) == 10
+                assert api._session is not None
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def test_bulk_orders(reqmock):
+    import json
+    import threading
+    from alpaca_trade_api.entity import Order
+
+    class CountingLimiter(object):
+        def __init__(self):
+            self.calls = 0
+            self._lock = threading.Lock()
+
+        def acquire(self, tokens=1):
+            with self._lock:
+                self.calls += 1
+
+    limiter = CountingLimiter()
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2',
+                        rate_limiter=limiter)
+    placed = {}
+    lock = threading.Lock()
+
+    def submit(request, context):
+        body = json.loads(request.body)
+        cid = body['client_order_id']
+        if body['symbol'] == 'BAD':
+            context.status_code = 403
+            return {'code': 40310000, 'message': 'insufficient buying power'}
+        with lock:
+            if cid in placed:
+                context.status_code = 422
+                return {'code': 42210000,
+                        'message': 'client_order_id must be unique'}
+            placed[cid] = dict(body, id='id-' + body['symbol'])
+            return placed[cid]
+
+    def by_client_order_id(request, context):
+        return placed[request.qs['client_order_id'][0]]
+
+    reqmock.post('https://api.alpaca.markets/v2/orders', json=submit)
+    reqmock.get('https://api.alpaca.markets/v2/orders:by_client_order_id',
+                json=by_client_order_id)
+
+    specs = [{'symbol': sym, 'qty': 1, 'side': 'buy'}
+             for sym in ('AAPL', 'BAD', 'MSFT', 'TSLA')]
+    results = api.submit_orders(specs, concurrency=3,
+                                batch_id='rebalance-1')
+    assert [type(r) for r in results] == [Order, APIError, Order, Order]
+    assert [r.symbol for r in results if isinstance(r, Order)] == [
+        'AAPL', 'MSFT', 'TSLA']
+    assert results[1].status_code == 403
+    assert 'client_order_id' not in specs[0]
+    assert limiter.calls == 4
+
+    # retrying the batch does not place anything twice
+    again = api.submit_orders(specs, concurrency=3,
+                              batch_id='rebalance-1')
+    assert len(placed) == 3
+    assert [r.client_order_id for r in again if isinstance(r, Order)] == \
+        [r.client_order_id for r in results if isinstance(r, Order)]
+    assert isinstance(again[1], APIError)
+    # a different batch gets new ids
+    other = api.submit_orders(specs[:1], batch_id='rebalance-2')
+    assert other[0].client_order_id != results[0].client_order_id
+    assert len(placed) == 4
+    # without a batch_id, repeating a basket places it again
+    first = api.submit_orders(specs[:1])
+    second = api.submit_orders(specs[:1])
+    assert first[0].client_order_id != second[0].client_order_id
+    assert len(placed) == 6
+    # a bracket template reused by many specs is left as it was, so the
+    # retry of the batch derives the same ids
+    template = {'order_class': 'bracket',
+                'take_profit': {'limit_price': '160'},
+                'stop_loss': {'stop_price': '140'}}
+    brackets = [dict(template, symbol=sym, qty=1, side='buy')
+                for sym in ('AAPL', 'MSFT')]
+    results = api.submit_orders(brackets, batch_id='bracket-1')
+    assert results[0].take_profit == {'limit_price': 160.0}
+    assert template['take_profit'] == {'limit_price': '160'}
+    assert template['stop_loss'] == {'stop_price': '140'}
+    again = api.submit_orders(brackets, batch_id='bracket-1')
+    assert [r.client_order_id for r in again] == \
+        [r.client_order_id for r in results]
+    assert len(placed) == 8
+
+    reqmock.get('https://api.alpaca.markets/v2/orders',
+                json=[{'id': 'o3', 'symbol': 'TSLA'}])
+    reqmock.delete('https://api.alpaca.markets/v2/orders/o1', text='')
+    reqmock.delete('https://api.alpaca.markets/v2/orders/o3', text='')
+    reqmock.delete('https://api.alpaca.markets/v2/orders/o2',
+                   status_code=422, json={'code': 42210000,
+                                          'message': 'order is not open'})
+    cancelled = api.cancel_orders(['o1', 'o2', 'o1'], symbols=['TSLA'])
+    assert list(cancelled) == ['o1', 'o2', 'o3']
+    assert cancelled['o1'] is None and cancelled['o3'] is None
+    assert isinstance(cancelled['o2'], APIError)
+    assert reqmock.request_history[-4].qs['symbols'] == ['tsla']
+    assert api.cancel_orders([]) == {}
+
+
+def test_response_cache(reqmock, monkeypatch):
+    from alpaca_trade_api.cache import ResponseCache
+    now = [1000.0]
+    monkeypatch.setattr(tradeapi.cache.time, 'monotonic', lambda: now[0])
+    cache = ResponseCache(ttls={'/calendar': 0}, maxsize=3)
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2',
+                        response_cache=cache)
+    clock = reqmock.get('https://api.alpaca.markets/v2/clock',
+                        json={'timestamp': '2021-04-20T09:30:00-04:00',
+                              'is_open': True})
+    assets = reqmock.get('https://api.alpaca.markets/v2/assets',
+                         json=[{'symbol': 'AAPL'}])
+    watchlists = reqmock.get('https://api.alpaca.markets/v2/watchlists',
+                             json=[{'id': 'w1', 'name': 'tech'}])
+    reqmock.post('https://api.alpaca.markets/v2/watchlists/w1',
+                 json={'id': 'w1', 'name': 'tech'})
+    calendar = reqmock.get('https://api.alpaca.markets/v2/calendar',
+                           json=[])
+
+    assert api.get_clock().is_open
+    assert api.get_clock().is_open
+    assert clock.call_count == 1
+    now[0] += 16  # past the clock ttl
+    api.get_clock()
+    assert clock.call_count == 2
+
+    api.list_assets(status='active')
+    api.list_assets(status='active')
+    api.list_assets()
+    assert assets.call_count == 2
+    assert [a.symbol for a in api.list_assets()] == ['AAPL']
+    assert assets.call_count == 2
+
+    # uncached paths always go to the server
+    api.get_calendar()
+    api.get_calendar()
+    assert calendar.call_count == 2
+
+    api.get_watchlists()
+    api.get_watchlists()
+    assert watchlists.call_count == 1
+    api.add_to_watchlist('w1', 'AAPL')
+    api.get_watchlists()
+    assert watchlists.call_count == 2
+
+    stats = cache.stats()
+    assert stats['size'] <= 3 and stats['evictions'] >= 1
+    assert stats['hits'] == 4
+    cache.invalidate()
+    api.get_clock()
+    assert clock.call_count == 3
+
+
+def test_coalesce_gets(reqmock):
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2',
+                        coalesce=True)
+    gate = threading.Event()
+
+    def slow(request, context):
+        gate.wait(5)
+        return {'id': 'acct', 'cash': '100'}
+
+    account = reqmock.get('https://api.alpaca.markets/v2/account',
+                          json=slow)
+    reqmock.get('https://api.alpaca.markets/v2/orders',
+                json=lambda request, context: (gate.wait(5), [])[1])
+    with ThreadPoolExecutor(16) as pool:
+        futures = [pool.submit(api.get_account) for _ in range(16)]
+        # every thread but the leader joins the call in flight
+        deadline = time.monotonic() + 5
+        while (api._single_flight.shared < 15 and
+               time.monotonic() < deadline):
+            time.sleep(0.01)
+        gate.set()
+        results = [f.result() for f in futures]
+    assert account.call_count == 1
+    assert {r.cash for r in results} == {'100'}
+
+    # different parameters are different calls, and nothing is cached
+    gate.set()
+    api.list_orders(status='open')
+    api.list_orders(status='closed')
+    api.get_account()
+    assert account.call_count == 2
+
+    # errors reach every waiting caller
+    gate.clear()
+    reqmock.get('https://api.alpaca.markets/v2/clock', status_code=500,
+                json=lambda request, context: (gate.wait(5),
+                                               {'message': 'boom'})[1])
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(api.get_clock) for _ in range(4)]
+        time.sleep(0.1)
+        gate.set()
+        for f in futures:
+            with pytest.raises(APIError):
+                f.result()
+
+    # off by default
+    uncoalesced = tradeapi.REST('key-id', 'secret-key', api_version='v2')
+    assert uncoalesced._single_flight is None
+    uncoalesced.get_account()
+    assert account.call_count == 3
+
+
+def test_incremental_iterators(reqmock, tmpdir, caplog):
+    import pandas as pd
+    from alpaca_trade_api.cursor import SyncCursor
+
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2')
+    # pairs of orders share a submitted_at, so pages split ties
+    orders = [{'id': 'o{:02d}'.format(i), 'symbol': 'AAPL',
+               'submitted_at': '2021-03-16T18:38:{:02d}.5Z'.format(i // 2)}
+              for i in range(11)]
+
+    def list_orders(request, context):
+        after = pd.Timestamp(request.qs['after'][0]) \
+            if 'after' in request.qs else None
+        matching = [o for o in orders if after is None or
+                    pd.Timestamp(o['submitted_at']) > after]
+        return matching[:int(request.qs['limit'][0])]
+
+    reqmock.get('https://api.alpaca.markets/v2/orders', json=list_orders)
+    cursor = SyncCursor(str(tmpdir.join('sync.json')))
+    got = [o.id for o in api.list_orders_iter(page_size=3, cursor=cursor)]
+    assert got == [o['id'] for o in orders]
+    assert reqmock.request_history[0].qs['status'] == ['all']
+
+    # the next run only sees orders submitted since
+    orders.append({'id': 'o11', 'symbol': 'AAPL',
+                   'submitted_at': '2021-03-16T18:38:05.5Z'})
+    cursor = SyncCursor(str(tmpdir.join('sync.json')))
+    got = [o.id for o in api.list_orders_iter(page_size=3, cursor=cursor)]
+    assert got == ['o11']
+    assert list(api.list_orders_iter(page_size=3, cursor=cursor)) == []
+
+    # a page filled with orders of one timestamp cannot be paged past
+    got = [o.id for o in api.list_orders_iter(page_size=1)]
+    assert got == ['o00']
+    assert 'more than 1 orders submitted at 2021-03-16T18:38:00.5Z' in \
+        caplog.text
+
+    activities = [{'id': '20210301000000000::{:03d}'.format(i),
+                   'activity_type': 'FILL', 'symbol': 'AAPL'}
+                  for i in range(7)]
+
+    def list_activities(request, context):
+        token = request.qs.get('page_token', [''])[0]
+        matching = [a for a in activities if a['id'] > token]
+        return matching[:int(request.qs['page_size'][0])]
+
+    reqmock.get('https://api.alpaca.markets/v2/account/activities/FILL',
+                json=list_activities)
+    got = [a.id for a in api.get_activities_iter(
+        'FILL', page_size=3, cursor=cursor)]
+    assert got == [a['id'] for a in activities]
+    assert cursor.get('activities') == activities[-1]['id']
+    activities.append({'id': '20210302000000000::000',
+                       'activity_type': 'FILL', 'symbol': 'AAPL'})
+    got = [a.id for a in api.get_activities_iter(
+        'FILL', page_size=3, cursor=cursor)]
+    assert got == ['20210302000000000::000']
+    with pytest.raises(ValueError):
+        next(api.get_activities_iter(direction='desc', cursor=cursor))
+
+
+def test_request_hooks(reqmock):
+    from alpaca_trade_api.hooks import (
+        AFTER_RESPONSE, BEFORE_SEND, ON_ERROR, ON_RETRY, MetricsCollector,
+        endpoint,
+    )
+    from alpaca_trade_api.retry import RetryPolicy
+
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2',
+                        retry_policy=RetryPolicy(base=0, jitter=False))
+    assert api._hooks is None
+    events = []
+    for name in (BEFORE_SEND, AFTER_RESPONSE, ON_RETRY, ON_ERROR):
+        api.hooks.add(name, lambda e, name=name: events.append(
+            (name, e.attempt, e.status)))
+    metrics = MetricsCollector().register(api.hooks)
+
+    order_id = '904837e3-3b76-47ec-b432-046db621571b'
+    reqmock.get('https://api.alpaca.markets/v2/orders/' + order_id, [
+        {'status_code': 429, 'json': {'code': 42910000, 'message': 'slow'}},
+        {'json': {'id': order_id}},
+    ])
+    reqmock.get('https://api.alpaca.markets/v2/positions/AAPL',
+                status_code=404,
+                json={'code': 40410000, 'message': 'position not found'})
+    assert api.get_order(order_id).id == order_id
+    with pytest.raises(APIError):
+        api.get_position('AAPL')
+
+    assert events == [
+        (BEFORE_SEND, 0, None), (AFTER_RESPONSE, 0, 429), (ON_RETRY, 0, 429),
+        (BEFORE_SEND, 1, None), (AFTER_RESPONSE, 1, 200),
+        (BEFORE_SEND, 0, None), (AFTER_RESPONSE, 0, 404), (ON_ERROR, 0, 404),
+    ]
+    assert endpoint('https://data.alpaca.markets/v2/stocks/AAPL/bars') == \
+        '/v2/stocks/{symbol}/bars'
+    snapshot = metrics.snapshot()
+    orders = snapshot['GET /v2/orders/{id}']
+    assert orders['statuses'] == {429: 1, 200: 1}
+    assert orders['retries'] == 1 and orders['errors'] == 0
+    assert orders['bytes_received'] > 0
+    assert orders['latency']['count'] == 2
+    assert orders['latency']['buckets'][float('inf')] == 2
+    assert snapshot['GET /v2/positions/{id}']['errors'] == 1
+
+    text = metrics.to_prometheus()
+    assert '# TYPE apca_request_duration_seconds histogram' in text
+    assert 'apca_requests_total{method="GET",endpoint="/v2/orders/{id}",' \
+        'status="429"} 1' in text
+    assert 'apca_request_duration_seconds_bucket{method="GET",' \
+        'endpoint="/v2/orders/{id}",le="+Inf"} 2' in text
+
+    # served on the local host only, unless asked otherwise
+    import urllib.request
+    from alpaca_trade_api.hooks import serve_metrics
+    server = serve_metrics(metrics, port=0)
+    try:
+        host, port = server.server_address[:2]
+        assert host == '127.0.0.1'
+        url = 'http://127.0.0.1:{}/metrics'.format(port)
+        with urllib.request.urlopen(url, timeout=5) as resp:
+            assert resp.read().decode() == metrics.to_prometheus()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_symbol_chunks(reqmock):
+    from alpaca_trade_api.rest import SYMBOLS_MAX_CHARS, _symbol_chunks
+
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2')
+    symbols = ['S{:04d}'.format(i) for i in range(2000)]
+    chunks = _symbol_chunks(symbols)
+    assert len(chunks) > 1
+    assert all(len(c) <= SYMBOLS_MAX_CHARS for c in chunks)
+    assert ','.join(chunks).split(',') == symbols
+    assert _symbol_chunks([]) == ['']
+
+    def quotes(request, context):
+        requested = request.qs['symbols'][0].upper().split(',')
+        return {'quotes': {s: {'t': '2021-05-03T14:48:07Z', 'ap': 1.0,
+                               'bp': 0.9} for s in requested}}
+
+    reqmock.get('https://data.alpaca.markets/v2/stocks/quotes/latest',
+                json=quotes)
+    latest = api.get_latest_quotes(symbols + symbols[:10])
+    assert sorted(latest) == symbols
+    assert latest['S1999'].ask_price == 1.0
+    assert reqmock.call_count == len(chunks)
+
+    reqmock.get('https://data.alpaca.markets/v2/stocks/snapshots',
+                json=lambda request, context: {
+                    s.upper(): None
+                    for s in request.qs['symbols'][0].split(',')})
+    assert api.get_snapshots(['AAPL', 'MSFT']) == {'AAPL': None,
+                                                   'MSFT': None}
+
+
+def test_parquet_export(reqmock, tmpdir):
+    import pandas as pd
+    pq = pytest.importorskip('pyarrow.parquet')
+    from alpaca_trade_api.export import DataExporter
+
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2')
+    trades = [{'t': '2021-06-0{}T1{}:30:00.5Z'.format(day, i), 'x': 'V',
+               'p': 100.0 + i, 's': 10 * i, 'c': ['@'], 'i': day * 10 + i,
+               'z': 'C'} for day in (1, 2) for i in range(3)]
+    broken = {'page': '4'}
+
+    def pages(request, context):
+        start = pd.Timestamp(request.qs['start'][0], tz='UTC')
+        end = pd.Timestamp(request.qs['end'][0], tz='UTC')
+        matching = [t for t in trades
+                    if start <= pd.Timestamp(t['t']) <= end]
+        offset = int(request.qs.get('page_token', ['0'])[0])
+        if request.qs.get('page_token') == [broken['page']]:
+            context.status_code = 500
+            return {'message': 'internal error'}
+        more = offset + 2 < len(matching)
+        return {'trades': matching[offset:offset + 2], 'symbol': 'AAPL',
+                'next_page_token': str(offset + 2) if more else None}
+
+    reqmock.get('https://data.alpaca.markets/v2/stocks/AAPL/trades',
+                json=pages)
+    exporter = DataExporter(api, str(tmpdir), row_group_size=2)
+    with pytest.raises(APIError):
+        exporter.export('trades', 'AAPL', '2021-06-01', '2021-06-03')
+    symbol_dir = tmpdir.join('trades', 'symbol=AAPL')
+    assert symbol_dir.join('date=2021-06-01', 'data.parquet').exists()
+    assert not symbol_dir.join('date=2021-06-02').listdir()
+
+    # the run resumes at the first incomplete date
+    broken['page'] = None
+    exporter = DataExporter(api, str(tmpdir), row_group_size=2)
+    assert exporter.export('trades', ['AAPL'], '2021-06-01',
+                           '2021-06-03') == {'AAPL': 3}
+    assert reqmock.last_request.qs['start'] == ['2021-06-02t00:00:00+00:00']
+    day1 = pq.ParquetFile(str(symbol_dir.join('date=2021-06-01',
+                                              'data.parquet')))
+    assert day1.metadata.num_row_groups == 2
+    table = pq.read_table(str(symbol_dir.join('date=2021-06-02',
+                                              'data.parquet')))
+    assert table.column_names[:3] == ['timestamp', 'exchange', 'price']
+    assert table.column('id').to_pylist() == [20, 21, 22]
+    assert table.column('conditions').to_pylist()[0] == ['@']
+    assert exporter.export('trades', 'AAPL', '2021-06-01',
+                           '2021-06-03') == {'AAPL': 0}
+
+    # extending an export that ended mid-day rewrites that whole date
+    exporter = DataExporter(api, str(tmpdir.join('extended')))
+    assert exporter.export('trades', 'AAPL', '2021-06-01',
+                           '2021-06-02T11:00:00Z') == {'AAPL': 4}
+    assert exporter.export('trades', 'AAPL', '2021-06-01',
+                           '2021-06-03') == {'AAPL': 3}
+    assert reqmock.last_request.qs['start'] == ['2021-06-02t00:00:00+00:00']
+    table = pq.read_table(str(tmpdir.join(
+        'extended', 'trades', 'symbol=AAPL', 'date=2021-06-02',
+        'data.parquet')))
+    assert table.column('id').to_pylist() == [20, 21, 22]
+
+    # another feed is another dataset, not a finished one
+    assert exporter.export('trades', 'AAPL', '2021-06-01', '2021-06-03',
+                           feed='iex') == {'AAPL': 6}
+    assert reqmock.last_request.qs['feed'] == ['iex']
+    assert tmpdir.join('extended', 'trades', 'feed=iex', 'symbol=AAPL',
+                       'date=2021-06-02', 'data.parquet').exists()
+
+
+def test_compact_dtypes():
+    import numpy as np
+    from alpaca_trade_api.columnar import memory_report
+    from alpaca_trade_api.entity_v2 import BarsV2, QuotesV2
+
+    quotes = QuotesV2([{
+        't': '2021-06-01T13:30:00.{:06d}Z'.format(i),
+        'S': ('AAPL', 'MSFT', 'TSLA')[i % 3], 'ax': 'V', 'ap': 124.62 + i,
+        'as': 3, 'bx': 'Q', 'bp': 124.6, 'bs': 1,
+        'c': ['R'] if i % 2 else ['R', 'Y'], 'z': 'C',
+    } for i in range(1000)])
+    df = quotes.df
+    compact = quotes.compact_df()
+    assert compact.index.equals(df.index)
+    assert compact['symbol'].dtype == 'category'
+    assert compact['ask_exchange'].dtype == 'category'
+    assert compact['ask_price'].dtype == np.float32
+    assert compact['bid_size'].dtype == np.int32
+    assert list(compact['conditions'][:2]) == ['R,Y', 'R']
+    assert np.allclose(compact['ask_price'], df['ask_price'], atol=5e-5)
+    report = memory_report(df, compact)
+    assert report.loc['total', 'ratio'] > 2
+
+    # float32 would round these prices, they stay float64
+    bars = BarsV2([{'t': '2021-06-01T13:30:00Z', 'o': 412345.67,
+                    'h': 412345.67, 'l': 412345.67, 'c': 412345.67,
+                    'v': 2 ** 40, 'n': 1, 'vw': 412345.67}])
+    compact = bars.compact_df()
+    assert compact['open'].dtype == np.float64
+    assert compact['volume'].dtype == np.int64
+    assert compact['trade_count'].dtype == np.int32
+
+
+def test_bars_panel(reqmock):
+    import numpy as np
+
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2')
+
+    def bar(minute, price):
+        return {'t': '2021-06-01T13:3{}:00Z'.format(minute), 'o': price,
+                'h': price + 1, 'l': price - 1, 'c': price + 0.5, 'v': 100,
+                'n': 5, 'vw': price}
+
+    reqmock.get('https://data.alpaca.markets/v2/stocks/bars', [
+        {'json': {'bars': {'AAPL': [bar(0, 10), bar(1, 11)],
+                           'MSFT': [bar(1, 20)]},
+                  'next_page_token': 'p2'}},
+        {'json': {'bars': {'AAPL': [bar(3, 13)],
+                           'MSFT': [bar(2, 22), bar(3, 23)]},
+                  'next_page_token': None}},
+    ])
+    panel = api.get_bars_panel(['MSFT', 'aapl', 'TSLA'], '1Min',
+                               '2021-06-01', '2021-06-02')
+    assert panel.values.shape == (3, 4, 7)
+    assert panel.values.flags['C_CONTIGUOUS']
+    assert panel.symbols == ['MSFT', 'AAPL', 'TSLA']
+    assert list(panel.index.minute) == [30, 31, 32, 33]
+    close = panel['close']
+    assert close['AAPL'].tolist()[:2] == [10.5, 11.5]
+    assert np.isnan(close['AAPL'].iloc[2]) and np.isnan(close['MSFT'].iloc[0])
+    assert np.isnan(close['TSLA']).all()
+    assert panel.df.loc[('MSFT', panel.index[3]), 'open'] == 23
+
+    # cross-sectional change over the window in one operation
+    change = panel.change()
+    assert change['AAPL'] == (13.5 - 10) / 10
+    assert change['MSFT'] == (23.5 - 20) / 20
+    assert np.isnan(change['TSLA'])
+
+    from alpaca_trade_api.panel import BarPanel
+    pages = [[dict(bar(0, 10), S='AAPL'), dict(bar(2, 12), S='AAPL'),
+              dict(bar(1, 21), S='MSFT'), dict(bar(2, 22), S='MSFT')]]
+    filled = BarPanel.from_pages(pages, fill='ffill')
+    assert filled.symbols == ['AAPL', 'MSFT']
+    aapl = filled.values[0]
+    assert aapl[1].tolist() == [10.5, 10.5, 10.5, 10.5, 0, 0, 10.5]
+    assert np.isnan(filled.values[1, 0]).all()
+    dropped = BarPanel.from_pages(pages, fill='drop')
+    assert list(dropped.index.minute) == [32]
+    with pytest.raises(ValueError):
+        BarPanel.from_pages(pages, fill='bfill')
+
+
+def test_resampler():
+    import numpy as np
+    import pandas as pd
+    from alpaca_trade_api.resample import Resampler
+    from alpaca_trade_api.rest import TimeFrame, TimeFrameUnit
+
+    index = pd.date_range('2021-11-26 08:00', '2021-11-26 16:59', freq='min',
+                          tz='America/New_York').tz_convert('UTC')
+    n = len(index)
+    minutes = pd.DataFrame({
+        'open': np.arange(n) + 1.0, 'high': np.arange(n) + 2.0,
+        'low': np.arange(n) + 0.5, 'close': np.arange(n) + 1.5,
+        'volume': np.full(n, 10), 'trade_count': np.ones(n, dtype=int),
+        'vwap': np.arange(n) + 1.0,
+    }, index=index.rename('timestamp'))
+    minutes = pd.concat([minutes.assign(symbol='AAPL'),
+                         minutes.assign(symbol='MSFT')])
+
+    bars = Resampler(TimeFrame(2, TimeFrameUnit.Hour)).resample(minutes)
+    aapl = bars[bars['symbol'] == 'AAPL']
+    local = aapl.index.tz_convert('America/New_York')
+    assert [t.strftime('%H:%M') for t in local] == [
+        '09:30', '11:30', '13:30', '15:30']
+    first = aapl.iloc[0]
+    assert first['open'] == 91 and first['close'] == 210.5
+    assert first['high'] == 211 and first['low'] == 90.5
+    assert first['volume'] == 1200 and first['trade_count'] == 120
+    assert first['vwap'] == np.mean(np.arange(90, 210) + 1.0)
+    assert aapl.iloc[-1]['volume'] == 300
+    assert (bars[bars['symbol'] == 'MSFT'].index == aapl.index).all()
+
+    # the day after thanksgiving the market closes at 13:00
+    calendar = [{'date': '2021-11-26', 'open': '09:30', 'close': '13:00',
+                 'session_open': '0400', 'session_close': '1700'}]
+    session = Resampler(TimeFrame.Day, calendar=calendar).resample(minutes)
+    assert len(session) == 2
+    assert session.iloc[0]['volume'] == 210 * 10
+    extended = Resampler(TimeFrame.Day, calendar=calendar,
+                         extended_hours=True).resample(minutes)
+    assert extended.iloc[0]['volume'] == 540 * 10
+
+    # fed minute by minute, the same bars come out once complete
+    resampler = Resampler(9)
+    parts = [resampler.update(minutes.iloc[i:i + 37])
+             for i in range(0, len(minutes), 37)]
+    assert len(parts[0]) == 0
+    parts.append(resampler.flush())
+    pd.testing.assert_frame_equal(pd.concat(parts).sort_values(
+        ['symbol', 'timestamp']), Resampler(9).resample(minutes))
+
+
+def test_indicators():
+    import numpy as np
+    import pandas as pd
+    from alpaca_trade_api import indicators
+
+    rng = np.random.default_rng(7)
+    shape = (40, 600)
+    close = 100 + rng.standard_normal(shape).cumsum(axis=1)
+    high = close + rng.random(shape)
+    low = close - rng.random(shape)
+    volume = rng.integers(0, 1000, shape).astype(float)
+    close[3, :20] = np.nan    # listed later
+    close[1, 100] = np.nan    # a gap in a series of the scalar path
+    for field in (close, high, low, volume):
+        field[5, 300:305] = np.nan    # missing bars, as BarPanel fills them
+    index = pd.date_range('2021-06-07 22:00', periods=shape[1], freq='min',
+                          tz='UTC')
+    sessions = indicators.session_ids(index)
+    assert len(np.unique(sessions)) == 2
+
+    cases = [
+        (lambda r: indicators.ema(close[r], 9), lambda: indicators.EMA(9),
+         lambda i, t: (close[i, t],)),
+        (lambda r: indicators.sma(close[r], 9), lambda: indicators.SMA(9),
+         lambda i, t: (close[i, t],)),
+        (lambda r: indicators.rsi(close[r], 14), lambda: indicators.RSI(14),
+         lambda i, t: (close[i, t],)),
+        (lambda r: indicators.atr(high[r], low[r], close[r], 14),
+         lambda: indicators.ATR(14),
+         lambda i, t: (high[i, t], low[i, t], close[i, t])),
+        (lambda r: indicators.vwap(high[r], low[r], close[r], volume[r],
+                                   sessions),
+         lambda: indicators.VWAP(),
+         lambda i, t: (high[i, t], low[i, t], close[i, t], volume[i, t],
+                       sessions[t])),
+    ]
+    for indicator, state, args in cases:
+        # a few series take the scalar path, many the vectorised one
+        for rows in (range(4), range(shape[0])):
+            batch = indicator(slice(rows.start, rows.stop))
+            assert batch.shape == (len(rows), shape[1])
+            streamed = []
+            for i in rows:
+                s = state()
+                streamed.append([s.update(*args(i, t))
+                                 for t in range(shape[1])])
+            assert np.array_equal(batch, np.array(streamed), equal_nan=True)
+            # gaps do not spread past themselves
+            assert not np.isnan(batch[:, 40:]).any()
+
+    ema = indicators.ema(close, 9)
+    assert np.isnan(ema[3, :20]).all() and ema[3, 20] == close[3, 20]
+    assert ema[0, 1] == close[0, 0] * 0.8 + close[0, 1] * 0.2
+    sma = indicators.sma(close[0], 9)
+    assert np.isnan(sma[:8]).all()
+    assert np.isclose(sma[8], close[0, :9].mean())
+    # the average of a series listed later starts n values after its first
+    sma = indicators.sma(close, 9)
+    assert np.isnan(sma[3, :28]).all()
+    assert np.isclose(sma[3, 28], close[3, 20:29].mean())
+    assert np.isclose(sma[3, 40], close[3, 32:41].mean())
+    assert np.array_equal(indicators.sma([np.nan, 1, 2, 3], 2),
+                          [np.nan, np.nan, 1.5, 2.5], equal_nan=True)
+    # a gap is skipped: the output carries over it, the state continues
+    ema = indicators.ema(close, 9)
+    assert (ema[5, 300:305] == ema[5, 299]).all()
+    assert np.isclose(ema[5, 305], ema[5, 299] * 0.8 + close[5, 305] * 0.2)
+    assert ema[1, 100] == ema[1, 99]
+    seen = close[5, :311][~np.isnan(close[5, :311])]
+    assert np.isclose(sma[5, 310], seen[-9:].mean())
+    assert np.array_equal(indicators.sma([1, np.nan, 3, np.nan], 2),
+                          [np.nan, np.nan, 2, 2], equal_nan=True)
+
+    # Wilder's smoothing seeded with the average of the first n values
+    def wilder(values, n):
+        average = np.mean(values[:n])
+        result = [average]
+        for value in values[n:]:
+            average = (average * (n - 1) + value) / n
+            result.append(average)
+        return np.array(result)
+
+    change = np.diff(close[0])
+    gain = wilder(np.maximum(change, 0), 14)
+    loss = wilder(np.maximum(-change, 0), 14)
+    rsi = indicators.rsi(close[0], 14)
+    assert np.isnan(rsi[:14]).all()
+    assert np.allclose(rsi[14:], 100 - 100 / (1 + gain / loss))
+    previous = close[0, :-1]
+    true_range = np.maximum.reduce([high[0, 1:] - low[0, 1:],
+                                    np.abs(high[0, 1:] - previous),
+                                    np.abs(low[0, 1:] - previous)])
+    atr = indicators.atr(high[0], low[0], close[0], 14)
+    assert np.isnan(atr[:14]).all()
+    assert np.allclose(atr[14:], wilder(true_range, 14))
+    assert indicators.rsi(np.full(20, 5.0))[-1] == 50
+    assert indicators.rsi(np.arange(20.0))[-1] == 100
+
+
+def test_thread_safe_rest(reqmock):
+    import json
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    api = tradeapi.REST('key-id', 'secret-key', api_version='v2',
+                        thread_safe=True)
+    symbols = ['S{:02d}'.format(i) for i in range(16)]
+
+    def bars(request, context):
+        symbol = request.path.split('/')[3].upper()
+        token = request.qs.get('page_token', [None])[0]
+        if token is None:
+            return {'bars': [{'t': '2021-06-01T13:30:00Z', 'o': 1.0,
+                              'h': 1.0, 'l': 1.0, 'c': 1.0, 'v': 1}],
+                    'symbol': symbol, 'next_page_token': symbol + '-2'}
+        # the second page must be asked for with the first page's token
+        assert token.upper() == symbol + '-2'
+        return {'bars': [{'t': '2021-06-01T13:31:00Z', 'o': 2.0, 'h': 2.0,
+                          'l': 2.0, 'c': 2.0, 'v': 2}],
+                'symbol': symbol, 'next_page_token': None}
+
+    def order(request, context):
+        body = json.loads(request.body)
+        return dict(body, id='id-' + body['client_order_id'])
+
+    reqmock.get(requests_mock.ANY, json=bars)
+    reqmock.post('https://api.alpaca.markets/v2/orders', json=order)
+    reqmock.get('https://api.alpaca.markets/v2/account',
+                json={'id': 'acct', 'cash': '100'})
+    reqmock.get('https://api.alpaca.markets/v2/positions', json=[])
+
+    barrier = threading.Barrier(64)
+    sessions = [None] * 64
+    # one bracket spec shared by every thread
+    take_profit = {'limit_price': '160'}
+    stop_loss = {'stop_price': '140', 'limit_price': '139.5'}
+
+    def work(i):
+        barrier.wait()
+        sessions[i] = api._thread_session()
+        symbol = symbols[i % len(symbols)]
+        params = {'start': '2021-06-01', 'end': '2021-06-02'}
+        pages = list(api._data_get_pages('bars', symbol, timeframe='1Min',
+                                         **params))
+        assert params == {'start': '2021-06-01', 'end': '2021-06-02'}
+        assert [bar['o'] for page in pages for bar in page] == [1.0, 2.0]
+        placed = api.submit_order(symbol, 1, 'buy',
+                                  client_order_id='c{}'.format(i),
+                                  order_class='bracket',
+                                  take_profit=take_profit,
+                                  stop_loss=stop_loss)
+        assert placed.id == 'id-c{}'.format(i)
+        assert placed.take_profit == {'limit_price': 160.0}
+        assert placed.stop_loss == {'stop_price': 140.0,
+                                    'limit_price': 139.5}
+        assert api.get_account().cash == '100'
+        assert api.list_positions() == []
+        return i
+
+    with ThreadPoolExecutor(64) as pool:
+        assert list(pool.map(work, range(64))) == list(range(64))
+    assert len(set(map(id, sessions))) == 64
+    assert take_profit == {'limit_price': '160'}
+    assert stop_loss == {'stop_price': '140', 'limit_price': '139.5'}
+    adapters = {s.get_adapter('https://api.alpaca.markets')
+                for s in sessions}
+    assert adapters == {api._adapter}
+
+    # data_get leaves the caller's params alone
+    params = {'limit': 1}
+    api.data_get('/stocks/S00/bars', params, feed='iex', api_version='v2')
+    assert params == {'limit': 1}
+    assert reqmock.last_request.qs['feed'] == ['iex']
+
+    shared = tradeapi.REST('key-id', 'secret-key')
+    with ThreadPoolExecutor(2) as pool:
+        assert set(pool.map(lambda _: shared._thread_session(),
+                            range(4))) == {shared._session}
+
+
+def test_broker_simulator():
+    import pandas as pd
+    from alpaca_trade_api.entity import Order, Position
+    from alpaca_trade_api.simulator import BrokerSimulator
+
+    sim = BrokerSimulator(cash=10000, shorting=False)
+    api = sim.rest()
+    updates = []
+
+    async def on_update(update):
+        order = update.order
+        updates.append((update.event, order['type'], order['status']))
+
+    sim.subscribe_trade_updates(on_update)
+
+    index = pd.date_range('2021-06-01 13:30', periods=4, freq='min',
+                          tz='UTC', name='timestamp')
+    bars = pd.DataFrame({'open': [100.0, 100.5, 101.0, 104.0],
+                         'high': [101.0, 102.0, 106.0, 104.0],
+                         'low': [99.0, 100.0, 100.0, 103.0],
+                         'close': [100.0, 101.0, 105.0, 103.5],
+                         'symbol': 'AAPL'}, index=index)
+    placed = []
+
+    def strategy(t, rows):
+        if not placed:
+            placed.append(api.submit_order(
+                'AAPL', 10, 'buy', order_class='bracket',
+                take_profit={'limit_price': 105},
+                stop_loss={'stop_price': 95}))
+
+    sim.replay(bars, on_time=strategy)
+    order = api.get_order(placed[0].id, nested=True)
+    assert isinstance(order, Order)
+    # the entry fills at the open of the bar after it was placed, the take
+    # profit on the bar reaching it and the stop is canceled with it
+    assert order.status == 'filled' and order.filled_avg_price == '100.5'
+    assert [leg.status for leg in order.legs] == ['filled', 'canceled']
+    assert order.legs[0].filled_avg_price == '105'
+    assert updates == [('new', 'market', 'new'),
+                       ('fill', 'market', 'filled'),
+                       ('new', 'limit', 'new'), ('new', 'stop', 'new'),
+                       ('fill', 'limit', 'filled'),
+                       ('canceled', 'stop', 'canceled')]
+    assert api.list_positions() == []
+    assert float(api.get_account().cash) == 10000 - 1005 + 1050
+    assert len(api.list_orders(status='all')) == 3
+    assert len(api.list_orders(status='all', nested=True)) == 1
+    assert api.get_order_by_client_order_id(
+        order.client_order_id).id == order.id
+
+    # quotes fill marketable orders at once, at the ask or the bid
+    sim.on_quote('MSFT', {'t': '2021-06-01T13:34:00Z', 'bp': 250.0,
+                          'ap': 250.1})
+    bought = api.submit_order('MSFT', 4, 'buy')
+    assert bought.status == 'filled' and bought.filled_avg_price == '250.1'
+    position = api.get_position('MSFT')
+    assert isinstance(position, Position) and position.qty == '4'
+
+    # an oco pair: the stop is taken when a quote crosses it
+    oco = api.submit_order('MSFT', 4, 'sell', 'limit', 'gtc',
+                           order_class='oco',
+                           take_profit={'limit_price': 260},
+                           stop_loss={'stop_price': 245})
+    assert oco.status == 'new' and oco.legs[0].type == 'stop'
+    sim.on_quote('MSFT', {'t': '2021-06-01T13:35:00Z', 'bp': 244.0,
+                          'ap': 244.2})
+    oco = api.get_order(oco.id, nested=True)
+    assert oco.status == 'canceled' and oco.legs[0].status == 'filled'
+    assert oco.legs[0].filled_avg_price == '244'
+
+    # rejections are APIErrors with the status of the trading api
+    with pytest.raises(APIError) as e:
+        api.submit_order('AAPL', 1000, 'buy', 'limit', limit_price=100)
+    assert e.value.status_code == 403
+    with pytest.raises(APIError) as e:
+        api.submit_order('AAPL', 1, 'sell')    # shorting is off
+    assert e.value.status_code == 403
+    with pytest.raises(APIError) as e:
+        api.submit_order('AAPL', 1, 'buy', 'limit')
+    assert e.value.status_code == 422
+    with pytest.raises(APIError) as e:
+        api.cancel_order(order.id)
+    assert e.value.status_code == 422
+    with pytest.raises(APIError) as e:
+        api.get_position('TSLA')
+    assert e.value.status_code == 404
+
+    # day orders expire with the session, gtc orders stay
+    day = api.submit_order('AAPL', 1, 'buy', 'limit', limit_price=90)
+    gtc = api.submit_order('AAPL', 1, 'buy', 'limit', 'gtc', limit_price=90)
+    replaced = api.replace_order(gtc.id, limit_price='91')
+    assert replaced.replaces == gtc.id
+    assert api.get_order(gtc.id).status == 'replaced'
+    assert {o.id for o in api.list_orders()} == {day.id, replaced.id}
+    # a replacement the account cannot afford is rejected, the original
+    # keeps working
+    with pytest.raises(APIError) as e:
+        api.replace_order(replaced.id, qty='1000')
+    assert e.value.status_code == 403
+    assert api.get_order(replaced.id).status == 'new'
+    assert {o.id for o in api.list_orders()} == {day.id, replaced.id}
+    sim.on_bar('AAPL', {'t': '2021-06-02T13:30:00Z', 'o': 100, 'h': 100,
+                        'l': 90.5, 'c': 95})
+    assert api.get_order(day.id).status == 'expired'
+    assert api.get_order(replaced.id).status == 'filled'
+    assert api.get_order(replaced.id).filled_avg_price == '91'
+    assert api.get_clock().is_open
+    api.cancel_all_orders()
+    assert api.list_orders() == []
+
+
+def test_standin_server(monkeypatch):
+    import asyncio
+    import pandas as pd
+    from alpaca_trade_api.standin import StandInServer
+    from alpaca_trade_api.stream import DataStream, TradingStream
+
+    with StandInServer(items=2500, max_messages=250, batch_size=40,
+                       key_id='key', secret_key='secret') as server:
+        monkeypatch.setenv('APCA_API_DATA_URL', server.url)
+        api = tradeapi.REST('key', 'secret', base_url=server.url)
+
+        # three pages of 1000, in time order
+        trades = list(api._data_get('trades', 'AAPL', page_limit=1000,
+                                    start='2021-01-04T00:00:00Z'))
+        assert len(trades) == 2500
+        assert [t['i'] for t in trades] == list(range(1, 2501))
+        assert trades[1]['t'] == '2021-01-04T00:00:00.001000000Z'
+        # multi symbol pages are grouped by symbol and may span two
+        bars = list(api._data_get('bars', ['MSFT', 'AAPL'], timeframe='1Min',
+                                  start='2021-01-04', end='2021-01-04T01:00',
+                                  page_limit=50))
+        assert [b['S'] for b in bars] == ['AAPL'] * 60 + ['MSFT'] * 60
+        assert bars[1]['t'] == '2021-01-04T00:01:00.000000000Z'
+        # the same request gives the same data
+        assert bars == list(api._data_get(
+            'bars', ['MSFT', 'AAPL'], timeframe='1Min', start='2021-01-04',
+            end='2021-01-04T01:00'))
+        with pytest.raises(APIError) as e:
+            list(api._data_get('bars', 'AAPL', timeframe='1Fortnight'))
+        assert e.value.status_code == 422
+
+        received = []
+
+        async def run(stream, subscribe, count):
+            async def handler(msg):
+                received.append(msg)
+                if len(received) == count:
+                    await stream.stop_ws()
+            subscribe(handler)
+            await asyncio.wait_for(stream._run_forever(), 10)
+
+        data = DataStream('key', 'secret', server.url, raw_data=False,
+                          feed='iex')
+        asyncio.run(run(data, lambda h: (data.subscribe_trades(h, 'AAPL'),
+                                         data.subscribe_quotes(h, 'MSFT')),
+                        250))
+        assert {type(m).__name__ for m in received} == {'Trade', 'Quote'}
+        assert {m.symbol for m in received} == {'AAPL', 'MSFT'}
+        assert received[0].timestamp == pd.Timestamp('2021-01-04', tz='UTC')
+
+        del received[:]
+        trading = TradingStream('key', 'secret', server.url)
+        asyncio.run(run(trading, trading.subscribe_trade_updates, 2))
+        assert [u.event for u in received] == ['new', 'fill']
+        assert received[1].order['status'] == 'filled'
+
+        # wrong credentials are refused at the handshake
+        denied = DataStream('key', 'wrong', server.url, False)
+
+        async def start():
+            try:
+                await denied._start_ws()
+            finally:
+                await denied.close()
+        with pytest.raises(ValueError):
+            asyncio.run(start())